@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from skey_init import init_entry
+from credstore import SQLiteStore, CachedStore
+from passhash import VerifyPool, scheme_of
+
+# Учетные записи хранятся во внешнем хранилище (см. credstore.py). По
+# умолчанию это база SQLite DEFAULT_DB в текущем каталоге с LRU-кешем
+# паролей; другое хранилище можно подключить через set_backend()
+DEFAULT_DB = "accounts.db"
+
+# Демонстрационные учетные записи: ими заполняется новая пустая база.
+# Пароли остаются в открытом виде, чтобы для них работал CHAP; записи,
+# импортированные с хешированием (credstore.py --hash), доступны только по PAP
+users = {
+    "admin": "password123",
+    "user1": "securepass",
+    "test": "test123"
+}
+
+# S/KEY: seed, счетчик и последний принятый одноразовый пароль
+# MD5^(count + 1)(seed + secret). Для демонстрационных учетных записей
+# секретом служит пароль пользователя
+skey_db = {
+    "admin": init_entry("salt123", users["admin"], 1000),
+    "user1": init_entry("pepper456", users["user1"], 500),
+    "test": init_entry("sugar789", users["test"], 100)
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Пул проверки медленных хешей паролей (по процессу на ядро)
+_verifier = VerifyPool()
+
+def open_store(path=DEFAULT_DB, cache_size=None):
+    """Открывает базу учетных записей с кешем; пустую базу заполняет демо-записями"""
+    store = SQLiteStore(path)
+    if store.is_empty():
+        store.import_passwords(users.items())
+        store.import_skey(skey_db.items())
+    return CachedStore(store) if cache_size is None else CachedStore(store, cache_size)
+
+def set_backend(store):
+    """Подключает хранилище учетных записей; возвращает предыдущее"""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, store
+    return previous
+
+def get_backend():
+    """Текущее хранилище; при первом обращении открывается база по умолчанию"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = open_store()
+    return _backend
+
+def set_verifier(verifier):
+    """Подключает пул проверки хешей паролей; возвращает предыдущий"""
+    global _verifier
+    previous, _verifier = _verifier, verifier
+    return previous
+
+def get_verifier():
+    return _verifier
+
+def skey_get_count(username):
+    """Возвращает текущее значение счетчика S/KEY или None, если пользователя нет"""
+    entry = get_backend().skey_get(username)
+    return entry["count"] if entry is not None else None
+
+def skey_consume(username, count, otp):
+    """Проверяет пароль и атомарно уменьшает счетчик, если он все еще равен count
+
+    Если за время сетевого обмена этот же счетчик уже был израсходован
+    другим соединением или пароль неверен, возвращает False.
+    """
+    return get_backend().skey_consume(username, count, otp)
+
+def check_password(username, password):
+    """Проверка пароля для PAP
+
+    Хеш проверяется в пуле процессов, вызывающий поток ждет результата.
+    """
+    stored = get_backend().get_password(username)
+    return stored is not None and _verifier.verify(stored, password)
+
+def chap_response(username, challenge):
+    """Ожидаемый ответ CHAP MD5(challenge + password)
+
+    None, если пользователя нет или пароль хранится в виде хеша: CHAP
+    требует исходного пароля на стороне сервера.
+    """
+    stored = get_backend().get_password(username)
+    if stored is None or scheme_of(stored) is not None:
+        return None
+    return hashlib.md5(challenge + stored.encode()).digest()
@@ -0,0 +1,234 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import argparse
+import threading
+from array import array
+from contextlib import contextmanager
+from metrics import SKEY_LOCK_WAIT
+from credstore import skey_verify, read_password_rows
+from skey_init import load_db
+from passhash import add_hash_arguments, hash_from_arguments
+
+try:
+    import fcntl
+except ImportError:  # Windows: счетчики защищены только внутри процесса
+    fcntl = None
+
+# Компактная таблица учетных записей для больших баз. Файл отображается в
+# память (mmap), поэтому открывается за миллисекунды независимо от размера,
+# а страницы делят через кеш ОС все процессы сервера.
+#
+# Формат файла: заголовок, хеш-индекс из bucket_count 32-битных номеров
+# записей (номер + 1, 0 - пустая ячейка, открытая адресация с линейным
+# пробированием), затем записи фиксированной длины.
+
+MAGIC = b"AUTHTBL2"
+FILE_HEADER = struct.Struct("<8sIII")
+INDEX_ENTRY = struct.Struct("<I")
+
+# Поля записи: имя и пароль (или его хеш, см. passhash.py) в UTF-8 с
+# дополнением нулями, seed S/KEY, флаги, счетчик и последний принятый
+# одноразовый пароль
+MAX_USERNAME = 64
+MAX_PASSWORD = 128
+MAX_SEED = 32
+RECORD = struct.Struct(f"<{MAX_USERNAME}s{MAX_PASSWORD}s{MAX_SEED}sBxxxi16s")
+# Смещение изменяемой части записи (счетчик и последний пароль)
+COUNTER_OFFSET = MAX_USERNAME + MAX_PASSWORD + MAX_SEED + 4
+COUNTER = struct.Struct("<i16s")
+
+HAS_PASSWORD = 1
+HAS_SKEY = 2
+
+def _hash(username):
+    """Хеш имени, одинаковый во всех процессах (в отличие от hash())"""
+    return int.from_bytes(hashlib.blake2b(username, digest_size=8).digest(), "little")
+
+def _field(value, size, name):
+    data = value.encode()
+    if len(data) > size:
+        raise ValueError(f"Поле {name} длиннее {size} байт: {value[:20]}...")
+    return data
+
+class AccountTable:
+    """Хранилище учетных записей поверх файла, собранного compile_table()
+
+    Набор учетных записей фиксирован при сборке; на месте можно менять
+    пароли и состояние S/KEY существующих пользователей. Счетчик S/KEY
+    уменьшается под блокировкой записи (fcntl), поэтому несколько процессов
+    с одной таблицей не примут один пароль дважды.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.bucket_count, self.record_count, record_size = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"Неверный формат таблицы учетных записей: {path}")
+        self._mask = self.bucket_count - 1
+        self._records = FILE_HEADER.size + self.bucket_count * INDEX_ENTRY.size
+        # fcntl-блокировки принадлежат процессу, поэтому потоки одного
+        # процесса дополнительно разделяет обычная блокировка
+        self._lock = threading.Lock()
+
+    def _find(self, username):
+        """Смещение записи пользователя или None"""
+        key = username.encode()
+        if len(key) > MAX_USERNAME:
+            return None
+        slot = _hash(key) & self._mask
+        while True:
+            number = INDEX_ENTRY.unpack_from(self._map, FILE_HEADER.size + slot * INDEX_ENTRY.size)[0]
+            if number == 0:
+                return None
+            offset = self._records + (number - 1) * RECORD.size
+            if self._map[offset:offset + MAX_USERNAME].rstrip(b"\0") == key:
+                return offset
+            slot = (slot + 1) & self._mask
+
+    def _read(self, username):
+        offset = self._find(username)
+        return (offset, RECORD.unpack_from(self._map, offset)) if offset is not None else (None, None)
+
+    @contextmanager
+    def _record_locked(self, offset):
+        start = time.perf_counter()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._file, fcntl.LOCK_EX, RECORD.size, offset)
+            SKEY_LOCK_WAIT.observe(time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._file, fcntl.LOCK_UN, RECORD.size, offset)
+
+    def get_password(self, username):
+        _, record = self._read(username)
+        if record is None or not record[3] & HAS_PASSWORD:
+            return None
+        return record[1].rstrip(b"\0").decode()
+
+    def skey_get(self, username):
+        _, record = self._read(username)
+        if record is None or not record[3] & HAS_SKEY:
+            return None
+        return {"seed": record[2].rstrip(b"\0").decode(), "count": record[4], "last": record[5]}
+
+    def skey_consume(self, username, count, otp):
+        offset, record = self._read(username)
+        if record is None or not record[3] & HAS_SKEY or count < 1:
+            return False
+        with self._record_locked(offset):
+            current, last = COUNTER.unpack_from(self._map, offset + COUNTER_OFFSET)
+            if current != count or not skey_verify({"last": last}, otp):
+                return False
+            COUNTER.pack_into(self._map, offset + COUNTER_OFFSET, current - 1, otp)
+            return True
+
+    def _update(self, username, **fields):
+        offset, record = self._read(username)
+        if record is None:
+            raise KeyError(f"Пользователя {username} нет в таблице; пересоберите ее")
+        name, password, seed, flags, count, last = record
+        if "password" in fields:
+            password = _field(fields["password"], MAX_PASSWORD, "password")
+            flags |= HAS_PASSWORD
+        if "entry" in fields:
+            entry = fields["entry"]
+            seed = _field(entry["seed"], MAX_SEED, "seed")
+            count, last = entry["count"], entry["last"]
+            flags |= HAS_SKEY
+        with self._record_locked(offset):
+            RECORD.pack_into(self._map, offset, name, password, seed, flags, count, last)
+
+    def set_password(self, username, password):
+        self._update(username, password=password)
+
+    def set_skey(self, username, entry):
+        self._update(username, entry=entry)
+
+    def import_passwords(self, rows):
+        for username, password in rows:
+            self.set_password(username, password)
+
+    def import_skey(self, rows):
+        for username, entry in rows:
+            self.set_skey(username, entry)
+
+    def is_empty(self):
+        return self.record_count == 0
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+def compile_table(path, passwords=(), skey=()):
+    """Собирает таблицу из пар (username, password) и (username, запись S/KEY)
+
+    Файл пишется во временный и заменяет старый атомарно: работающие
+    процессы продолжают читать прежнее отображение.
+    """
+    records = {}
+    for username, password in passwords:
+        records.setdefault(username, {})["password"] = password
+    for username, entry in skey:
+        records.setdefault(username, {})["skey"] = entry
+
+    # Заполнение индекса не больше половины: короткие цепочки пробирования
+    bucket_count = 1
+    while bucket_count < 2 * len(records):
+        bucket_count *= 2
+    index = array("I", bytes(INDEX_ENTRY.size * bucket_count))
+    mask = bucket_count - 1
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, bucket_count, len(records), RECORD.size))
+        f.seek(FILE_HEADER.size + bucket_count * INDEX_ENTRY.size)
+        for number, (username, fields) in enumerate(records.items(), 1):
+            key = _field(username, MAX_USERNAME, "username")
+            flags, password, seed, count, last = 0, b"", b"", 0, b""
+            if "password" in fields:
+                password = _field(fields["password"], MAX_PASSWORD, "password")
+                flags |= HAS_PASSWORD
+            if "skey" in fields:
+                entry = fields["skey"]
+                seed = _field(entry["seed"], MAX_SEED, "seed")
+                count, last = entry["count"], entry["last"]
+                flags |= HAS_SKEY
+            f.write(RECORD.pack(key, password, seed, flags, count, last))
+            slot = _hash(key) & mask
+            while index[slot]:
+                slot = (slot + 1) & mask
+            index[slot] = number
+        f.seek(FILE_HEADER.size)
+        if sys.byteorder != "little":
+            index.byteswap()
+        f.write(index.tobytes())
+    os.replace(temp_path, path)
+    return len(records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сборка таблицы учетных записей для сервера")
+    parser.add_argument("output", help="файл таблицы")
+    parser.add_argument("--users", help="CSV с полями username,password")
+    parser.add_argument("--skey", help="база S/KEY в JSON, подготовленная skey_init.py")
+    add_hash_arguments(parser)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    passwords = hash_from_arguments(read_password_rows(args.users), args) if args.users else ()
+    skey = load_db(args.skey).items() if args.skey else ()
+    count = compile_table(args.output, passwords, skey)
+    print(f"[ТАБЛИЦА] Учетных записей: {count}, собрано за {time.perf_counter() - start:.1f} с "
+          f"в {args.output} ({os.path.getsize(args.output) // 1024} КБ)")
+
+if __name__ == "__main__":
+    main()
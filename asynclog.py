@@ -0,0 +1,127 @@
+import sys
+import time
+import queue
+import threading
+from collections import namedtuple
+
+# Очередь журнала: обработчики соединений только кладут запись в ограниченную
+# очередь, а вывод в консоль или GUI выполняет фоновый поток пачками. Поток
+# соединения никогда не ждет вывода: при переполнении очереди запись
+# отбрасывается и учитывается в счетчике пропущенных.
+
+# Уровни сообщений
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+# Размер очереди и наибольшее число записей в одной пачке вывода
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 512
+
+LogRecord = namedtuple("LogRecord", "created level message")
+
+# Место в очереди для прогресса по ключу; выводится последнее значение
+_Pending = namedtuple("_Pending", "key")
+
+_STOP = object()
+
+class AsyncLog:
+    """Журнал с фоновым выводом
+
+    sink(records) вызывается из фонового потока со списком LogRecord.
+    Сообщения прогресса с одним ключом объединяются: пока предыдущее не
+    выведено, новое только заменяет его текст.
+    """
+
+    def __init__(self, sink, level=INFO, maxsize=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+        self.sink = sink
+        self.level = level
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="asynclog", daemon=True)
+        self._thread.start()
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def log(self, message, level=INFO):
+        """Ставит сообщение в очередь, не дожидаясь вывода"""
+        if level >= self.level:
+            self._put(LogRecord(time.time(), level, message))
+
+    def progress(self, key, message, level=INFO):
+        """Сообщение о ходе операции key; частые обновления объединяются"""
+        if level < self.level:
+            return
+        record = LogRecord(time.time(), level, message)
+        with self._pending_lock:
+            queued = key in self._pending
+            self._pending[key] = record
+        if not queued and not self._put(_Pending(key)):
+            with self._pending_lock:
+                self._pending.pop(key, None)
+
+    def _take_pending(self, key):
+        with self._pending_lock:
+            return self._pending.pop(key, None)
+
+    def _run(self):
+        reported = 0
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            records = []
+            stop = False
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, _Pending):
+                    record = self._take_pending(item.key)
+                    if record is not None:
+                        records.append(record)
+                else:
+                    records.append(item)
+            if self.dropped != reported:
+                records.append(LogRecord(time.time(), WARNING,
+                                         f"Очередь журнала переполнена, пропущено сообщений: {self.dropped - reported}"))
+                reported = self.dropped
+            if records:
+                try:
+                    self.sink(records)
+                except Exception:
+                    pass
+            if stop:
+                return
+
+    def close(self):
+        """Выводит накопленные сообщения и останавливает фоновый поток"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+def console_sink(prefix, stream=None):
+    """Вывод пачки записей в консоль одной операцией записи"""
+    def sink(records):
+        out = stream or sys.stdout
+        out.write("".join(f"{prefix} {record.message}\n" for record in records))
+        out.flush()
+    return sink
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from multiprocessing import Pool
+from skey_init import init_entry, save_db
+from client_api import connect, authenticate, upload_file
+
+# Нагрузочный тест сервера: N одновременных клиентов в цикле подключаются,
+# проходят аутентификацию по PAP/CHAP/S-KEY в заданной пропорции и при
+# необходимости загружают файл. Сервер запускается отдельным процессом,
+# чтобы клиенты и сервер не делили один GIL.
+
+PROTOCOLS = {"pap": 1, "chap": 2, "skey": 3}
+
+# Учетная запись PAP/CHAP из демонстрационной базы сервера
+USERNAME = "admin"
+PASSWORD = "password123"
+
+# Запас счетчика S/KEY на одного клиента: каждый вход расходует один пароль
+SKEY_COUNT = 20000
+
+def skey_user(worker):
+    return f"bench{worker}", f"seed{worker}"
+
+def parse_mix(text):
+    """Разбирает пропорцию протоколов вида "pap=1,chap=1,skey=2" """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in PROTOCOLS:
+            raise argparse.ArgumentTypeError(f"Неизвестный протокол: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(values, p):
+    """Процентиль p (0-100) методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+def prepare_skey_db(path, workers, count):
+    """База S/KEY с отдельным пользователем на каждого клиента
+
+    Клиенты входят параллельно, а общий счетчик одного пользователя
+    позволил бы пройти аутентификацию только одному из них.
+    """
+    db = {}
+    for worker in range(workers):
+        username, seed = skey_user(worker)
+        db[username] = init_entry(seed, PASSWORD, count)
+    save_db(db, path)
+
+def wait_port(process, host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            socket.create_connection((host, port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Сервер не начал принимать соединения на {host}:{port}")
+
+def start_server(workdir, mode, port, skey_db, workers=1):
+    """Запускает server.py в каталоге workdir (туда же сохраняются файлы)
+
+    Все клиенты приходят с 127.0.0.1, поэтому лимит на адрес отключен.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    process = subprocess.Popen([sys.executable, script, "--mode", mode, "--host", "127.0.0.1",
+                                "--port", str(port), "--log-level", "error", "--skey-db", skey_db,
+                                "--workers", str(workers), "--max-per-ip", "0"],
+                               cwd=workdir, stdout=subprocess.DEVNULL)
+    try:
+        wait_port(process, "127.0.0.1", port)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+def client_loop(worker, args, file_path, deadline, results):
+    """Один клиент: вход и загрузка в цикле до deadline"""
+    rng = random.Random(args.seed * 100003 + worker)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    username_skey, seed = skey_user(worker)
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        protocol = PROTOCOLS[name]
+        username = username_skey if protocol == 3 else USERNAME
+        try:
+            start = time.perf_counter()
+            with connect(args.host, args.port, timeout=30.0) as sock:
+                ok = authenticate(sock, protocol, username, PASSWORD, seed)
+                auth_time = time.perf_counter() - start
+                if not ok:
+                    results["errors"] += 1
+                    continue
+                results["auth"].setdefault(name, []).append(auth_time)
+                if file_path is not None:
+                    upload_start = time.perf_counter()
+                    status = upload_file(sock, file_path, dedup=False)
+                    if not status.startswith("FILE_RECEIVED"):
+                        results["errors"] += 1
+                        continue
+                    results["uploads"] += 1
+                    results["bytes"] += args.size
+                    results["upload_time"].append(time.perf_counter() - upload_start)
+        except Exception:
+            results["errors"] += 1
+
+def run_process(job):
+    """Потоки клиентов одного процесса; возвращает собранные замеры"""
+    args, workers, workdir, deadline = job
+    threads = []
+    all_results = []
+    for worker in workers:
+        file_path = None
+        if args.size:
+            # Отдельный файл на клиента: одинаковые имена конкурировали бы
+            # за одну незавершенную загрузку на сервере
+            file_path = os.path.join(workdir, f"upload{worker}.bin")
+            with open(file_path, 'wb') as f:
+                f.write(os.urandom(args.size))
+        results = {"auth": {}, "errors": 0, "uploads": 0, "bytes": 0, "upload_time": []}
+        all_results.append(results)
+        thread = threading.Thread(target=client_loop, args=(worker, args, file_path, deadline, results))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return all_results
+
+def merge(parts):
+    total = {"auth": {}, "errors": 0, "uploads": 0, "bytes": 0, "upload_time": []}
+    for results in parts:
+        for name, values in results["auth"].items():
+            total["auth"].setdefault(name, []).extend(values)
+        for key in ("errors", "uploads", "bytes"):
+            total[key] += results[key]
+        total["upload_time"].extend(results["upload_time"])
+    return total
+
+def _percentiles_ms(values):
+    return {f"p{p}": round(percentile(values, p) * 1000, 3) for p in (50, 95, 99)}
+
+def summarize(total, elapsed, args):
+    latencies = [v for values in total["auth"].values() for v in values]
+    summary = {
+        "mode": args.mode,
+        "workers": args.workers,
+        "clients": args.clients,
+        "size": args.size,
+        "duration": round(elapsed, 3),
+        "logins": len(latencies),
+        "errors": total["errors"],
+        "logins_per_sec": round(len(latencies) / elapsed, 1),
+        "mb_per_sec": round(total["bytes"] / 2**20 / elapsed, 2),
+        "auth_ms": {},
+    }
+    for name, values in [("all", latencies)] + sorted(total["auth"].items()):
+        summary["auth_ms"][name] = _percentiles_ms(values)
+    if total["upload_time"]:
+        summary["upload_ms"] = _percentiles_ms(total["upload_time"])
+    return summary
+
+def report(summary):
+    print(f"[НАГРУЗКА] Режим сервера: {summary['mode']} x{summary['workers']}, клиентов: {summary['clients']}, "
+          f"файл: {summary['size']} байт, длительность: {summary['duration']:.1f} с")
+    print(f"[НАГРУЗКА] Входов: {summary['logins']} ({summary['logins_per_sec']}/с), "
+          f"ошибок: {summary['errors']}, загрузка: {summary['mb_per_sec']} MB/s")
+    for name, stats in summary["auth_ms"].items():
+        print(f"[НАГРУЗКА] Аутентификация {name:>4}: p50 {stats['p50']:.2f} мс, "
+              f"p95 {stats['p95']:.2f} мс, p99 {stats['p99']:.2f} мс")
+    if "upload_ms" in summary:
+        stats = summary["upload_ms"]
+        print(f"[НАГРУЗКА] Загрузка файла: p50 {stats['p50']:.2f} мс, "
+              f"p95 {stats['p95']:.2f} мс, p99 {stats['p99']:.2f} мс")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест аутентификации и загрузки файлов")
+    parser.add_argument("--clients", type=int, default=16, help="число одновременных клиентов")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="число процессов, между которыми делятся клиенты")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность теста в секундах")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("pap=1,chap=1,skey=1"),
+                        help="пропорция протоколов, например pap=1,chap=1,skey=2")
+    parser.add_argument("--size", type=int, default=0,
+                        help="размер загружаемого после входа файла в байтах (0 - только вход)")
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread",
+                        help="режим запускаемого сервера")
+    parser.add_argument("--workers", type=int, default=1, help="число рабочих процессов сервера")
+    parser.add_argument("--port", type=int, default=18080, help="порт запускаемого сервера")
+    parser.add_argument("--seed", type=int, default=1, help="зерно выбора протоколов")
+    parser.add_argument("--json", default=None, help="сохранить итоги в JSON-файл")
+    args = parser.parse_args(argv)
+    args.host = "127.0.0.1"
+
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    server = None
+    try:
+        skey_db = os.path.join(workdir, "skey_db.json")
+        prepare_skey_db(skey_db, args.clients, SKEY_COUNT)
+        server = start_server(workdir, args.mode, args.port, skey_db, args.workers)
+
+        processes = max(1, min(args.processes, args.clients))
+        start = time.monotonic()
+        deadline = start + args.duration
+        jobs = [(args, range(i, args.clients, processes), workdir, deadline) for i in range(processes)]
+        if processes == 1:
+            parts = run_process(jobs[0])
+        else:
+            with Pool(processes) as pool:
+                parts = [r for results in pool.map(run_process, jobs) for r in results]
+        elapsed = time.monotonic() - start
+
+        summary = summarize(merge(parts), elapsed, args)
+        report(summary)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import time
+import socket
+import argparse
+import threading
+import tracemalloc
+from protocol import RECV_BUFFER_SIZE, recv_into_file
+
+# Сравнение приема файла: recv(4096) + write (как было) против
+# recv_into в переиспользуемый буфер (protocol.recv_into_file)
+
+def sender(sock, total, block=1024 * 1024):
+    """Отправляет total байт из одного и того же блока"""
+    data = memoryview(os.urandom(block))
+    sent = 0
+    while sent < total:
+        n = min(block, total - sent)
+        sock.sendall(data[:n])
+        sent += n
+    sock.shutdown(socket.SHUT_WR)
+
+def recv_old(sock, f, size, chunk=4096):
+    """Старый способ: новый объект bytes на каждый recv"""
+    received = 0
+    calls = 0
+    while received < size:
+        data = sock.recv(chunk)
+        if not data:
+            break
+        f.write(data)
+        received += len(data)
+        calls += 1
+    return received, calls
+
+def recv_new(sock, f, size, buffer_size):
+    calls = 0
+
+    def count(_):
+        nonlocal calls
+        calls += 1
+
+    received = recv_into_file(sock, f, size, bytearray(buffer_size), count)
+    return received, calls
+
+def run(method, size, buffer_size, output, trace):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    conn, _ = listener.accept()
+    listener.close()
+
+    thread = threading.Thread(target=sender, args=(client, size))
+    thread.start()
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(output, 'wb') as f:
+        if method == "recv":
+            received, calls = recv_old(conn, f, size)
+        else:
+            received, calls = recv_new(conn, f, size, buffer_size)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else None
+    if trace:
+        tracemalloc.stop()
+
+    thread.join()
+    conn.close()
+    client.close()
+
+    # recv() создает новый объект bytes на каждый вызов, recv_into - ни одного
+    allocations = calls if method == "recv" else 1
+    line = (f"{method:>9}: {received / 2**20:.0f} MiB за {elapsed:.2f} с, "
+            f"{received / 2**20 / elapsed:.1f} MiB/s, вызовов: {calls}, "
+            f"буферов выделено: {allocations}")
+    if peak is not None:
+        line += f", пик памяти: {peak / 1024:.0f} KiB"
+    print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк приема файла на стороне сервера")
+    parser.add_argument("--size", type=int, default=2 * 1024, help="объем передачи в MiB")
+    parser.add_argument("--buffer", type=int, default=RECV_BUFFER_SIZE, help="размер буфера recv_into")
+    parser.add_argument("--output", default=os.devnull, help="куда записывать принятые данные")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="измерять пик выделенной памяти (замедляет прием)")
+    args = parser.parse_args(argv)
+
+    size = args.size * 1024 * 1024
+    for method in ("recv", "recv_into"):
+        run(method, size, args.buffer, args.output, args.tracemalloc)
+
+if __name__ == "__main__":
+    main()
@@ -1,150 +1,196 @@
-import socket
-import random
 import os
-import hashlib
-import time
+import sys
 import getpass
+import argparse
+from client_api import (DEFAULT_HOST, DEFAULT_PORT, AuthenticationError, ServerBusyError, Client,
+                        upload_hash)
 
-# Запрашиваем путь к файлу
-file_path = input("Введите путь к файлу для отправки: ")
-
-# Проверяем существование файла
-if not os.path.exists(file_path):
-    print(f"[КЛИЕНТ] Ошибка: Файл {file_path} не найден")
-    exit(1)
-
-# Выбор протокола
-print("Выберите протокол аутентификации:")
-print("1. PAP (Password Authentication Protocol)")
-print("2. CHAP (Challenge-Handshake Authentication Protocol)")
-print("3. S/KEY (One-Time Password)")
-protocol = int(input("Введите номер протокола (1-3): "))
-# Validate input
-if protocol not in [1, 2, 3]:
-    print("Ошибка: Введите число от 1 до 3")
-    exit(1)
-
-# Подключаемся к серверу
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect(("127.0.0.1", 8080))
-
-# Отправляем выбранный протокол
-client_socket.send(str(protocol).encode())
-# Add a small delay or wait for acknowledgment
-time.sleep(0.1)
-print(f"[КЛИЕНТ] Выбран протокол: {protocol}")
-
-# Аутентификация с использованием выбранного протокола
-if protocol == 1:  # PAP
-    # Запрашиваем логин и пароль
-    username = input("Введите имя пользователя: ")
-    password = getpass.getpass("Введите пароль: ")
-    
-    # Отправляем логин и пароль серверу
-    client_socket.send(username.encode())
-    time.sleep(0.1)
-    client_socket.send(password.encode())
-    
-    print(f"[КЛИЕНТ] Данные аутентификации отправлены серверу")
-
-elif protocol == 2:  # CHAP
-    # Запрашиваем логин
-    username = input("Введите имя пользователя: ")
-    password = getpass.getpass("Введите пароль: ")
-    
-    # Отправляем только логин
-    client_socket.send(username.encode())
-    print(f"[КЛИЕНТ] Отправлено имя пользователя: {username}")
-    
-    # Получаем случайный challenge от сервера
-    challenge = client_socket.recv(1024)
-    print(f"[КЛИЕНТ] Получен challenge: {challenge.hex()}")
-    
-    # Вычисляем хеш MD5(challenge + password)
-    m = hashlib.md5()
-    m.update(challenge + password.encode())
-    response = m.digest()
-    
-    # Отправляем ответ
-    client_socket.send(response)
-    print(f"[КЛИЕНТ] Отправлен ответ: {response.hex()}")
-
-elif protocol == 3:  # S/KEY
-    # Константы S/KEY
-    username = input("Введите имя пользователя: ")
-    seed = input("Введите seed (случайная строка): ")
-    
-    # Отправляем логин
-    client_socket.send(username.encode())
-    
-    # Получаем текущее значение счетчика
-    count = int(client_socket.recv(1024).decode())
-    print(f"[КЛИЕНТ] Счетчик запросов: {count}")
-    
-    # В реальной системе пароль был бы предвычислен
-    # Здесь мы имитируем для демонстрации
-    secret = getpass.getpass("Введите секретный ключ: ")
-    
-    # Вычисляем одноразовый пароль путем последовательного хеширования
-    # MD5(seed + secret + count)
-    combined = (seed + secret).encode()
-    result = combined
-    
-    for _ in range(count):
-        h = hashlib.md5()
-        h.update(result)
-        result = h.digest()
-    
-    # Отправляем одноразовый пароль
-    client_socket.send(result)
-    print(f"[КЛИЕНТ] Отправлен одноразовый пароль для счетчика {count}")
-
-# Получаем ответ
-result = client_socket.recv(1024).decode()
-print(f"[КЛИЕНТ] Ответ от сервера: {result}")
-
-# Если аутентификация успешна, отправляем файл
-if result == "AUTH_SUCCESS":
-    print(f"[КЛИЕНТ] Аутентификация успешна. Начинаем передачу файла: {file_path}")
+# Коды завершения для запуска из скриптов и cron
+EXIT_OK = 0
+EXIT_FAILED = 1         # передача не удалась или сервер сообщил об ошибке
+EXIT_USAGE = 2          # неверные аргументы
+EXIT_AUTH = 3           # аутентификация отклонена
+EXIT_CONNECTION = 4     # нет соединения с сервером или он перегружен (BUSY)
+
+PROTOCOLS = {"pap": 1, "chap": 2, "skey": 3, "1": 1, "2": 2, "3": 3}
+
+def log(message):
+    print(f"[КЛИЕНТ] {message}")
+
+def ask(prompt):
+    return input(f"{prompt} (y/N): ").strip().lower() in ("y", "yes", "д", "да")
+
+def interactive():
+    """Запрашивает параметры передачи в диалоге (запуск без аргументов)"""
+    options = argparse.Namespace(host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None, quiet=False)
+
+    # Запрашиваем путь к файлу (каталог передается целиком в пакетном режиме)
+    file_path = input("Введите путь к файлу или каталогу для отправки: ")
+
+    # Проверяем существование файла
+    if not os.path.exists(file_path):
+        print(f"[КЛИЕНТ] Ошибка: Файл {file_path} не найден")
+        sys.exit(EXIT_USAGE)
+    options.paths = [file_path]
+
+    # Количество соединений, по которым файл передается параллельно
+    batch = os.path.isdir(file_path)
+    options.streams = 1 if batch else int(input("Количество параллельных соединений (Enter - 1): ") or 1)
+    if options.streams < 1:
+        print("Ошибка: количество соединений должно быть положительным")
+        sys.exit(EXIT_USAGE)
+
+    # Сжатие и дельта-передача применяются при передаче одного файла по одному соединению
+    options.compress = options.delta = False
+    if not batch and options.streams == 1:
+        options.compress = ask("Сжимать данные при передаче?")
+        options.delta = ask("Передавать только изменения относительно копии на сервере?")
+
+    # Выбор протокола
+    print("Выберите протокол аутентификации:")
+    print("1. PAP (Password Authentication Protocol)")
+    print("2. CHAP (Challenge-Handshake Authentication Protocol)")
+    print("3. S/KEY (One-Time Password)")
+    options.protocol = int(input("Введите номер протокола (1-3): "))
+    # Validate input
+    if options.protocol not in [1, 2, 3]:
+        print("Ошибка: Введите число от 1 до 3")
+        sys.exit(EXIT_USAGE)
+
+    # Учетные данные запрашиваем заранее: при параллельной передаче
+    # аутентифицируется каждое соединение
+    options.user = input("Введите имя пользователя: ")
+    options.seed = ""
+    if options.protocol == 3:  # S/KEY
+        options.seed = input("Введите seed (случайная строка): ")
+        options.password = getpass.getpass("Введите секретный ключ: ")
+    else:
+        options.password = getpass.getpass("Введите пароль: ")
+    return options
+
+def read_password(args):
+    """Пароль (секрет S/KEY) из файла, stdin или переменной окружения"""
+    if args.password_file:
+        with open(args.password_file, encoding='utf-8') as f:
+            return f.readline().rstrip("\r\n")
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip("\r\n")
+    return os.environ.get(args.password_env)
+
+def read_file_list(source):
+    """Пути из файла со списком (по одному в строке; "-" - stdin)"""
+    f = sys.stdin if source == "-" else open(source, encoding='utf-8')
+    try:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(
+        description="Клиент передачи файлов с аутентификацией PAP/CHAP/S-KEY. "
+                    "Без аргументов запрашивает параметры в диалоге.")
+    parser.add_argument("paths", nargs="*", help="файлы и каталоги для отправки")
+    parser.add_argument("--files-from", metavar="FILE",
+                        help="файл со списком путей, по одному в строке (\"-\" - stdin)")
+    parser.add_argument("--host", default=env("AUTH_HOST", DEFAULT_HOST),
+                        help="адрес сервера (AUTH_HOST)")
+    parser.add_argument("--port", type=int, default=None,
+                        help="порт сервера (AUTH_PORT)")
+    parser.add_argument("--protocol", choices=list(PROTOCOLS), default=None,
+                        help="протокол аутентификации (AUTH_PROTOCOL)")
+    parser.add_argument("--user", default=env("AUTH_USER"), help="имя пользователя (AUTH_USER)")
+    parser.add_argument("--seed", default=env("AUTH_SEED", ""), help="seed для S/KEY (AUTH_SEED)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--password-env", default="AUTH_PASSWORD", metavar="VAR",
+                        help="переменная окружения с паролем (по умолчанию AUTH_PASSWORD)")
+    source.add_argument("--password-file", metavar="FILE", help="файл, первая строка которого - пароль")
+    source.add_argument("--password-stdin", action="store_true", help="прочитать пароль из stdin")
+    parser.add_argument("--streams", type=int, default=1,
+                        help="число параллельных соединений для одного файла")
+    parser.add_argument("--compress", action="store_true", help="сжимать данные при передаче")
+    parser.add_argument("--delta", action="store_true",
+                        help="передавать только изменения относительно копии на сервере")
+    parser.add_argument("--timeout", type=float, default=None, help="таймаут операций сокета, с")
+    parser.add_argument("-q", "--quiet", action="store_true", help="выводить только итог и ошибки")
+    args = parser.parse_args(argv)
+
+    # Значения из окружения argparse не проверяет, поэтому проверяем их здесь
+    if args.port is None:
+        port = env("AUTH_PORT", str(DEFAULT_PORT))
+        if not port.isdigit() or not 0 < int(port) < 65536:
+            parser.error(f"некорректный порт в AUTH_PORT: {port!r}")
+        args.port = int(port)
+    if args.protocol is None:
+        args.protocol = env("AUTH_PROTOCOL", "pap")
+        if args.protocol not in PROTOCOLS:
+            parser.error(f"некорректный протокол в AUTH_PROTOCOL: {args.protocol!r} "
+                         f"(допустимы: {', '.join(PROTOCOLS)})")
+
+    if args.files_from:
+        if args.files_from == "-" and args.password_stdin:
+            parser.error("--files-from - и --password-stdin не могут читать stdin одновременно")
+        args.paths += read_file_list(args.files_from)
+    if not args.paths:
+        parser.error("не указаны файлы для отправки")
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        parser.error(f"файл не найден: {missing[0]}")
+    if not args.user:
+        parser.error("не указано имя пользователя (--user или AUTH_USER)")
+    if args.streams < 1:
+        parser.error("количество соединений должно быть положительным")
+    args.protocol = PROTOCOLS[args.protocol]
+    if args.protocol == 3 and not args.seed:
+        parser.error("для S/KEY нужен seed (--seed или AUTH_SEED)")
+    args.password = read_password(args)
+    if args.password is None:
+        parser.error(f"пароль не задан: переменная {args.password_env} пуста")
+    return args
+
+def run(options):
+    """Подключается, проходит аутентификацию и передает файлы; возвращает код завершения"""
+    verbose = (lambda message: None) if options.quiet else log
+    # Хеш файла считается до подключения: сервер закрывает соединение,
+    # простаивающее дольше своего таймаута, а большой файл хешируется долго
+    try:
+        content_hash = upload_hash(options.paths, options.streams)
+    except OSError as e:
+        print(f"[КЛИЕНТ] Не удалось прочитать файл: {e}")
+        return EXIT_FAILED
+    client = Client(options.host, options.port, options.timeout, verbose)
     try:
-        # Отправляем имя файла
-        file_name = os.path.basename(file_path)
-        client_socket.send(f"FILENAME:{file_name}".encode())
-        print(f"[КЛИЕНТ] Отправлено имя файла: {file_name}")
-        time.sleep(1)  # Добавляем паузу
-        
-        # Отправляем размер файла
-        file_size = os.path.getsize(file_path)
-        client_socket.send(f"FILESIZE:{file_size}".encode())
-        print(f"[КЛИЕНТ] Отправлен размер файла: {file_size} байт")
-        time.sleep(1)  # Добавляем паузу
-        
-        # Получаем подтверждение готовности
-        print(f"[КЛИЕНТ] Ожидание сигнала готовности от сервера...")
-        ready = client_socket.recv(1024).decode().strip()
-        print(f"[КЛИЕНТ] Получен ответ от сервера: '{ready}'")
-        
-        if ready != "READY":
-            print(f"[КЛИЕНТ] Ошибка: сервер не готов к приему файла")
-            client_socket.close()
-            exit(1)
-            
-        # Отправляем содержимое файла
-        with open(file_path, 'rb') as f:
-            data = f.read(4096)
-            while data:
-                client_socket.send(data)
-                data = f.read(4096)
-                
-        print(f"[КЛИЕНТ] Файл {file_name} успешно передан")
-        
-        # Получаем подтверждение о получении файла
-        confirmation = client_socket.recv(1024).decode()
-        print(f"[КЛИЕНТ] {confirmation}")
-        
+        client.login(options.protocol, options.user, options.password, options.seed)
+    except AuthenticationError:
+        print("[КЛИЕНТ] Аутентификация не удалась. Отправка файла невозможна.")
+        return EXIT_AUTH
+    except ServerBusyError as e:
+        print(f"[КЛИЕНТ] Сервер отклонил подключение: {e}")
+        return EXIT_CONNECTION
+    except OSError as e:
+        print(f"[КЛИЕНТ] Не удалось подключиться к {options.host}:{options.port}: {e}")
+        return EXIT_CONNECTION
+
+    # Аутентификация успешна, отправляем файл
+    verbose(f"Аутентификация успешна. Начинаем передачу файла: {', '.join(options.paths)}")
+    try:
+        with client:
+            result = client.upload(options.paths, options.streams, options.compress, options.delta,
+                                   content_hash=content_hash)
+        if result.confirmation not in result.statuses:
+            # Ответы по каждому файлу пакета
+            for status in result.statuses:
+                verbose(status)
+        print(f"[КЛИЕНТ] {result.confirmation}")
+        return EXIT_OK if result.success else EXIT_FAILED
     except Exception as e:
         print(f"[КЛИЕНТ] Ошибка при передаче файла: {str(e)}")
-else:
-    print("[КЛИЕНТ] Аутентификация не удалась. Отправка файла невозможна.")
+        return EXIT_FAILED
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return run(parse_args(argv) if argv else interactive())
 
-client_socket.close()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
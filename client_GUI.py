@@ -1,19 +1,19 @@
 import sys
 import os
-import socket
-import hashlib
-import time
 import threading
+import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QLabel, QLineEdit, QPushButton,
-                            QTextEdit, QFileDialog, QMessageBox, QFrame,
-                            QRadioButton, QGroupBox, QProgressBar, QButtonGroup)
+                            QFileDialog, QMessageBox, QFrame,
+                            QRadioButton, QGroupBox, QProgressBar, QButtonGroup,
+                            QSpinBox, QCheckBox)
 from PyQt6.QtCore import Qt, QDir, pyqtSignal
 from PyQt6.QtGui import QFont, QColor, QPalette, QIcon
+from logview import LogView, ProgressThrottle
+from client_api import Client
 
 class ClientGUI(QMainWindow):
     # Сигналы для обновления GUI из других потоков
-    log_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
     connection_status_signal = pyqtSignal(bool, str)
     auth_status_signal = pyqtSignal(bool, str)
@@ -26,7 +26,7 @@ class ClientGUI(QMainWindow):
         self.setMinimumSize(700, 500)
         
         # Переменные состояния
-        self.client_socket = None
+        self.client = None
         self.connected = False
         self.authenticated = False
         
@@ -48,7 +48,6 @@ class ClientGUI(QMainWindow):
         self.create_log_frame(main_layout)
         
         # Подключаем сигналы
-        self.log_signal.connect(self.append_log)
         self.progress_signal.connect(self.update_progress)
         self.connection_status_signal.connect(self.update_connection_status)
         self.auth_status_signal.connect(self.update_auth_status)
@@ -97,7 +96,7 @@ class ClientGUI(QMainWindow):
         QPushButton:pressed {
             background-color: #252525;
         }
-        QTextEdit {
+        QListView {
             background-color: #252526;
             color: #DCDCDC;
             border: 1px solid #3F3F46;
@@ -312,6 +311,27 @@ class ClientGUI(QMainWindow):
         browse_button.setFixedWidth(80)
         file_select_layout.addWidget(browse_button)
         
+        # Каталог передается целиком пакетом по одному соединению
+        browse_dir_button = QPushButton("Папка")
+        browse_dir_button.clicked.connect(self.browse_directory)
+        browse_dir_button.setFixedWidth(80)
+        file_select_layout.addWidget(browse_dir_button)
+        
+        # Количество параллельных соединений для передачи одного файла
+        file_select_layout.addWidget(QLabel("Потоков:"))
+        self.streams_input = QSpinBox()
+        self.streams_input.setRange(1, 16)
+        self.streams_input.setValue(1)
+        file_select_layout.addWidget(self.streams_input)
+        
+        # Сжатие данных при передаче по одному соединению
+        self.compress_checkbox = QCheckBox("Сжатие")
+        file_select_layout.addWidget(self.compress_checkbox)
+        
+        # Передача только изменений относительно копии на сервере
+        self.delta_checkbox = QCheckBox("Только изменения")
+        file_select_layout.addWidget(self.delta_checkbox)
+        
         file_layout.addWidget(file_select_widget)
         
         # Кнопка отправки и статус
@@ -352,9 +372,8 @@ class ClientGUI(QMainWindow):
         # Заголовок
         log_layout.addWidget(QLabel("Логи клиента:"))
         
-        # Окно логов
-        self.log_area = QTextEdit()
-        self.log_area.setReadOnly(True)
+        # Окно логов: хранит последние строки и выводит новые по таймеру
+        self.log_area = LogView()
         log_font = QFont("Consolas", 10)
         self.log_area.setFont(log_font)
         self.log_area.setMaximumHeight(150)
@@ -372,19 +391,9 @@ class ClientGUI(QMainWindow):
         main_layout.addWidget(log_frame)
     
     def log(self, message):
-        """Добавляет сообщение в лог"""
-        self.log_signal.emit(message)
-    
-    def append_log(self, message):
-        """Метод, который добавляет сообщения в лог (вызывается через сигнал)"""
-        import datetime
+        """Добавляет сообщение в лог (из любого потока, без сигнала на каждую строку)"""
         timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        log_message = f"{timestamp} {message}"
-        self.log_area.append(log_message)
-        
-        # Прокручиваем вниз для отображения новых сообщений
-        scrollbar = self.log_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        self.log_area.append(f"{timestamp} {message}")
     
     def clear_logs(self):
         """Очищает содержимое лог-окна"""
@@ -404,6 +413,15 @@ class ClientGUI(QMainWindow):
             # Если пользователь аутентифицирован, разрешаем отправку
             self.send_button.setEnabled(self.authenticated)
     
+    def browse_directory(self):
+        """Открывает диалог выбора каталога для пакетной отправки"""
+        dir_path = QFileDialog.getExistingDirectory(self, "Выберите папку для отправки")
+        
+        if dir_path:
+            self.file_path.setText(dir_path)
+            self.log(f"Выбрана папка: {dir_path}")
+            self.send_button.setEnabled(self.authenticated)
+    
     def connect_to_server(self):
         """Подключается к серверу"""
         if self.connected:
@@ -422,10 +440,8 @@ class ClientGUI(QMainWindow):
                 QMessageBox.critical(self, "Ошибка", f"Неверный порт: {str(e)}")
                 return
             
-            # Создаем сокет и подключаемся
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.settimeout(5.0)  # 5 секунд для подключения
-            self.client_socket.connect((ip, port))
+            # Подключаемся с таймаутом 5 секунд на операции сокета
+            self.client = Client(ip, port, timeout=5.0, log=self.log).connect()
             
             # Обновляем статус
             self.connected = True
@@ -445,9 +461,9 @@ class ClientGUI(QMainWindow):
             return
             
         try:
-            if self.client_socket:
-                self.client_socket.close()
-                self.client_socket = None
+            if self.client:
+                self.client.close()
+                self.client = None
             
             # Обновляем статус
             self.connected = False
@@ -500,66 +516,8 @@ class ClientGUI(QMainWindow):
         try:
             self.log(f"Начало аутентификации с использованием протокола {protocol}")
             
-            # Отправляем выбранный протокол
-            self.client_socket.send(str(protocol).encode())
-            time.sleep(0.1)
-            self.log(f"Выбран протокол: {protocol}")
-            
-            # Аутентификация с использованием выбранного протокола
-            if protocol == 1:  # PAP
-                # Отправляем логин и пароль серверу
-                self.client_socket.send(username.encode())
-                time.sleep(0.1)
-                self.client_socket.send(password.encode())
-                
-                self.log("Данные аутентификации PAP отправлены серверу")
-                
-            elif protocol == 2:  # CHAP
-                # Отправляем только логин
-                self.client_socket.send(username.encode())
-                self.log(f"Отправлено имя пользователя: {username}")
-                
-                # Получаем случайный challenge от сервера
-                challenge = self.client_socket.recv(1024)
-                self.log(f"Получен challenge: {challenge.hex()}")
-                
-                # Вычисляем хеш MD5(challenge + password)
-                m = hashlib.md5()
-                m.update(challenge + password.encode())
-                response = m.digest()
-                
-                # Отправляем ответ
-                self.client_socket.send(response)
-                self.log(f"Отправлен ответ CHAP: {response.hex()}")
-                
-            elif protocol == 3:  # S/KEY
-                # Отправляем логин
-                self.client_socket.send(username.encode())
-                
-                # Получаем текущее значение счетчика
-                count = int(self.client_socket.recv(1024).decode())
-                self.log(f"Счетчик запросов S/KEY: {count}")
-                
-                # Вычисляем одноразовый пароль путем последовательного хеширования
-                # MD5(seed + secret + count)
-                combined = (seed + password).encode()
-                result = combined
-                
-                for _ in range(count):
-                    h = hashlib.md5()
-                    h.update(result)
-                    result = h.digest()
-                
-                # Отправляем одноразовый пароль
-                self.client_socket.send(result)
-                self.log(f"Отправлен одноразовый пароль для счетчика {count}")
-            
-            # Получаем ответ
-            result = self.client_socket.recv(1024).decode()
-            self.log(f"Ответ от сервера: {result}")
-            
             # Если аутентификация успешна
-            if result == "AUTH_SUCCESS":
+            if self.client.authenticate(protocol, username, password, seed):
                 self.authenticated = True
                 self.auth_status_signal.emit(True, "Аутентификация успешна")
                 
@@ -585,66 +543,52 @@ class ClientGUI(QMainWindow):
             QMessageBox.warning(self, "Предупреждение", "Выберите существующий файл для отправки")
             return
             
+        streams = self.streams_input.value()
+        
         # Запускаем отправку файла в отдельном потоке
-        send_thread = threading.Thread(target=self.file_sending_process, args=(file_path,))
+        compress = self.compress_checkbox.isChecked()
+        delta = self.delta_checkbox.isChecked()
+        send_thread = threading.Thread(target=self.file_sending_process,
+                                       args=(file_path, streams, compress, delta))
         send_thread.daemon = True
         send_thread.start()
     
-    def file_sending_process(self, file_path):
+    def file_sending_process(self, file_path, streams=1, compress=False, delta=False):
         """Процесс отправки файла в отдельном потоке"""
         try:
             self.log(f"Начало отправки файла: {file_path}")
             file_name = os.path.basename(file_path)
-            file_size = os.path.getsize(file_path)
-            
-            # Отправляем имя файла
-            self.client_socket.send(f"FILENAME:{file_name}".encode())
-            self.log(f"Отправлено имя файла: {file_name}")
-            time.sleep(0.5)  # Небольшая пауза
+            batch = os.path.isdir(file_path)
+            if batch:
+                self.log("Пакетная отправка папки")
             
-            # Отправляем размер файла
-            self.client_socket.send(f"FILESIZE:{file_size}".encode())
-            self.log(f"Отправлен размер файла: {file_size} байт")
-            time.sleep(0.5)  # Небольшая пауза
+            # Прогресс считается по числу отправленных байт (смещению),
+            # а не по количеству прочитанных порций. Индикатор обновляется
+            # с ограниченной частотой независимо от размера порций
+            throttle = ProgressThrottle(self.progress_signal.emit)
+            last_progress = -1
             
-            # Получаем подтверждение готовности
-            self.log("Ожидание сигнала готовности от сервера...")
-            ready = self.client_socket.recv(1024).decode().strip()
-            self.log(f"Получен ответ от сервера: '{ready}'")
-            
-            if ready != "READY":
-                self.log("Ошибка: сервер не готов к приему файла")
-                self.file_sent_signal.emit(False, "Ошибка: сервер не готов")
-                return
+            def report_progress(sent, total):
+                nonlocal last_progress
+                progress = int((sent * 100) / total) if total else 100
+                if progress == last_progress:
+                    return
+                throttle(progress, sent >= total)
                 
-            # Отправляем содержимое файла
-            bytes_sent = 0
-            chunk_size = 8192
-            
-            with open(file_path, 'rb') as f:
-                while bytes_sent < file_size:
-                    # Читаем порцию файла
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                        
-                    # Отправляем данные
-                    self.client_socket.send(chunk)
-                    bytes_sent += len(chunk)
-                    
-                    # Обновляем прогресс
-                    progress = int((bytes_sent * 100) / file_size)
-                    self.progress_signal.emit(progress)
-                    
-                    # Логируем каждые 20%
-                    if progress % 20 == 0:
-                        self.log(f"Прогресс отправки: {progress}%")
+                # Логируем каждые 20%
+                if progress // 20 > last_progress // 20:
+                    self.log(f"Прогресс отправки: {progress}%")
+                last_progress = progress
             
-            # Получаем подтверждение о получении файла
-            confirmation = self.client_socket.recv(1024).decode()
+            result = self.client.upload(file_path, streams, compress, delta, report_progress)
+            if batch:
+                for status in result.statuses:
+                    self.log(f"Ответ сервера: {status}")
+            confirmation = result.confirmation
             self.log(f"Ответ сервера: {confirmation}")
             
-            if "FILE_RECEIVED" in confirmation:
+            if result.success:
+                self.progress_signal.emit(100)
                 self.log(f"Файл {file_name} успешно отправлен")
                 self.file_sent_signal.emit(True, "Файл отправлен успешно")
             else:
@@ -0,0 +1,444 @@
+import os
+import socket
+import hashlib
+import threading
+from collections import namedtuple
+from skey_chain import get_otp
+from compression import CODECS, offer, worth_compressing, send_compressed
+from delta import read_signatures, send_delta
+from protocol import (MSG_HELLO, MSG_USERNAME, MSG_PASSWORD, MSG_CHALLENGE, MSG_RESPONSE,
+                      MSG_COUNTER, MSG_OTP, MSG_AUTH_RESULT, MSG_FILENAME, MSG_FILESIZE,
+                      MSG_READY, MSG_FILE_STATUS, MSG_FILERANGE, MSG_BATCH, MSG_END, MSG_DIGEST,
+                      MSG_COMPRESS, MSG_HAVE, MSG_DELTA, MSG_SIGNATURE,
+                      pack_message, send_message, recv_message, expect_message, send_file_range,
+                      new_digest, file_digest, check_type, set_nodelay, ProtocolError, BUSY_PREFIX)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Файлы не больше этого размера в пакетном режиме отправляются одним
+# вызовом вместе с заголовком, без отдельного sendfile
+INLINE_FILE_SIZE = 64 * 1024
+
+# Итог передачи: успех, итоговый ответ сервера, ответы по файлам пакета
+UploadResult = namedtuple("UploadResult", "success confirmation statuses")
+
+class AuthenticationError(Exception):
+    """Сервер отклонил аутентификацию"""
+
+class ServerBusyError(ConnectionError):
+    """Сервер перегружен и отклонил соединение (ответ BUSY)"""
+
+def _no_log(message):
+    pass
+
+def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """Открывает TCP-соединение с сервером"""
+    sock = socket.create_connection((host, port), timeout)
+    set_nodelay(sock)
+    return sock
+
+def authenticate(sock, protocol, username, password, seed="", log=_no_log):
+    """Проходит аутентификацию по протоколу 1 (PAP), 2 (CHAP) или 3 (S/KEY)
+
+    Для S/KEY password - секретный ключ, из которого вместе с seed
+    вычисляется одноразовый пароль. Возвращает True при успехе. Если
+    сервер перегружен, выбрасывает ServerBusyError.
+    """
+    try:
+        return _authenticate(sock, protocol, username, password, seed, log)
+    except ProtocolError as e:
+        if str(e).startswith(BUSY_PREFIX):
+            raise ServerBusyError(str(e)) from None
+        raise
+
+def _authenticate(sock, protocol, username, password, seed, log):
+    # Все сообщения - отдельные кадры, поэтому отправляются подряд без пауз
+    send_message(sock, MSG_HELLO, str(protocol))
+    log(f"Выбран протокол: {protocol}")
+
+    if protocol == 1:  # PAP
+        send_message(sock, MSG_USERNAME, username)
+        send_message(sock, MSG_PASSWORD, password)
+        log("Данные аутентификации PAP отправлены серверу")
+
+    elif protocol == 2:  # CHAP
+        send_message(sock, MSG_USERNAME, username)
+        log(f"Отправлено имя пользователя: {username}")
+
+        # Получаем случайный challenge от сервера
+        challenge = expect_message(sock, MSG_CHALLENGE)
+        log(f"Получен challenge: {challenge.hex()}")
+
+        # Вычисляем хеш MD5(challenge + password)
+        response = hashlib.md5(challenge + password.encode()).digest()
+        send_message(sock, MSG_RESPONSE, response)
+        log(f"Отправлен ответ CHAP: {response.hex()}")
+
+    elif protocol == 3:  # S/KEY
+        send_message(sock, MSG_USERNAME, username)
+
+        # Получаем текущее значение счетчика; неизвестному пользователю и
+        # при исчерпанной цепочке сервер сразу отвечает отказом
+        msg_type, payload = recv_message(sock)
+        if msg_type == MSG_AUTH_RESULT:
+            log(f"Ответ от сервера: {payload.decode()}")
+            return False
+        count = int(check_type(msg_type, payload, MSG_COUNTER).decode())
+        log(f"Счетчик запросов S/KEY: {count}")
+
+        # Вычисляем одноразовый пароль MD5^count(seed + secret),
+        # начиная с ближайшей контрольной точки из локального кеша цепочки
+        send_message(sock, MSG_OTP, get_otp(seed, password, count))
+        log(f"Отправлен одноразовый пароль для счетчика {count}")
+
+    else:
+        raise ValueError(f"Недопустимый протокол: {protocol}")
+
+    result = expect_message(sock, MSG_AUTH_RESULT).decode()
+    log(f"Ответ от сервера: {result}")
+    return result == "AUTH_SUCCESS"
+
+def open_sessions(count, host, port, protocol, username, password, seed="", timeout=None, log=_no_log):
+    """Открывает count аутентифицированных соединений
+
+    Соединения аутентифицируются по очереди: для S/KEY каждое расходует
+    свой одноразовый пароль, и параллельный вход получил бы один и тот же счетчик.
+    """
+    socks = []
+    try:
+        for _ in range(count):
+            sock = connect(host, port, timeout)
+            socks.append(sock)
+            if not authenticate(sock, protocol, username, password, seed, log):
+                raise AuthenticationError("Аутентификация не удалась")
+    except Exception:
+        for sock in socks:
+            sock.close()
+        raise
+    return socks
+
+def negotiate_compression(sock, file_path, log=_no_log):
+    """Предлагает серверу сжатие, если файл по выборкам хорошо сжимается
+
+    Возвращает согласованный алгоритм или None (передача без сжатия).
+    """
+    preferred = next(iter(CODECS.values()))
+    if not worth_compressing(file_path, preferred):
+        log("Файл плохо сжимается, передаем без сжатия")
+        return None
+    send_message(sock, MSG_COMPRESS, offer())
+    codec = CODECS.get(expect_message(sock, MSG_COMPRESS).decode())
+    log(f"Сжатие: {codec.name}" if codec else "Сервер не поддерживает сжатие")
+    return codec
+
+def upload_file(sock, file_path, progress=None, log=_no_log, compress=False, dedup=True,
+                delta=False, content_hash=None):
+    """Передает файл по аутентифицированному соединению; возвращает ответ сервера
+
+    Если на сервере есть прерванная загрузка этого файла, передача
+    продолжается с сообщенного сервером смещения. progress(смещение)
+    вызывается по мере отправки. После данных отправляется хеш всего
+    файла; при расхождении сервер отвечает FILE_CORRUPTED.
+    При compress=True данные сжимаются, если это выгодно и сервер согласен.
+    При dedup=True вместе с заголовком отправляется хеш содержимого, и если
+    такой файл на сервере уже есть, данные не передаются вовсе.
+    При delta=True и наличии на сервере прежней копии файла передаются
+    только изменившиеся блоки.
+    content_hash - хеш файла, вычисленный заранее (см. upload_hash()).
+    Без него хеш считается здесь, на открытом соединении, и для большого
+    файла сервер может закрыть его по таймауту простоя.
+    """
+    file_name = os.path.basename(file_path)
+    file_size = os.path.getsize(file_path)
+    codec = negotiate_compression(sock, file_path, log) if compress else None
+
+    if content_hash is None and (dedup or delta):
+        content_hash = file_digest(file_path)
+    if dedup:
+        send_message(sock, MSG_HAVE, content_hash)
+    if delta:
+        send_message(sock, MSG_DELTA)
+
+    send_message(sock, MSG_FILENAME, file_name)
+    log(f"Отправлено имя файла: {file_name}")
+    send_message(sock, MSG_FILESIZE, str(file_size))
+    log(f"Отправлен размер файла: {file_size} байт")
+
+    # Сервер сообщает смещение, с которого нужно продолжить прерванную загрузку
+    log("Ожидание сигнала готовности от сервера...")
+    msg_type, payload = recv_message(sock)
+    if msg_type == MSG_FILE_STATUS:
+        # Сервер уже хранит такое содержимое
+        return payload.decode()
+    if msg_type == MSG_SIGNATURE:
+        # На сервере есть прежняя копия - отправляем только отличия от нее
+        block_size, table = read_signatures(payload, lambda: expect_message(sock, MSG_SIGNATURE))
+        log(f"Получены сигнатуры прежней копии: блок {block_size} байт")
+        literal = send_delta(sock, file_path, block_size, table)
+        log(f"Передано изменений: {literal} из {file_size} байт")
+        send_message(sock, MSG_DIGEST, content_hash)
+        if progress is not None:
+            progress(file_size)
+        return expect_message(sock, MSG_FILE_STATUS).decode()
+    if msg_type != MSG_READY:
+        raise ProtocolError(f"Ожидалось сообщение типа {MSG_READY}, получено {msg_type}")
+    offset = int(payload.decode() or 0)
+    if offset:
+        log(f"Продолжаем прерванную загрузку с байта {offset}")
+    else:
+        log("Сервер готов к приему файла")
+
+    # DIGEST - хеш всего файла. Если он уже вычислен для HAVE или DELTA,
+    # второй раз данные не хешируем. При продолжении загрузки передается
+    # только хвост, поэтому хеш всего файла считается отдельно
+    if content_hash is None and offset:
+        content_hash = file_digest(file_path)
+    digest = new_digest() if content_hash is None else None
+    with open(file_path, 'rb') as f:
+        if codec is not None:
+            wire = send_compressed(sock, f, offset, file_size - offset, codec, progress, digest)
+            log(f"Передано {wire} байт сжатых данных вместо {file_size - offset}")
+        else:
+            # sendfile - без копирования данных через Python
+            send_file_range(sock, f, offset, file_size - offset, progress, digest=digest)
+    send_message(sock, MSG_DIGEST, digest.hexdigest() if digest is not None else content_hash)
+
+    return expect_message(sock, MSG_FILE_STATUS).decode()
+
+def upload_hash(paths, streams=1):
+    """Хеш содержимого для Client.upload() или None, если он не нужен
+
+    Хеш нужен при передаче одного файла по одному соединению. Его стоит
+    вычислить до подключения: сервер закрывает соединение, простаивающее
+    дольше своего таймаута, а хеш большого файла считается долго.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    if len(paths) > 1 or os.path.isdir(paths[0]) or streams > 1:
+        return None
+    return file_digest(paths[0])
+
+def split_ranges(size, parts):
+    """Делит size байт на parts непрерывных диапазонов (смещение, длина)"""
+    parts = max(1, min(parts, size)) if size else 1
+    step, extra = divmod(size, parts)
+    ranges = []
+    offset = 0
+    for i in range(parts):
+        length = step + (1 if i < extra else 0)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+def upload_file_parallel(socks, file_path, progress=None, log=_no_log):
+    """Передает файл диапазонами сразу по нескольким аутентифицированным соединениям
+
+    Каждое соединение отправляет FILERANGE перед заголовком файла и свою
+    часть данных. Возвращает итоговый ответ сервера: FILE_RECEIVED от
+    соединения, завершившего сборку, либо первую ошибку.
+    """
+    file_name = os.path.basename(file_path)
+    file_size = os.path.getsize(file_path)
+    ranges = split_ranges(file_size, len(socks))
+    log(f"Параллельная отправка {file_name} ({file_size} байт) по {len(ranges)} соединениям")
+
+    sent = [0] * len(ranges)
+    sent_lock = threading.Lock()
+    statuses = [None] * len(ranges)
+
+    def send_range(index, sock, offset, length):
+        def on_progress(position):
+            with sent_lock:
+                sent[index] = position - offset
+                total = sum(sent)
+            if progress is not None:
+                progress(total)
+
+        try:
+            send_message(sock, MSG_FILERANGE, f"{offset}:{length}")
+            send_message(sock, MSG_FILENAME, file_name)
+            send_message(sock, MSG_FILESIZE, str(file_size))
+            expect_message(sock, MSG_READY)
+            digest = new_digest()
+            with open(file_path, 'rb') as f:
+                send_file_range(sock, f, offset, length, on_progress, digest=digest)
+            send_message(sock, MSG_DIGEST, digest.hexdigest())
+            statuses[index] = expect_message(sock, MSG_FILE_STATUS).decode()
+        except Exception as e:
+            statuses[index] = f"ERROR: {e}"
+
+    threads = [threading.Thread(target=send_range, args=(i, sock, offset, length), daemon=True)
+               for i, (sock, (offset, length)) in enumerate(zip(socks, ranges))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failures = [status for status in statuses if not status.startswith(("FILE_RECEIVED", "RANGE_RECEIVED"))]
+    if failures:
+        return failures[0]
+    return next((status for status in statuses if status.startswith("FILE_RECEIVED")), statuses[-1])
+
+def collect_files(path):
+    """Список (путь, относительное имя) для файла или всех файлов дерева каталогов"""
+    if not os.path.isdir(path):
+        return [(path, os.path.basename(path))]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            full_path = os.path.join(root, name)
+            files.append((full_path, os.path.relpath(full_path, path).replace(os.sep, "/")))
+    return files
+
+def upload_batch(sock, files, progress=None, log=_no_log):
+    """Передает много файлов подряд по одному аутентифицированному соединению
+
+    files - список (путь, имя на сервере). Файлы отправляются без ожидания
+    READY, а подтверждения сервера читаются параллельно в отдельном потоке,
+    поэтому передача не ждет ответа на каждый файл. Возвращает
+    (список ответов по файлам, итоговый ответ сервера).
+    """
+    statuses = []
+    final = []
+
+    def read_acks():
+        try:
+            for _ in files:
+                statuses.append(expect_message(sock, MSG_FILE_STATUS).decode())
+            final.append(expect_message(sock, MSG_FILE_STATUS).decode())
+        except Exception as e:
+            final.append(f"ERROR: {e}")
+
+    reader = threading.Thread(target=read_acks, daemon=True)
+    send_message(sock, MSG_BATCH)
+    reader.start()
+    log(f"Пакетная отправка {len(files)} файлов")
+
+    sent = 0
+    for path, name in files:
+        size = os.path.getsize(path)
+        header = pack_message(MSG_FILENAME, name) + pack_message(MSG_FILESIZE, str(size))
+        if size <= INLINE_FILE_SIZE:
+            # Маленький файл уходит вместе с заголовком и контрольной суммой
+            # одним системным вызовом
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = new_digest()
+            digest.update(data)
+            sock.sendall(header + data + pack_message(MSG_DIGEST, digest.hexdigest()))
+        else:
+            sock.sendall(header)
+            digest = new_digest()
+            with open(path, 'rb') as f:
+                send_file_range(sock, f, 0, size, digest=digest)
+            send_message(sock, MSG_DIGEST, digest.hexdigest())
+        sent += size
+        if progress is not None:
+            progress(sent)
+    send_message(sock, MSG_END)
+
+    reader.join()
+    return statuses, final[0] if final else "ERROR: нет ответа сервера"
+
+def collect_paths(paths):
+    """Список (путь, имя на сервере) для нескольких файлов и каталогов
+
+    Один каталог передается своим содержимым, как collect_files; при
+    нескольких путях файлы каталога получают его имя префиксом.
+    """
+    if len(paths) == 1:
+        return collect_files(paths[0])
+    files = []
+    for path in paths:
+        prefix = os.path.basename(os.path.normpath(path)) + "/" if os.path.isdir(path) else ""
+        files.extend((full_path, prefix + name) for full_path, name in collect_files(path))
+    return files
+
+class Client:
+    """Клиент сервера: подключение, аутентификация и передача файлов
+
+    Используется консольным клиентом и ClientGUI. Сервер обслуживает
+    одну передачу (файл или пакет файлов) на аутентифицированное
+    соединение.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None, log=_no_log):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.log = log
+        self.sock = None
+        self.credentials = None
+
+    @property
+    def authenticated(self):
+        return self.credentials is not None
+
+    def connect(self):
+        self.sock = connect(self.host, self.port, self.timeout)
+        return self
+
+    def authenticate(self, protocol, username, password, seed=""):
+        """Аутентификация на открытом соединении; возвращает True при успехе"""
+        if authenticate(self.sock, protocol, username, password, seed, self.log):
+            # Учетные данные нужны для дополнительных соединений параллельной передачи
+            self.credentials = (protocol, username, password, seed)
+            return True
+        return False
+
+    def login(self, protocol, username, password, seed=""):
+        """Подключается и проходит аутентификацию; при отказе - AuthenticationError"""
+        self.connect()
+        if not self.authenticate(protocol, username, password, seed):
+            self.close()
+            raise AuthenticationError("Аутентификация не удалась")
+        return self
+
+    def upload(self, paths, streams=1, compress=False, delta=False, progress=None, content_hash=None):
+        """Передает файл или каталоги/несколько файлов пакетом
+
+        paths - путь или список путей. progress(отправлено, всего) вызывается
+        по мере передачи. content_hash - результат upload_hash(), вычисленный
+        до login(). Возвращает UploadResult.
+        """
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        batch = len(paths) > 1 or os.path.isdir(paths[0])
+        files = collect_paths(paths) if batch else None
+        total = sum(os.path.getsize(path) for path, _ in files) if batch else os.path.getsize(paths[0])
+        report = (lambda sent: progress(sent, total)) if progress is not None else None
+
+        if batch:
+            statuses, confirmation = upload_batch(self.sock, files, report, self.log)
+            success = (confirmation.startswith("BATCH_DONE")
+                       and all(status.startswith("FILE_RECEIVED") for status in statuses))
+            return UploadResult(success, confirmation, statuses)
+
+        if streams > 1:
+            # Текущее соединение передает первый диапазон, для остальных
+            # открываем и аутентифицируем дополнительные соединения
+            extra = open_sessions(streams - 1, self.host, self.port, *self.credentials,
+                                  timeout=self.timeout, log=self.log)
+            try:
+                confirmation = upload_file_parallel([self.sock] + extra, paths[0], report, self.log)
+            finally:
+                for sock in extra:
+                    sock.close()
+        else:
+            confirmation = upload_file(self.sock, paths[0], report, self.log,
+                                       compress=compress, delta=delta, content_hash=content_hash)
+        return UploadResult("FILE_RECEIVED" in confirmation, confirmation, [confirmation])
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.credentials = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,176 @@
+import os
+import zlib
+import lzma
+from protocol import MAX_PAYLOAD, MSG_DATA, ProtocolError, pack_message
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Порция файла, которая сжимается за один вызов компрессора
+COMPRESS_CHUNK = 256 * 1024
+
+# Параметры оценки сжимаемости: несколько равномерно разнесенных выборок
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 4
+# Если выборки сжимаются хуже этого отношения (уже сжатые архивы, видео,
+# изображения), файл передается без сжатия
+COMPRESS_THRESHOLD = 0.9
+
+# Наибольшая порция, распаковываемая за один шаг: объем памяти на распаковку
+# не зависит от степени сжатия присланных данных
+INFLATE_CHUNK = 256 * 1024
+
+class Codec:
+    """Алгоритм потокового сжатия
+
+    compressor() создает компрессор. inflater(write) создает функцию
+    feed(данные), которая распаковывает очередную порцию сжатого потока и
+    передает результат в write() кусками не больше INFLATE_CHUNK.
+    """
+
+    def __init__(self, name, compressor, inflater):
+        self.name = name
+        self.compressor = compressor
+        self.inflater = inflater
+
+def _zlib_inflater(write):
+    decompressor = zlib.decompressobj()
+
+    def feed(data):
+        while True:
+            out = decompressor.decompress(data, INFLATE_CHUNK)
+            # Вход, не поместившийся в порцию, ждет в unconsumed_tail
+            data = decompressor.unconsumed_tail
+            if not out and not data:
+                return
+            write(out)
+    return feed
+
+def _lzma_inflater(write):
+    decompressor = lzma.LZMADecompressor()
+
+    def feed(data):
+        while not decompressor.eof:
+            out = decompressor.decompress(data, INFLATE_CHUNK)
+            data = b""
+            if out:
+                write(out)
+            if decompressor.needs_input:
+                return
+    return feed
+
+class _Sink:
+    """Приемник для zstandard.stream_writer: каждую порцию передает в write"""
+
+    def __init__(self, write):
+        self.write = write
+
+def _zstd_inflater(write):
+    # stream_writer отдает вывод порциями write_size по мере распаковки
+    writer = zstandard.ZstdDecompressor().stream_writer(_Sink(write), write_size=INFLATE_CHUNK)
+    return writer.write
+
+def _available_codecs():
+    codecs = []
+    if zstandard is not None:
+        codecs.append(Codec("zstd", lambda: zstandard.ZstdCompressor(level=3).compressobj(), _zstd_inflater))
+    codecs.append(Codec("zlib", lambda: zlib.compressobj(6), _zlib_inflater))
+    codecs.append(Codec("lzma", lambda: lzma.LZMACompressor(preset=1), _lzma_inflater))
+    return codecs
+
+# Доступные алгоритмы в порядке предпочтения
+CODECS = {codec.name: codec for codec in _available_codecs()}
+
+def offer():
+    """Список алгоритмов, предлагаемых собеседнику, через запятую"""
+    return ",".join(CODECS)
+
+def choose_codec(offered):
+    """Выбирает первый из предложенных алгоритмов, поддерживаемый здесь, или None"""
+    for name in offered.split(","):
+        codec = CODECS.get(name.strip())
+        if codec is not None:
+            return codec
+    return None
+
+def sample_ratio(path, codec, sample_size=SAMPLE_SIZE, samples=SAMPLE_COUNT):
+    """Оценивает степень сжатия файла по нескольким выборкам из разных его частей"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 1.0
+    step = max(size // samples, sample_size)
+    original = compressed = 0
+    with open(path, 'rb') as f:
+        for offset in range(0, size, step):
+            f.seek(offset)
+            data = f.read(sample_size)
+            compressor = codec.compressor()
+            original += len(data)
+            compressed += len(compressor.compress(data)) + len(compressor.flush())
+    return compressed / original
+
+def worth_compressing(path, codec, threshold=COMPRESS_THRESHOLD):
+    """True, если по выборкам сжатие заметно уменьшает объем передачи"""
+    return sample_ratio(path, codec) < threshold
+
+def _frames(data):
+    # Сжатый вывод может быть больше MAX_PAYLOAD - режем на несколько кадров
+    return b"".join(pack_message(MSG_DATA, data[i:i + MAX_PAYLOAD])
+                    for i in range(0, len(data), MAX_PAYLOAD))
+
+def send_compressed(sock, f, offset, count, codec, progress=None, digest=None):
+    """Сжимает count байт файла f с offset по порциям и отправляет кадрами DATA
+
+    Конец данных обозначается пустым кадром DATA. progress(смещение)
+    вызывается после каждой порции, digest обновляется исходными данными.
+    Возвращает число байт сжатого потока.
+    """
+    compressor = codec.compressor()
+    buffer = bytearray(COMPRESS_CHUNK)
+    view = memoryview(buffer)
+    f.seek(offset)
+    end = offset + count
+    sent = 0
+    while offset < end:
+        n = f.readinto(view[:min(len(view), end - offset)])
+        if n == 0:
+            raise ConnectionError("Файл закончился раньше ожидаемого размера")
+        if digest is not None:
+            digest.update(view[:n])
+        out = compressor.compress(view[:n])
+        if out:
+            sock.sendall(_frames(out))
+            sent += len(out)
+        offset += n
+        if progress is not None:
+            progress(offset)
+    out = compressor.flush()
+    sock.sendall(_frames(out) + pack_message(MSG_DATA))
+    return sent + len(out)
+
+class Inflater:
+    """Распаковка потока с проверкой, что данных не больше ожидаемого размера
+
+    Размер проверяется перед записью каждой порции, поэтому сильно сжатые
+    данные не распаковываются в память целиком.
+    """
+
+    def __init__(self, codec, f, size, digest):
+        self.f = f
+        self.size = size
+        self.digest = digest
+        self.received = 0
+        self._feed = codec.inflater(self._write)
+
+    def feed(self, payload):
+        self._feed(payload)
+
+    def _write(self, data):
+        if self.received + len(data) > self.size:
+            raise ProtocolError("Распакованные данные превышают размер файла")
+        self.f.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.received += len(data)
@@ -0,0 +1,206 @@
+import time
+import queue
+import socket
+import selectors
+import threading
+import traceback
+from protocol import MSG_ERROR, BUSY_PREFIX, pack_message
+from metrics import PENDING_CONNECTIONS
+
+# Допуск соединений для многопоточного сервера: фиксированное число
+# потоков-обработчиков и ограниченная очередь ожидающих соединений. При
+# переполнении очереди или превышении лимита соединений с одного адреса
+# клиент сразу получает короткий ответ BUSY, а память сервера не растет.
+
+# Потоков-обработчиков по умолчанию
+DEFAULT_WORKERS = 64
+# Соединений, ожидающих свободного обработчика
+DEFAULT_QUEUE_SIZE = 256
+# Одновременных соединений (обслуживаемых и ожидающих) с одного IP-адреса
+DEFAULT_MAX_PER_IP = 32
+
+# Причины отказа (значение метки reason в метриках)
+REJECT_BUSY = "busy"
+REJECT_PER_IP = "per_ip"
+
+# Сколько ждать, пока отклоненный клиент прочитает ответ BUSY, с
+REJECT_LINGER = 1.0
+# Наибольшее число отклоненных соединений, ожидающих закрытия клиентом
+MAX_LINGERING = 1024
+# Период проверки сроков ожидания отклоненных соединений, с
+LINGER_POLL = 0.1
+
+BUSY_REPLY = {
+    REJECT_BUSY: f"{BUSY_PREFIX}: Сервер перегружен, повторите попытку позже",
+    REJECT_PER_IP: f"{BUSY_PREFIX}: Слишком много соединений с вашего адреса",
+}
+
+class _Lingerer:
+    """Фоновый поток, дочитывающий отклоненные соединения
+
+    Закрытие сокета с непрочитанными данными отправляет клиенту RST, и
+    ответ BUSY может потеряться. Поэтому после ответа соединение еще до
+    REJECT_LINGER секунд читается здесь, пока клиент не закроет его сам.
+    """
+
+    def __init__(self, timeout=REJECT_LINGER, limit=MAX_LINGERING):
+        self.timeout = timeout
+        self.limit = limit
+        self._incoming = queue.Queue()
+        self._selector = selectors.DefaultSelector()
+        self._deadlines = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, client_socket):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="reject-linger", daemon=True)
+                self._thread.start()
+        self._incoming.put(client_socket)
+
+    def _close(self, client_socket):
+        self._selector.unregister(client_socket)
+        del self._deadlines[client_socket]
+        client_socket.close()
+
+    def _accept(self, client_socket):
+        if len(self._deadlines) >= self.limit:
+            client_socket.close()
+            return
+        self._selector.register(client_socket, selectors.EVENT_READ)
+        self._deadlines[client_socket] = time.monotonic() + self.timeout
+
+    def _run(self):
+        while True:
+            if not self._deadlines:
+                # Ждать нечего: спим до следующего отклоненного соединения
+                self._accept(self._incoming.get())
+            while not self._incoming.empty():
+                self._accept(self._incoming.get_nowait())
+            for key, _ in self._selector.select(LINGER_POLL):
+                try:
+                    if key.fileobj.recv(65536):
+                        continue
+                except OSError:
+                    pass
+                self._close(key.fileobj)
+            now = time.monotonic()
+            for client_socket, deadline in list(self._deadlines.items()):
+                if deadline <= now:
+                    self._close(client_socket)
+
+_lingerer = _Lingerer()
+
+def reject(client_socket, reason):
+    """Отправляет кадр BUSY и закрывает соединение, не блокируя принимающий поток"""
+    try:
+        client_socket.setblocking(False)
+        client_socket.send(pack_message(MSG_ERROR, BUSY_REPLY[reason]))
+        client_socket.shutdown(socket.SHUT_WR)
+    except OSError:
+        client_socket.close()
+        return
+    _lingerer.add(client_socket)
+
+class AddressLimiter:
+    """Счетчик одновременных соединений по IP-адресам; max_per_ip=0 - без лимита"""
+
+    def __init__(self, max_per_ip=DEFAULT_MAX_PER_IP):
+        self.max_per_ip = max_per_ip
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, ip):
+        """Учитывает соединение; False, если лимит для адреса исчерпан"""
+        with self._lock:
+            count = self._counts.get(ip, 0)
+            if self.max_per_ip and count >= self.max_per_ip:
+                return False
+            self._counts[ip] = count + 1
+            return True
+
+    def release(self, ip):
+        with self._lock:
+            count = self._counts[ip] - 1
+            if count:
+                self._counts[ip] = count
+            else:
+                del self._counts[ip]
+
+class ConnectionPool:
+    """Обработка соединений фиксированным числом потоков
+
+    handler(client_socket, addr) вызывается в потоке пула и сам закрывает
+    сокет. submit() вызывается из одного принимающего потока и не
+    блокируется: если соединение принять нельзя, оно отклоняется и submit
+    возвращает причину отказа.
+    """
+
+    def __init__(self, handler, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_per_ip=DEFAULT_MAX_PER_IP):
+        self.handler = handler
+        self.limiter = AddressLimiter(max_per_ip)
+        self.queue_size = queue_size
+        self.workers = workers
+        self._busy = 0
+        # Размер очереди ограничивает submit(): сигналы остановки в close()
+        # должны помещаться в нее всегда
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"conn-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, client_socket, addr):
+        """Ставит соединение в очередь; при отказе отвечает BUSY и возвращает причину"""
+        ip = addr[0]
+        if not self.limiter.acquire(ip):
+            reject(client_socket, REJECT_PER_IP)
+            return REJECT_PER_IP
+        # Сверх свободных потоков ждать могут не больше queue_size соединений
+        if self._queue.qsize() >= self.queue_size + self.workers - self._busy:
+            self.limiter.release(ip)
+            reject(client_socket, REJECT_BUSY)
+            return REJECT_BUSY
+        PENDING_CONNECTIONS.inc()
+        self._queue.put((client_socket, addr))
+        return None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            PENDING_CONNECTIONS.dec()
+            client_socket, addr = item
+            with self._lock:
+                self._busy += 1
+            try:
+                self.handler(client_socket, addr)
+            except Exception:
+                # Ошибка обработчика не должна уменьшать число потоков пула
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                self.limiter.release(addr[0])
+
+    def close(self):
+        """Закрывает ожидающие соединения и останавливает потоки после текущих сессий"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                PENDING_CONNECTIONS.dec()
+                item[0].close()
+                self.limiter.release(item[1][0])
+        for _ in self._threads:
+            self._queue.put(None)
@@ -0,0 +1,301 @@
+import csv
+import time
+import queue
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import SKEY_LOCK_WAIT, CREDENTIAL_CACHE
+from skey_init import load_db
+from passhash import add_hash_arguments, hash_from_arguments
+
+# Хранилища учетных записей. Все реализуют один набор методов:
+#   get_password(username) -> пароль или None
+#   skey_get(username) -> {"seed", "count", "last"} или None
+#   skey_consume(username, count, otp) -> True, если пароль принят
+#       (при count < 1 цепочка исчерпана и пароль не принимается)
+#   set_password(username, password), set_skey(username, entry)
+#   import_passwords(rows), import_skey(rows), is_empty(), close()
+
+# Наибольшее число соединений SQLite, остающихся открытыми в пуле
+DEFAULT_POOL_SIZE = 8
+# Емкость кеша учетных записей по умолчанию
+DEFAULT_CACHE_SIZE = 100000
+# Сколько ждать освобождения базы другим процессом, с
+BUSY_TIMEOUT = 5.0
+
+def skey_verify(entry, otp):
+    """Проверка одноразового пароля: MD5(otp) должен совпасть с последним принятым"""
+    return hashlib.md5(otp).digest() == entry["last"]
+
+class MemoryStore:
+    """Учетные записи в словарях процесса; состояние теряется при перезапуске"""
+
+    def __init__(self, users=None, skey_db=None):
+        self.users = dict(users or {})
+        self.skey_db = dict(skey_db or {})
+        # Блокировка защищает только чтение и изменение skey_db и никогда не
+        # удерживается во время сетевого обмена с клиентом
+        self.skey_lock = threading.Lock()
+
+    @contextmanager
+    def _skey_locked(self):
+        start = time.perf_counter()
+        with self.skey_lock:
+            SKEY_LOCK_WAIT.observe(time.perf_counter() - start)
+            yield
+
+    def get_password(self, username):
+        return self.users.get(username)
+
+    def skey_get(self, username):
+        with self._skey_locked():
+            entry = self.skey_db.get(username)
+            return dict(entry) if entry is not None else None
+
+    def skey_consume(self, username, count, otp):
+        """Проверяет пароль и атомарно уменьшает счетчик, если он все еще равен count
+
+        Проверка - один вызов MD5, поэтому выполняется прямо под блокировкой.
+        """
+        with self._skey_locked():
+            entry = self.skey_db.get(username)
+            if entry is None or count < 1 or entry["count"] != count or not skey_verify(entry, otp):
+                return False
+            entry["last"] = otp
+            entry["count"] -= 1
+            return True
+
+    def set_password(self, username, password):
+        self.users[username] = password
+
+    def set_skey(self, username, entry):
+        with self._skey_locked():
+            self.skey_db[username] = dict(entry)
+
+    def import_passwords(self, rows):
+        self.users.update(rows)
+
+    def import_skey(self, rows):
+        with self._skey_locked():
+            self.skey_db.update((name, dict(entry)) for name, entry in rows)
+
+    def is_empty(self):
+        return not self.users and not self.skey_db
+
+    def close(self):
+        pass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS skey (
+    username TEXT PRIMARY KEY,
+    seed TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    last BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+class SQLiteStore:
+    """Учетные записи в SQLite (журнал WAL)
+
+    Поиск идет по первичному ключу username. Счетчики S/KEY меняются в
+    транзакции с проверкой текущего значения, поэтому состояние переживает
+    перезапуск и остается согласованным при нескольких процессах сервера
+    на одной базе. Соединения берутся из небольшого пула: поток на
+    соединение не открывает базу заново для каждого клиента.
+    """
+
+    def __init__(self, path, pool_size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self._pool = queue.LifoQueue(pool_size)
+        with self._connection() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                             check_same_thread=False)
+        # В режиме WAL фиксация без fsync на каждую транзакцию остается
+        # устойчивой к сбою процесса; при сбое ОС теряются лишь последние изменения
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _connection(self):
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            db = self._connect()
+        try:
+            yield db
+        finally:
+            try:
+                self._pool.put_nowait(db)
+            except queue.Full:
+                db.close()
+
+    def get_password(self, username):
+        with self._connection() as db:
+            row = db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def skey_get(self, username):
+        with self._connection() as db:
+            row = db.execute("SELECT seed, count, last FROM skey WHERE username = ?", (username,)).fetchone()
+        return {"seed": row[0], "count": row[1], "last": row[2]} if row else None
+
+    def skey_consume(self, username, count, otp):
+        if count < 1:
+            return False
+        with self._connection() as db:
+            # BEGIN IMMEDIATE сразу берет блокировку записи: между чтением и
+            # обновлением счетчик не изменит другое соединение или процесс
+            start = time.perf_counter()
+            db.execute("BEGIN IMMEDIATE")
+            SKEY_LOCK_WAIT.observe(time.perf_counter() - start)
+            try:
+                row = db.execute("SELECT count, last FROM skey WHERE username = ?", (username,)).fetchone()
+                if row is None or row[0] != count or not skey_verify({"last": row[1]}, otp):
+                    db.execute("ROLLBACK")
+                    return False
+                db.execute("UPDATE skey SET count = count - 1, last = ? WHERE username = ?", (otp, username))
+                db.execute("COMMIT")
+                return True
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def set_password(self, username, password):
+        self.import_passwords([(username, password)])
+
+    def set_skey(self, username, entry):
+        self.import_skey([(username, entry)])
+
+    def import_passwords(self, rows):
+        """Добавляет или заменяет пароли (username, password) одной транзакцией"""
+        with self._connection() as db:
+            db.execute("BEGIN")
+            db.executemany("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", rows)
+            db.execute("COMMIT")
+
+    def import_skey(self, rows):
+        """Добавляет или заменяет записи S/KEY (username, entry) одной транзакцией"""
+        with self._connection() as db:
+            db.execute("BEGIN")
+            db.executemany("INSERT OR REPLACE INTO skey (username, seed, count, last) VALUES (?, ?, ?, ?)",
+                           ((name, e["seed"], e["count"], e["last"]) for name, e in rows))
+            db.execute("COMMIT")
+
+    def is_empty(self):
+        with self._connection() as db:
+            return (db.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+                    and db.execute("SELECT 1 FROM skey LIMIT 1").fetchone() is None)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+class CachedStore:
+    """Ограниченный LRU-кеш паролей перед другим хранилищем
+
+    Кешируются только пароли PAP/CHAP: они меняются редко. Состояние S/KEY
+    каждый раз читается из хранилища, иначе несколько процессов сервера
+    видели бы устаревший счетчик.
+    """
+
+    def __init__(self, backend, capacity=DEFAULT_CACHE_SIZE):
+        self.backend = backend
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_password(self, username):
+        with self._lock:
+            password = self._cache.get(username)
+            if password is not None:
+                self._cache.move_to_end(username)
+        if password is not None:
+            CREDENTIAL_CACHE.inc(result="hit")
+            return password
+        CREDENTIAL_CACHE.inc(result="miss")
+        password = self.backend.get_password(username)
+        if password is not None:
+            with self._lock:
+                self._cache[username] = password
+                self._cache.move_to_end(username)
+                if len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+        return password
+
+    def _forget(self, usernames):
+        with self._lock:
+            for username in usernames:
+                self._cache.pop(username, None)
+
+    def set_password(self, username, password):
+        self.backend.set_password(username, password)
+        self._forget([username])
+
+    def import_passwords(self, rows):
+        rows = list(rows)
+        self.backend.import_passwords(rows)
+        self._forget(name for name, _ in rows)
+
+    def skey_get(self, username):
+        return self.backend.skey_get(username)
+
+    def skey_consume(self, username, count, otp):
+        return self.backend.skey_consume(username, count, otp)
+
+    def set_skey(self, username, entry):
+        self.backend.set_skey(username, entry)
+
+    def import_skey(self, rows):
+        self.backend.import_skey(rows)
+
+    def is_empty(self):
+        return self.backend.is_empty()
+
+    def close(self):
+        self.backend.close()
+
+def read_password_rows(path):
+    """Пароли из CSV с полями username,password (читается потоком)"""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row["username"], row["password"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт учетных записей в базу SQLite сервера")
+    parser.add_argument("database", help="файл базы учетных записей")
+    parser.add_argument("--users", help="CSV с полями username,password")
+    parser.add_argument("--skey", help="база S/KEY в JSON, подготовленная skey_init.py")
+    add_hash_arguments(parser)
+    args = parser.parse_args(argv)
+
+    store = SQLiteStore(args.database)
+    try:
+        if args.users:
+            start = time.perf_counter()
+            rows = hash_from_arguments(read_password_rows(args.users), args)
+            store.import_passwords(rows)
+            print(f"[БАЗА] Импортировано паролей: {len(rows)} за {time.perf_counter() - start:.1f} с")
+        if args.skey:
+            start = time.perf_counter()
+            entries = load_db(args.skey)
+            store.import_skey(entries.items())
+            print(f"[БАЗА] Импортировано записей S/KEY: {len(entries)} за {time.perf_counter() - start:.1f} с")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
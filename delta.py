@@ -0,0 +1,200 @@
+import mmap
+import zlib
+import struct
+import hashlib
+from math import isqrt
+from protocol import MAX_PAYLOAD, MSG_SIGNATURE, MSG_COPY, MSG_DATA, ProtocolError, pack_message
+
+# Границы размера блока; сам размер выбирается около корня из размера файла,
+# как в rsync: чем больше файл, тем меньше доля сигнатур в передаче
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 64 * 1024
+
+# Заголовок сигнатур (размер блока, число блоков) и одна сигнатура блока
+SIGNATURE_HEADER = struct.Struct(">IQ")
+SIGNATURE_ENTRY = struct.Struct(">I16s")
+# Инструкция копирования: номер первого блока и число блоков подряд
+COPY_ENTRY = struct.Struct(">QI")
+
+# Порция чтения при копировании блоков из имеющейся копии
+COPY_CHUNK = 1024 * 1024
+
+# Модуль Adler-32
+_ADLER_MOD = 65521
+
+def block_size_for(size):
+    """Размер блока для файла размером size"""
+    return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, isqrt(size) & ~7))
+
+def _strong(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def signature_frames(path, block_size):
+    """Кадры SIGNATURE с сигнатурами всех полных блоков файла
+
+    Слабая сумма - Adler-32 (допускает скользящее обновление), сильная -
+    BLAKE2b-128 для подтверждения совпадения.
+    """
+    entries = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if len(block) < block_size:
+                break
+            entries.append(SIGNATURE_ENTRY.pack(zlib.adler32(block), _strong(block)))
+    frames = [pack_message(MSG_SIGNATURE, SIGNATURE_HEADER.pack(block_size, len(entries)))]
+    per_frame = MAX_PAYLOAD // SIGNATURE_ENTRY.size
+    for i in range(0, len(entries), per_frame):
+        frames.append(pack_message(MSG_SIGNATURE, b"".join(entries[i:i + per_frame])))
+    return b"".join(frames)
+
+def read_signatures(first_payload, recv):
+    """Разбирает сигнатуры; recv() возвращает полезную нагрузку следующего кадра SIGNATURE
+
+    Возвращает (размер блока, {слабая сумма: {сильная сумма: номер блока}}).
+    """
+    block_size, count = SIGNATURE_HEADER.unpack(first_payload)
+    table = {}
+    index = 0
+    while index < count:
+        payload = recv()
+        for weak, strong in SIGNATURE_ENTRY.iter_unpack(payload):
+            table.setdefault(weak, {}).setdefault(strong, index)
+            index += 1
+    return block_size, table
+
+def compute_delta(path, block_size, table):
+    """Инструкции для получения файла path из копии с сигнатурами table
+
+    Выдает ("copy", первый блок, число блоков) и ("data", срез байт).
+    После несовпадения окно сдвигается по одному байту со скользящей суммой,
+    но не дальше двух блоков подряд: дальше проверяются только позиции с
+    шагом в блок (на них сумма считается в C), чтобы полностью измененный
+    файл не разбирался побайтно в Python.
+    """
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size < block_size or not table:
+            if size:
+                yield ("data", 0, size)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield from _scan(m, size, block_size, table)
+
+def _scan(m, size, block_size, table):
+    pos = 0
+    literal_start = 0
+    copy_start = copy_count = 0
+    roll_budget = 2 * block_size
+    weak = None
+    while pos + block_size <= size:
+        if weak is None:
+            weak = zlib.adler32(m[pos:pos + block_size])
+            a, b = weak & 0xffff, weak >> 16
+        candidates = table.get(weak)
+        index = None
+        if candidates is not None:
+            index = candidates.get(_strong(m[pos:pos + block_size]))
+        if index is not None:
+            if literal_start < pos:
+                if copy_count:
+                    yield ("copy", copy_start, copy_count)
+                    copy_count = 0
+                yield ("data", literal_start, pos)
+            if copy_count and copy_start + copy_count == index:
+                copy_count += 1
+            else:
+                if copy_count:
+                    yield ("copy", copy_start, copy_count)
+                copy_start, copy_count = index, 1
+            pos += block_size
+            literal_start = pos
+            roll_budget = 2 * block_size
+            weak = None
+        elif roll_budget > 0 and pos + block_size < size:
+            # Скользящее обновление Adler-32: убираем байт слева, добавляем справа
+            out_byte, in_byte = m[pos], m[pos + block_size]
+            a = (a - out_byte + in_byte) % _ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+            weak = (b << 16) | a
+            pos += 1
+            roll_budget -= 1
+        else:
+            pos += block_size
+            weak = None
+    if copy_count and literal_start < size:
+        yield ("copy", copy_start, copy_count)
+        copy_count = 0
+    if literal_start < size:
+        yield ("data", literal_start, size)
+    if copy_count:
+        yield ("copy", copy_start, copy_count)
+
+def send_delta(sock, path, block_size, table):
+    """Отправляет разницу кадрами COPY и DATA, завершая пустым DATA
+
+    Возвращает число байт, переданных как есть (не найденных в копии).
+    """
+    literal = 0
+    with open(path, 'rb') as f:
+        for op in compute_delta(path, block_size, table):
+            if op[0] == "copy":
+                sock.sendall(pack_message(MSG_COPY, COPY_ENTRY.pack(op[1], op[2])))
+                continue
+            start, end = op[1], op[2]
+            literal += end - start
+            f.seek(start)
+            while start < end:
+                chunk = f.read(min(MAX_PAYLOAD, end - start))
+                sock.sendall(pack_message(MSG_DATA, chunk))
+                start += len(chunk)
+    sock.sendall(pack_message(MSG_DATA))
+    return literal
+
+class DeltaWriter:
+    """Собирает новый файл из блоков имеющейся копии и присланных данных"""
+
+    def __init__(self, basis, out, block_size, size, digest=None):
+        self.basis = basis
+        self.out = out
+        self.block_size = block_size
+        self.size = size
+        self.blocks = basis.seek(0, 2) // block_size
+        self.digest = digest
+        self.written = 0
+        self.literal = 0
+
+    def _reserve(self, length):
+        # Проверка до записи: иначе COPY одних и тех же блоков наращивал бы
+        # файл без ограничения
+        if self.written + length > self.size:
+            raise ProtocolError("Собранные данные превышают размер файла")
+
+    def _write(self, data):
+        self.out.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.written += len(data)
+
+    def apply(self, msg_type, payload):
+        """Применяет один кадр; возвращает False на завершающем пустом DATA"""
+        if msg_type == MSG_DATA:
+            if not payload:
+                return False
+            self._reserve(len(payload))
+            self._write(payload)
+            self.literal += len(payload)
+        elif msg_type == MSG_COPY:
+            start, count = COPY_ENTRY.unpack(payload)
+            if start + count > self.blocks:
+                raise ProtocolError(f"Блоки {start}+{count} вне имеющейся копии")
+            self._reserve(count * self.block_size)
+            self.basis.seek(start * self.block_size)
+            remaining = count * self.block_size
+            while remaining:
+                data = self.basis.read(min(COPY_CHUNK, remaining))
+                self._write(data)
+                remaining -= len(data)
+        else:
+            raise ProtocolError(f"Ожидались данные дельта-передачи, получено сообщение {msg_type}")
+        return True
@@ -0,0 +1,588 @@
+import os
+import time
+import asyncio
+import secrets
+from collections import namedtuple
+import accounts
+from asynclog import DEBUG, INFO, WARNING
+from metrics import AUTH_DURATION, AUTH_RESULTS, BYTES_RECEIVED, TRANSFER_THROUGHPUT
+from storage import PartialUpload, RangedUpload, ContentStore, PART_SUFFIX, safe_join
+from compression import Inflater, choose_codec
+from delta import DeltaWriter, block_size_for, signature_frames
+from protocol import (HEADER, MSG_HELLO, MSG_USERNAME, MSG_PASSWORD,
+                      MSG_CHALLENGE, MSG_RESPONSE, MSG_COUNTER, MSG_OTP, MSG_AUTH_RESULT,
+                      MSG_FILENAME, MSG_FILESIZE, MSG_READY, MSG_FILE_STATUS, MSG_ERROR,
+                      MSG_FILERANGE, MSG_BATCH, MSG_END, MSG_DIGEST, MSG_COMPRESS, MSG_DATA,
+                      MSG_HAVE, MSG_DELTA, LEGACY_REJECT, RECV_BUFFER_SIZE, ProtocolError,
+                      VersionMismatch, check_version, parse_header, check_type, parse_range, pack_message,
+                      new_digest, file_digest, recv_exact, recv_into_file)
+
+# Ядро серверной стороны протокола. Сессия описана один раз как генератор,
+# который не выполняет ввод-вывод сам, а выдает запросы драйверу: блокирующему
+# сокету (serve_socket) или потокам asyncio (serve_stream). Поэтому server.py
+# в обоих режимах и ServerGUI используют один и тот же код протокола.
+
+# Запросы ввода-вывода, которые сессия передает драйверу
+RecvExact = namedtuple("RecvExact", "size")                        # -> bytes
+Send = namedtuple("Send", "data flush")                            # -> None
+RecvFile = namedtuple("RecvFile", "f size digest progress")        # -> число принятых байт
+Offload = namedtuple("Offload", "func args")                       # -> результат func(*args)
+
+# Состояния сессии
+STATE_HELLO = "hello"          # ожидание выбора протокола
+STATE_AUTH = "auth"            # аутентификация
+STATE_REQUEST = "request"      # ожидание заголовка файла или пакета
+STATE_TRANSFER = "transfer"    # прием данных
+STATE_DONE = "done"            # сессия завершена
+
+# Имена протоколов аутентификации в метриках
+PROTOCOL_NAMES = {1: "pap", 2: "chap", 3: "skey"}
+
+# Суффикс файла, собираемого из изменений и имеющейся копии
+DELTA_SUFFIX = ".delta"
+
+# Необязательные кадры, которые могут предшествовать FILENAME
+REQUEST_PREFIX = (MSG_FILERANGE, MSG_HAVE, MSG_DELTA)
+
+class ServerEvents:
+    """Обработчики событий сессии; по умолчанию ничего не делают
+
+    CLI-сервер печатает сообщения в консоль, ServerGUI выводит их и
+    прогресс приема в окно журнала. Вызываются прямо из обработчика
+    соединения, поэтому не должны ждать вывода (см. asynclog).
+    """
+
+    def log(self, message, level=INFO):
+        pass
+
+    def state_changed(self, session, state):
+        pass
+
+    def progress(self, session, received, total):
+        pass
+
+class ServerSession:
+    """Одна сессия сервера: аутентификация и прием файлов
+
+    run() - генератор: он выдает запросы RecvExact/Send/RecvFile/Offload и
+    получает обратно их результат. Текущее состояние доступно в state.
+    """
+
+    def __init__(self, addr, save_dir, events=None, store=None):
+        self.addr = addr
+        self.save_dir = save_dir
+        self.events = events or ServerEvents()
+        self.store = store or ContentStore(save_dir)
+        self.state = None
+        self.username = None
+        self.filename = None
+        self.transfer_started = None
+        # Байты, принятые драйвером из сети за сессию
+        self.bytes_received = 0
+        self._transfer_base = 0
+        self._bytes_reported = 0
+
+    def report_bytes(self):
+        """Переносит принятые с прошлого вызова байты в общий счетчик метрик"""
+        BYTES_RECEIVED.inc(self.bytes_received - self._bytes_reported)
+        self._bytes_reported = self.bytes_received
+
+    def _set_state(self, state):
+        self.report_bytes()
+        now = time.monotonic()
+        if self.state == STATE_TRANSFER and state != STATE_TRANSFER:
+            # Передачи без данных (содержимое уже было на сервере) не учитываются
+            elapsed = now - self.transfer_started
+            received = self.bytes_received - self._transfer_base
+            if elapsed > 0 and received > 0:
+                TRANSFER_THROUGHPUT.observe(received / elapsed)
+        self.state = state
+        if state == STATE_TRANSFER:
+            self.transfer_started = now
+            self._transfer_base = self.bytes_received
+        self.events.state_changed(self, state)
+
+    def _log(self, message, level=INFO):
+        self.events.log(message, level)
+
+    def _progress(self, base, total):
+        def report(received):
+            self.events.progress(self, base + received, total)
+        return report
+
+    # --- кадры ---
+
+    def _recv(self):
+        msg_type, length = parse_header((yield RecvExact(HEADER.size)))
+        payload = (yield RecvExact(length)) if length else b""
+        return msg_type, payload
+
+    def _recv_request(self):
+        """Первый кадр запроса или None, если клиент закрыл соединение, не начав его"""
+        try:
+            head = yield RecvExact(1)
+        except ConnectionError:
+            return None
+        msg_type, length = parse_header(head + (yield RecvExact(HEADER.size - 1)))
+        payload = (yield RecvExact(length)) if length else b""
+        return msg_type, payload
+
+    def _expect(self, expected):
+        msg_type, payload = yield from self._recv()
+        return check_type(msg_type, payload, expected)
+
+    def _send(self, msg_type, payload=b"", flush=True):
+        yield Send(pack_message(msg_type, payload), flush)
+
+    def _check_digest(self, digest):
+        """Принимает контрольную сумму отправителя; True, если она совпала с digest"""
+        return (yield from self._expect(MSG_DIGEST)).decode() == digest.hexdigest()
+
+    # --- сессия ---
+
+    def run(self):
+        addr = self.addr
+        self._set_state(STATE_HELLO)
+
+        # Байт версии проверяется до чтения остального заголовка, чтобы старый
+        # клиент, приславший меньше байт, чем длина заголовка, не подвешивал сервер
+        version = (yield RecvExact(1))[0]
+        try:
+            check_version(version)
+        except VersionMismatch as e:
+            self._log(f"Клиент {addr} отклонен: {e}", WARNING)
+            yield Send(LEGACY_REJECT, True)
+            return
+        msg_type, length = parse_header(bytes([version]) + (yield RecvExact(HEADER.size - 1)))
+        payload = (yield RecvExact(length)) if length else b""
+        protocol_data = check_type(msg_type, payload, MSG_HELLO).decode().strip()
+        try:
+            protocol = int(protocol_data)
+            if protocol not in [1, 2, 3]:
+                raise ValueError(f"Недопустимый протокол: {protocol}")
+            self._log(f"Клиент {addr} выбрал протокол: {protocol}", DEBUG)
+        except ValueError as e:
+            self._log(f"Ошибка при получении протокола от {addr}: {e}", WARNING)
+            self._log(f"Полученные данные: '{protocol_data}'", WARNING)
+            yield from self._send(MSG_ERROR, "ERROR: Invalid protocol")
+            return
+
+        self._set_state(STATE_AUTH)
+        auth_started = time.perf_counter()
+        if protocol == 1:
+            auth_success = yield from self._auth_pap()
+        elif protocol == 2:
+            auth_success = yield from self._auth_chap()
+        else:
+            auth_success = yield from self._auth_skey()
+        protocol_name = PROTOCOL_NAMES[protocol]
+        AUTH_DURATION.observe(time.perf_counter() - auth_started, protocol=protocol_name)
+        AUTH_RESULTS.inc(protocol=protocol_name, result="success" if auth_success else "failure")
+
+        if not auth_success:
+            yield from self._send(MSG_AUTH_RESULT, "AUTH_FAILED")
+            self._log(f"Аутентификация клиента {addr} провалена!", WARNING)
+            self._set_state(STATE_DONE)
+            return
+        yield from self._send(MSG_AUTH_RESULT, "AUTH_SUCCESS")
+        self._log(f"Аутентификация клиента {addr} успешна!")
+
+        self._set_state(STATE_REQUEST)
+        yield from self._serve_request()
+        self._set_state(STATE_DONE)
+
+    def _auth_pap(self):
+        addr = self.addr
+        username = self.username = (yield from self._expect(MSG_USERNAME)).decode()
+        self._log(f"Получено имя пользователя от {addr}: {username}", DEBUG)
+
+        password = (yield from self._expect(MSG_PASSWORD)).decode()
+        self._log(f"Получен пароль для пользователя {username} от {addr}", DEBUG)
+
+        # Медленный хеш пароля проверяется вне цикла обработки соединений
+        if (yield Offload(accounts.check_password, (username, password))):
+            self._log(f"Пользователь {username} от {addr} успешно аутентифицирован")
+            return True
+        self._log(f"Ошибка аутентификации для пользователя {username} от {addr}", WARNING)
+        return False
+
+    def _auth_chap(self):
+        addr = self.addr
+        username = self.username = (yield from self._expect(MSG_USERNAME)).decode()
+        self._log(f"Получено имя пользователя от {addr}: {username}", DEBUG)
+
+        # Генерируем случайный challenge
+        challenge = secrets.token_bytes(16)
+        yield from self._send(MSG_CHALLENGE, challenge)
+        self._log(f"Отправлен challenge клиенту {addr}: {challenge.hex()}", DEBUG)
+
+        response = yield from self._expect(MSG_RESPONSE)
+        self._log(f"Получен ответ от {addr}: {response.hex()}", DEBUG)
+
+        # Обращения к хранилищу учетных записей выполняются вне цикла событий
+        expected_response = yield Offload(accounts.chap_response, (username, challenge))
+        if expected_response is None:
+            self._log(f"Пользователь {username} от {addr} не найден или CHAP для него недоступен", WARNING)
+            return False
+        if response == expected_response:
+            self._log(f"Пользователь {username} от {addr} успешно аутентифицирован по CHAP")
+            return True
+        self._log(f"Ошибка аутентификации для пользователя {username} от {addr}: неверный ответ", WARNING)
+        return False
+
+    def _auth_skey(self):
+        addr = self.addr
+        username = self.username = (yield from self._expect(MSG_USERNAME)).decode()
+        self._log(f"Получено имя пользователя от {addr}: {username}", DEBUG)
+
+        count = yield Offload(accounts.skey_get_count, (username,))
+        if count is None:
+            self._log(f"Пользователь {username} от {addr} не найден в базе S/KEY", WARNING)
+            return False
+        if count < 1:
+            # При счетчике 0 одноразовым паролем был бы сам seed + secret
+            self._log(f"Цепочка S/KEY пользователя {username} исчерпана, требуется повторная инициализация", WARNING)
+            return False
+        yield from self._send(MSG_COUNTER, str(count))
+        self._log(f"Отправлен счетчик клиенту {addr}: {count}", DEBUG)
+
+        otp = yield from self._expect(MSG_OTP)
+        self._log(f"Получен одноразовый пароль от {addr}: {otp.hex()}", DEBUG)
+
+        # Проверяем MD5(otp) против последнего принятого пароля и уменьшаем счетчик;
+        # транзакция хранилища может ждать блокировку, поэтому - вне цикла событий
+        if (yield Offload(accounts.skey_consume, (username, count, otp))):
+            self._log(f"Обновлен счетчик для {username} от {addr}: {count - 1}", DEBUG)
+            return True
+        self._log(f"Неверный одноразовый пароль или счетчик {count} для {username} уже использован", WARNING)
+        return False
+
+    def _serve_request(self):
+        addr = self.addr
+        # Сессия может передать сразу много файлов в пакетном режиме
+        first = yield from self._recv_request()
+        if first is None:
+            # Закрыть соединение после входа, ничего не передав, - обычное
+            # завершение сессии, а не ошибка
+            self._log(f"Клиент {addr} завершил сессию без запроса")
+            return
+        if first[0] == MSG_BATCH:
+            self._log(f"Пакетная передача файлов от {addr}")
+            self._set_state(STATE_TRANSFER)
+            yield from self._receive_batch()
+            return
+
+        # Клиент может предложить сжатие передаваемых данных
+        codec = None
+        if first[0] == MSG_COMPRESS:
+            codec = choose_codec(first[1].decode())
+            yield from self._send(MSG_COMPRESS, codec.name if codec else "none")
+            first = yield from self._recv()
+
+        # Имя и размер файла, а перед ними - необязательные FILERANGE, HAVE и DELTA
+        msg_type, payload = first
+        prefix = {}
+        while msg_type in REQUEST_PREFIX and msg_type not in prefix:
+            prefix[msg_type] = payload
+            msg_type, payload = yield from self._recv()
+        filename = self.filename = check_type(msg_type, payload, MSG_FILENAME).decode()
+        filesize = int((yield from self._expect(MSG_FILESIZE)).decode())
+        self._log(f"Получаю файл от {addr}: {filename}, размер: {filesize} байт")
+        if codec is not None:
+            self._log(f"Данные от {addr} передаются со сжатием {codec.name}", DEBUG)
+
+        self._set_state(STATE_TRANSFER)
+        if MSG_FILERANGE in prefix:
+            # Это соединение передает только часть файла
+            file_range = parse_range(prefix[MSG_FILERANGE], filesize)
+            self._log(f"Диапазон от {addr}: смещение {file_range[0]}, длина {file_range[1]}", DEBUG)
+            status = yield from self._receive_range(filename, filesize, file_range)
+        else:
+            # Такое содержимое уже хранится - отвечаем сразу, без передачи данных
+            status = None
+            if MSG_HAVE in prefix:
+                status = self._deduplicate(filename, filesize, prefix[MSG_HAVE].decode())
+            if status is None and MSG_DELTA in prefix:
+                # Есть прежняя копия файла - принимаем только изменения
+                status = yield from self._receive_delta(filename, filesize)
+            if status is None:
+                status = yield from self._receive_file(filename, filesize, codec)
+        self._log(f"{status} ({addr})")
+        yield from self._send(MSG_FILE_STATUS, status)
+
+    # --- прием файла целиком ---
+
+    def _receive_file(self, filename, filesize, codec):
+        """Принимает файл (с продолжением прерванной загрузки) и возвращает ответ клиенту
+
+        DIGEST от клиента - хеш всего файла. При приеме с начала он
+        сверяется с контрольной суммой, посчитанной по ходу приема; после
+        продолжения файл хешируется заново целиком, чтобы проверить и байты,
+        записанные прерванным соединением.
+        """
+        addr = self.addr
+        upload = PartialUpload(self.save_dir, filename, filesize, self.username)
+        with upload.open() as f:
+            digest = new_digest() if upload.offset == 0 else None
+            if upload.offset:
+                self._log(f"Продолжение загрузки {filename} от {addr} с байта {upload.offset}")
+
+            # Отправляем готовность к приему вместе со смещением
+            yield from self._send(MSG_READY, str(upload.offset))
+
+            remaining = filesize - upload.offset
+            progress = self._progress(upload.offset, filesize)
+            if codec is not None:
+                # Распаковываем поток по мере прихода кадров
+                received = yield from self._recv_compressed(f, remaining, codec, digest, progress)
+            else:
+                # Читаем в один переиспользуемый буфер и пишем срезами прямо в файл
+                received = yield RecvFile(f, remaining, digest, progress)
+
+        if upload.offset + received < filesize:
+            # .part остается для продолжения загрузки
+            return f"FILE_INCOMPLETE: Получено только {upload.offset + received} из {filesize} байт"
+        expected = (yield from self._expect(MSG_DIGEST)).decode()
+        if digest is not None:
+            content_hash = digest.hexdigest()
+        else:
+            # Чтение всего файла выносится из цикла событий
+            content_hash = yield Offload(file_digest, (upload.part_path,))
+        if content_hash != expected:
+            # Поврежденные данные не сохраняем и не оставляем для продолжения
+            upload.discard()
+            return f"FILE_CORRUPTED: Контрольная сумма файла {filename} не совпадает"
+        upload.finish(received, self.store, content_hash)
+        self._log(f"Файл {filename} от {addr} получен и сохранен как {upload.save_path}", DEBUG)
+        return f"FILE_RECEIVED: Файл {filename} успешно получен"
+
+    def _recv_compressed(self, f, size, codec, digest, progress):
+        """Принимает сжатый поток кадров DATA, распаковывая его в файл f
+
+        Возвращает число распакованных байт (меньше size, если соединение
+        закрылось раньше).
+        """
+        inflater = Inflater(codec, f, size, digest)
+        try:
+            while True:
+                payload = yield from self._expect(MSG_DATA)
+                if not payload:
+                    break
+                inflater.feed(payload)
+                progress(inflater.received)
+        except ConnectionError:
+            pass
+        return inflater.received
+
+    # --- параллельная загрузка диапазонами ---
+
+    def _receive_range(self, filename, filesize, file_range):
+        """Принимает один диапазон параллельной загрузки
+
+        Диапазон пишется через pwrite в общий заранее выделенный файл;
+        соединение, принявшее последний недостающий диапазон, завершает файл.
+        Контрольная сумма проверяется для каждого диапазона отдельно.
+        """
+        offset, length = file_range
+        # Учет диапазонов держит flock на файле состояния, а выделение места
+        # (posix_fallocate) может занять заметное время - все это вне цикла событий
+        upload = yield Offload(RangedUpload.acquire, (self.save_dir, filename, filesize, self.username))
+        yield from self._send(MSG_READY, str(offset))
+        digest = new_digest()
+        with upload.open_range(offset) as f:
+            received = yield RecvFile(f, length, digest, self._progress(0, length))
+        if received < length:
+            return f"FILE_INCOMPLETE: Получено только {received} из {length} байт диапазона {offset}"
+        if not (yield from self._check_digest(digest)):
+            yield Offload(upload.fail, ())
+            return f"FILE_CORRUPTED: Контрольная сумма диапазона {offset} файла {filename} не совпадает"
+        if (yield Offload(upload.complete_range, (offset, length))):
+            return f"FILE_RECEIVED: Файл {filename} успешно получен"
+        if upload.failed:
+            return f"FILE_CORRUPTED: Сборка файла {filename} отменена из-за поврежденного диапазона"
+        return f"RANGE_RECEIVED: {offset}-{offset + length}"
+
+    # --- хранилище содержимого и дельта-передача ---
+
+    def _deduplicate(self, filename, filesize, content_hash):
+        """Если содержимое уже хранится, создает имя без передачи; иначе None"""
+        if not self.store.has(content_hash, filesize):
+            return None
+        self.store.link(content_hash, safe_join(self.save_dir, filename))
+        return f"FILE_RECEIVED: Файл {filename} уже есть на сервере, передача не требуется"
+
+    def _receive_delta(self, filename, filesize):
+        """Дельта-передача: сервер отправляет сигнатуры имеющейся копии, клиент - только изменения
+
+        Возвращает ответ для клиента или None, если копии нет и файл нужно
+        принимать целиком.
+        """
+        basis = safe_join(self.save_dir, filename)
+        if not os.path.isfile(basis) or os.path.getsize(basis) == 0:
+            return None
+        block_size = block_size_for(os.path.getsize(basis))
+        # Чтение всей копии для сигнатур выносится из цикла событий
+        yield Send((yield Offload(signature_frames, (basis, block_size))), True)
+        temp_path = basis + DELTA_SUFFIX
+        try:
+            with open(basis, 'rb') as b, open(temp_path, 'wb') as out:
+                writer = DeltaWriter(b, out, block_size, filesize, new_digest())
+                while writer.apply(*(yield from self._recv())):
+                    pass
+            intact = writer.written == filesize and (yield from self._check_digest(writer.digest))
+        except Exception:
+            os.remove(temp_path)
+            raise
+        if not intact:
+            os.remove(temp_path)
+            return f"FILE_CORRUPTED: Контрольная сумма файла {filename} после сборки из изменений не совпадает"
+        # Сборка шла во временный файл - имеющаяся копия не менялась на месте
+        self.store.add(temp_path, writer.digest.hexdigest(), basis)
+        return f"FILE_RECEIVED: Файл {filename} обновлен, передано изменений: {writer.literal} байт"
+
+    # --- пакетная передача ---
+
+    def _batch_target(self, filename):
+        """Путь для файла пакетной передачи (подкаталоги создаются) или None, если имя недопустимо"""
+        try:
+            save_path = safe_join(self.save_dir, filename)
+        except ValueError:
+            return None
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        return save_path
+
+    def _receive_batch(self):
+        """Пакетный прием множества файлов в одной аутентифицированной сессии
+
+        Клиент передает файлы подряд (FILENAME, FILESIZE, данные, DIGEST) без
+        ожидания READY, сервер отвечает FILE_STATUS на каждый файл, а после
+        END - итогом. Подтверждения по файлам только буферизуются.
+        """
+        addr = self.addr
+        saved = 0
+        while True:
+            msg_type, payload = yield from self._recv()
+            if msg_type == MSG_END:
+                break
+            if msg_type != MSG_FILENAME:
+                raise ProtocolError(f"Ожидалось имя файла или конец пакета, получено сообщение {msg_type}")
+            filename = payload.decode()
+            filesize = int((yield from self._expect(MSG_FILESIZE)).decode())
+
+            save_path = self._batch_target(filename)
+            temp_path = save_path + PART_SUFFIX if save_path else os.devnull
+            digest = new_digest()
+            # Данные недопустимого файла все равно вычитываем, чтобы не сбить поток
+            with open(temp_path, 'wb') as f:
+                received = yield RecvFile(f, filesize, digest, None)
+            if received < filesize:
+                self._log(f"Соединение закрыто во время передачи {filename}: "
+                          f"{received} из {filesize} байт ({addr})", WARNING)
+                return
+            intact = yield from self._check_digest(digest)
+            if save_path is None:
+                self._log(f"Отклонено недопустимое имя файла в пакете: {filename} ({addr})", WARNING)
+                yield from self._send(MSG_FILE_STATUS, f"ERROR: Недопустимое имя файла {filename}", False)
+                continue
+            if not intact:
+                os.remove(temp_path)
+                self._log(f"Контрольная сумма файла {filename} не совпадает, файл удален ({addr})", WARNING)
+                yield from self._send(MSG_FILE_STATUS, f"FILE_CORRUPTED: {filename}", False)
+                continue
+            self.store.add(temp_path, digest.hexdigest(), save_path)
+            saved += 1
+            yield from self._send(MSG_FILE_STATUS, f"FILE_RECEIVED: {filename}", False)
+
+        self._log(f"Пакетная передача завершена, сохранено файлов: {saved} ({addr})")
+        yield from self._send(MSG_FILE_STATUS, f"BATCH_DONE: Получено файлов: {saved}")
+
+# --- драйверы ---
+
+def serve_socket(sock, session, recv_buffer_size=RECV_BUFFER_SIZE):
+    """Выполняет сессию на блокирующем сокете"""
+    buffer = bytearray(recv_buffer_size)
+    try:
+        steps = session.run()
+        value, error = None, None
+        while True:
+            try:
+                request = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration:
+                return
+            value, error = None, None
+            try:
+                kind = type(request)
+                if kind is RecvExact:
+                    value = recv_exact(sock, request.size)
+                    session.bytes_received += request.size
+                elif kind is Send:
+                    sock.sendall(request.data)
+                elif kind is RecvFile:
+                    value = recv_into_file(sock, request.f, request.size, buffer,
+                                           request.progress, request.digest)
+                    session.bytes_received += value
+                else:
+                    value = request.func(*request.args)
+            except Exception as e:
+                # Ошибка ввода-вывода возвращается в сессию, где ее можно обработать
+                error = e
+    finally:
+        # Байты, принятые до обрыва соединения, тоже попадают в метрики
+        session.report_bytes()
+
+async def serve_stream(reader, writer, session, recv_buffer_size=RECV_BUFFER_SIZE, timeout=None):
+    """Выполняет сессию на потоках asyncio
+
+    timeout - сколько секунд ждать каждого чтения и отправки (None - без
+    ограничения), как settimeout() у блокирующего сокета.
+    """
+    def timed(awaitable):
+        return asyncio.wait_for(awaitable, timeout) if timeout is not None else awaitable
+
+    try:
+        steps = session.run()
+        value, error = None, None
+        while True:
+            try:
+                request = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration:
+                return
+            value, error = None, None
+            try:
+                kind = type(request)
+                if kind is RecvExact:
+                    value = await timed(reader.readexactly(request.size))
+                    session.bytes_received += request.size
+                elif kind is Send:
+                    writer.write(request.data)
+                    # Подтверждения пакетной передачи копятся в буфере без drain
+                    if request.flush:
+                        await timed(writer.drain())
+                elif kind is RecvFile:
+                    value = await _recv_file_async(reader, request, recv_buffer_size, timed)
+                    session.bytes_received += value
+                else:
+                    value = await asyncio.to_thread(request.func, *request.args)
+            except asyncio.IncompleteReadError:
+                error = ConnectionError("Соединение закрыто собеседником")
+            except asyncio.TimeoutError:
+                error = TimeoutError("Истекло время ожидания клиента")
+            except Exception as e:
+                error = e
+    finally:
+        # Байты, принятые до обрыва соединения, тоже попадают в метрики
+        session.report_bytes()
+
+async def _recv_file_async(reader, request, recv_buffer_size, timed):
+    received = 0
+    while received < request.size:
+        data = await timed(reader.read(min(recv_buffer_size, request.size - received)))
+        if not data:
+            break
+        request.f.write(data)
+        if request.digest is not None:
+            request.digest.update(data)
+        received += len(data)
+        if request.progress is not None:
+            request.progress(received)
+    return received
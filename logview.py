@@ -0,0 +1,122 @@
+import time
+import threading
+from collections import deque
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+
+# Окно журнала для ServerGUI и ClientGUI: строки хранятся в кольцевом буфере
+# модели, а представление рисует только видимые строки. Новые строки
+# копятся в очереди и добавляются в модель по таймеру одной операцией.
+
+# Сколько последних строк хранит окно журнала
+DEFAULT_CAPACITY = 5000
+# Период вывода накопленных строк, мс
+FLUSH_INTERVAL_MS = 100
+# Наибольшая частота обновления индикатора прогресса, раз в секунду
+PROGRESS_FPS = 20
+
+class LogModel(QAbstractListModel):
+    """Модель строк журнала с ограниченной емкостью"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.lines = deque(maxlen=capacity)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self.lines[index.row()]
+        return None
+
+    def extend(self, lines):
+        """Добавляет строки, вытесняя самые старые сверх емкости"""
+        lines = lines[-self.lines.maxlen:]
+        if not lines:
+            return
+        overflow = len(self.lines) + len(lines) - self.lines.maxlen
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.lines.popleft()
+            self.endRemoveRows()
+        start = len(self.lines)
+        self.beginInsertRows(QModelIndex(), start, start + len(lines) - 1)
+        self.lines.extend(lines)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.lines.clear()
+        self.endResetModel()
+
+class LogView(QListView):
+    """Окно журнала; append и extend можно вызывать из любого потока"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.log_model = LogModel(capacity, self)
+        self.setModel(self.log_model)
+        # Одинаковая высота строк: представление не измеряет весь журнал
+        self.setUniformItemSizes(True)
+        self.setWordWrap(False)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = QTimer(self)
+        self._timer.setInterval(FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start()
+
+    def append(self, line):
+        self.extend([line])
+
+    def extend(self, lines):
+        capacity = self.log_model.lines.maxlen
+        with self._lock:
+            self._pending.extend(lines)
+            # Очередь тоже ограничена: то, что не поместится в окно, не храним
+            if len(self._pending) > capacity:
+                del self._pending[:-capacity]
+
+    def flush(self):
+        """Переносит накопленные строки в модель (вызывается таймером)"""
+        with self._lock:
+            if not self._pending:
+                return
+            lines, self._pending = self._pending, []
+        scrollbar = self.verticalScrollBar()
+        # Прокручиваем вниз, только если пользователь не листает журнал выше
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        self.log_model.extend(lines)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+        self.log_model.clear()
+
+class ProgressThrottle:
+    """Передает в emit не больше fps значений прогресса в секунду
+
+    Повторы отбрасываются, завершающее значение (final) передается всегда.
+    """
+
+    def __init__(self, emit, fps=PROGRESS_FPS):
+        self.emit = emit
+        self.interval = 1.0 / fps
+        self.last_time = 0.0
+        self.last_value = None
+
+    def __call__(self, value, final=False):
+        if value == self.last_value:
+            return
+        now = time.monotonic()
+        if final or now - self.last_time >= self.interval:
+            self.last_time = now
+            self.last_value = value
+            self.emit(value)
@@ -0,0 +1,183 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Метрики сервера в текстовом формате Prometheus. Счетчики обновляются прямо
+# из обработчиков соединений (под короткой блокировкой метрики), а
+# отдаются по HTTP на /metrics отдельным фоновым сервером.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{str(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.label_names}, получены {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_sample(key, value) for key, value in items)
+        return "\n".join(lines)
+
+    def _render_sample(self, key, value):
+        return f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    """Текущее значение, которое может расти и уменьшаться"""
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам с суммой и числом наблюдений"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счетчики по корзинам (не накопленные), сумма, число наблюдений
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            labels = _format_labels(self.label_names, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return "\n".join(lines)
+
+class Registry:
+    """Набор метрик, отдаваемых вместе"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+REGISTRY = Registry()
+
+def _handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Опросы метрик не засоряют журнал сервера
+            pass
+
+    return MetricsHandler
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Запускает в фоновом потоке HTTP-сервер метрик на /metrics"""
+    httpd = ThreadingHTTPServer((host, port), _handler(registry))
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    return httpd
+
+# --- метрики сервера аутентификации ---
+
+CONNECTIONS_ACCEPTED = Counter("auth_connections_accepted_total", "Принятые соединения")
+CONNECTIONS_REJECTED = Counter("auth_connections_rejected_total", "Соединения, отклоненные из-за лимита",
+                               ["reason"])
+PENDING_CONNECTIONS = Gauge("auth_pending_connections", "Соединения, ожидающие свободного обработчика")
+ACTIVE_SESSIONS = Gauge("auth_active_sessions", "Обслуживаемые сейчас соединения")
+AUTH_DURATION = Histogram("auth_duration_seconds", "Время аутентификации", ["protocol"])
+AUTH_RESULTS = Counter("auth_results_total", "Результаты аутентификации", ["protocol", "result"])
+BYTES_RECEIVED = Counter("auth_bytes_received_total", "Байты, принятые от клиентов")
+TRANSFER_THROUGHPUT = Histogram("auth_transfer_throughput_bytes_per_second",
+                                "Скорость приема данных за передачу",
+                                buckets=(1e5, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 2.5e9))
+SKEY_LOCK_WAIT = Histogram("auth_skey_lock_wait_seconds", "Ожидание блокировки базы S/KEY",
+                           buckets=(1e-6, 1e-5, 1e-4, 0.001, 0.01, 0.1, 1.0))
+CREDENTIAL_CACHE = Counter("auth_credential_cache_total", "Обращения к кешу учетных записей", ["result"])
+VERIFY_QUEUE = Gauge("auth_password_verify_pending", "Проверки хешей паролей в очереди и в работе")
+VERIFY_DURATION = Histogram("auth_password_verify_seconds", "Время проверки хеша пароля с ожиданием в очереди",
+                            ["scheme"])
@@ -0,0 +1,152 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import threading
+import multiprocessing
+from multiprocessing import Pool
+from concurrent.futures import ProcessPoolExecutor
+from metrics import VERIFY_QUEUE, VERIFY_DURATION
+
+# Хранение паролей в виде медленных солёных хешей. Параметры стоимости
+# записываются в саму строку, поэтому у каждой учетной записи они свои:
+#   scrypt$<n>$<r>$<p>$<соль>$<хеш>
+#   pbkdf2_sha256$<итерации>$<соль>$<хеш>
+# Соль и хеш - base64 без дополнения "=". Строка без известного префикса
+# считается паролем в открытом виде (старые базы и демонстрационные записи).
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+SCHEMES = (SCRYPT, PBKDF2)
+
+# Стоимость по умолчанию: порядка 50 мс на одну проверку
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL по умолчанию ограничивает память 32 МБ; scrypt требует 128 * r * n
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, dklen=HASH_SIZE,
+                          maxmem=256 * r * n + 2 ** 20)
+
+def hash_password(password, scheme=SCRYPT, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                  iterations=PBKDF2_ITERATIONS):
+    """Строка для хранения пароля: схема, параметры стоимости, соль и хеш"""
+    salt = os.urandom(SALT_SIZE)
+    if scheme == SCRYPT:
+        digest = _scrypt(password.encode(), salt, n, r, p)
+        return f"{SCRYPT}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+    if scheme == PBKDF2:
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, HASH_SIZE)
+        return f"{PBKDF2}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+    raise ValueError(f"Неизвестная схема хеширования: {scheme}")
+
+def scheme_of(stored):
+    """Схема хеширования сохраненного пароля или None для открытого текста"""
+    scheme = stored.split("$", 1)[0]
+    return scheme if scheme in SCHEMES else None
+
+def verify_password(stored, password):
+    """Сравнивает пароль с сохраненным значением (хешем или открытым текстом)"""
+    scheme = scheme_of(stored)
+    if scheme is None:
+        return hmac.compare_digest(stored.encode(), password.encode())
+    parts = stored.split("$")
+    if scheme == SCRYPT:
+        n, r, p, salt, expected = parts[1:]
+        digest = _scrypt(password.encode(), _b64decode(salt), int(n), int(r), int(p))
+    else:
+        iterations, salt, expected = parts[1:]
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), _b64decode(salt),
+                                     int(iterations), HASH_SIZE)
+    return hmac.compare_digest(digest, _b64decode(expected))
+
+def _pool_context():
+    # forkserver запускает процессы из чистого однопоточного процесса;
+    # где его нет (Windows), используется spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+class VerifyPool:
+    """Проверка медленных хешей в пуле процессов
+
+    Хеш вычисляется вне процесса сервера и не удерживает GIL потоков,
+    обслуживающих соединения. Пароли в открытом виде проверяются сразу.
+    processes=0 - проверять в вызывающем потоке (без пула).
+    """
+
+    def __init__(self, processes=None):
+        self.processes = os.cpu_count() if processes is None else processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Процессы запускаются при первой проверке хеша, а не при импорте.
+        # К этому моменту в сервере уже работают потоки, а fork копирует их
+        # захваченные блокировки - поэтому процессы запускаются без fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.processes, mp_context=_pool_context())
+        return self._executor
+
+    def verify(self, stored, password):
+        """Блокирует вызывающий поток до результата проверки"""
+        scheme = scheme_of(stored)
+        if scheme is None:
+            return verify_password(stored, password)
+        start = time.perf_counter()
+        VERIFY_QUEUE.inc()
+        try:
+            if self.processes == 0:
+                return verify_password(stored, password)
+            return self._get_executor().submit(verify_password, stored, password).result()
+        finally:
+            VERIFY_QUEUE.dec()
+            VERIFY_DURATION.observe(time.perf_counter() - start, scheme=scheme)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+def _hash_row(job):
+    (username, password), options = job
+    return username, hash_password(password, **options)
+
+def hash_rows(rows, processes=None, **options):
+    """Параллельно хеширует пароли пар (username, password) для импорта
+
+    options - схема и параметры стоимости hash_password().
+    """
+    with Pool(processes or os.cpu_count()) as pool:
+        jobs = ((row, options) for row in rows)
+        return pool.map(_hash_row, jobs, chunksize=64)
+
+def add_hash_arguments(parser):
+    """Параметры хеширования паролей для утилит импорта"""
+    parser.add_argument("--hash", choices=SCHEMES + ("none",), default=SCRYPT,
+                        help="как хранить пароли (none - в открытом виде, нужен для CHAP)")
+    parser.add_argument("--scrypt-n", type=int, default=SCRYPT_N, help="параметр стоимости N для scrypt")
+    parser.add_argument("--pbkdf2-iterations", type=int, default=PBKDF2_ITERATIONS,
+                        help="число итераций PBKDF2")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="число процессов хеширования (по умолчанию - число ядер)")
+
+def hash_from_arguments(rows, args):
+    """Пароли, подготовленные к импорту согласно add_hash_arguments()"""
+    if args.hash == "none":
+        return list(rows)
+    return hash_rows(rows, args.processes, scheme=args.hash, n=args.scrypt_n,
+                     iterations=args.pbkdf2_iterations)
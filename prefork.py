@@ -0,0 +1,92 @@
+import time
+import signal
+import multiprocessing
+from multiprocessing.connection import wait
+
+# Режим нескольких рабочих процессов: каждый процесс сам принимает
+# соединения на общем порту (SO_REUSEPORT), ядро распределяет подключения
+# между ними, а надзирающий процесс только перезапускает упавших.
+
+# Процесс, проработавший меньше, считается упавшим при запуске
+MIN_UPTIME = 1.0
+# Наибольшая задержка перед повторным запуском, с
+MAX_RESTART_DELAY = 30.0
+
+class Supervisor:
+    """Запускает workers процессов target(index, *args) и перезапускает завершившиеся
+
+    Если процесс падает сразу после запуска, задержка перед повтором
+    удваивается (до MAX_RESTART_DELAY), чтобы ошибка конфигурации не
+    превращалась в бесконечный цикл перезапусков.
+    """
+
+    def __init__(self, target, workers, args=(), log=print):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.log = log
+        self.processes = {}
+        self.started = {}
+        self.failures = {}
+        self.restart_at = {}
+
+    def _start(self, index):
+        # spawn, а не fork: в надзирающем процессе работает поток журнала, и
+        # его блокировки в копии процесса остались бы захваченными навсегда.
+        # Рабочие процессы при этом остаются прямыми потомками надзирающего
+        process = multiprocessing.get_context("spawn").Process(
+            target=self.target, args=(index,) + tuple(self.args), name=f"worker-{index}")
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+        self.log(f"Запущен рабочий процесс {index} (pid {process.pid})")
+
+    def _on_exit(self, index):
+        process = self.processes.pop(index)
+        process.join()
+        uptime = time.monotonic() - self.started[index]
+        if uptime < MIN_UPTIME:
+            self.failures[index] = self.failures.get(index, 0) + 1
+        else:
+            self.failures[index] = 0
+        delay = min(MAX_RESTART_DELAY, 0.5 * 2 ** self.failures[index]) if self.failures[index] else 0.0
+        self.log(f"Рабочий процесс {index} (pid {process.pid}) завершился с кодом {process.exitcode}, "
+                 f"перезапуск через {delay:.1f} с")
+        self.restart_at[index] = time.monotonic() + delay
+
+    def _terminate(self, signum, frame):
+        raise KeyboardInterrupt
+
+    def run(self):
+        """Работает до Ctrl+C или SIGTERM, затем останавливает рабочие процессы"""
+        previous = signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            for index in range(self.workers):
+                self._start(index)
+            while True:
+                now = time.monotonic()
+                for index, when in list(self.restart_at.items()):
+                    if when <= now:
+                        del self.restart_at[index]
+                        self._start(index)
+                timeout = max(0.0, min(self.restart_at.values()) - now) if self.restart_at else None
+                by_sentinel = {process.sentinel: index for index, process in self.processes.items()}
+                for sentinel in wait(list(by_sentinel), timeout):
+                    self._on_exit(by_sentinel[sentinel])
+        except KeyboardInterrupt:
+            self.log("Остановка рабочих процессов")
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.stop()
+
+    def stop(self, timeout=10.0):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.processes.clear()
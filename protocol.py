@@ -0,0 +1,209 @@
+import os
+import mmap
+import socket
+import struct
+import hashlib
+
+# Версия протокола передается в каждом кадре; клиенты старого (неразмеченного)
+# протокола отправляют вместо нее ASCII-цифру и отклоняются сразу
+PROTOCOL_VERSION = 2
+
+# Заголовок кадра: версия (1 байт), тип (1 байт), длина полезной нагрузки (4 байта)
+HEADER = struct.Struct(">BBI")
+
+# Ограничение на размер управляющего сообщения, чтобы клиент не мог
+# заставить сервер выделить произвольный объем памяти
+MAX_PAYLOAD = 64 * 1024
+
+# Типы сообщений
+MSG_HELLO = 1         # выбор протокола аутентификации
+MSG_USERNAME = 2
+MSG_PASSWORD = 3
+MSG_CHALLENGE = 4
+MSG_RESPONSE = 5
+MSG_COUNTER = 6
+MSG_OTP = 7
+MSG_AUTH_RESULT = 8   # AUTH_SUCCESS / AUTH_FAILED
+MSG_FILENAME = 9
+MSG_FILESIZE = 10
+MSG_READY = 11
+MSG_FILE_STATUS = 12  # FILE_RECEIVED / FILE_INCOMPLETE / FILE_CORRUPTED / ERROR
+MSG_ERROR = 13
+MSG_FILERANGE = 14    # "смещение:длина" диапазона при параллельной загрузке
+MSG_BATCH = 15        # начало пакетной передачи множества файлов в одной сессии
+MSG_END = 16          # конец пакетной передачи
+MSG_DIGEST = 17       # после данных: хеш всего файла либо переданного диапазона (hex)
+MSG_COMPRESS = 18     # предложение алгоритмов сжатия / выбранный сервером алгоритм
+MSG_DATA = 19         # порция сжатых данных файла; пустой кадр - конец данных
+MSG_HAVE = 20         # хеш содержимого файла перед заголовком: есть ли он уже на сервере
+MSG_DELTA = 21        # перед заголовком: передать только изменения относительно копии на сервере
+MSG_SIGNATURE = 22    # сигнатуры блоков имеющейся на сервере копии
+MSG_COPY = 23         # инструкция дельта-передачи: взять блоки из имеющейся копии
+
+# Алгоритм контрольной суммы, вычисляемой по ходу передачи файла
+DIGEST_ALGORITHM = "sha256"
+
+# Размер порции sendfile, после которой сообщается прогресс передачи
+SENDFILE_SEGMENT = 4 * 1024 * 1024
+
+# Размер переиспользуемого буфера приема файла
+RECV_BUFFER_SIZE = 1024 * 1024
+
+# Ответ для клиентов, присылающих данные без заголовка кадра
+LEGACY_REJECT = b"ERROR: Unsupported protocol version"
+# Начало кадра ERROR от сервера, отклонившего соединение из-за перегрузки
+BUSY_PREFIX = "BUSY"
+
+class ProtocolError(Exception):
+    """Нарушение формата кадра или неожиданный тип сообщения"""
+
+class VersionMismatch(ProtocolError):
+    """Собеседник использует другую версию протокола"""
+
+def _to_bytes(payload):
+    if isinstance(payload, str):
+        return payload.encode()
+    return bytes(payload)
+
+def pack_message(msg_type, payload=b""):
+    """Формирует кадр из типа сообщения и полезной нагрузки"""
+    payload = _to_bytes(payload)
+    return HEADER.pack(PROTOCOL_VERSION, msg_type, len(payload)) + payload
+
+def check_version(version):
+    """Отклоняет кадры с чужой версией протокола"""
+    if version != PROTOCOL_VERSION:
+        raise VersionMismatch(f"Неподдерживаемая версия протокола: {version}")
+
+def parse_header(header):
+    """Разбирает заголовок кадра, возвращает (тип, длина нагрузки)"""
+    version, msg_type, length = HEADER.unpack(header)
+    check_version(version)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Слишком большое сообщение: {length} байт")
+    return msg_type, length
+
+def recv_exact(sock, size):
+    """Читает из сокета ровно size байт"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("Соединение закрыто собеседником")
+        received += n
+    return bytes(buf)
+
+def new_digest():
+    """Новый объект контрольной суммы передаваемых данных"""
+    return hashlib.new(DIGEST_ALGORITHM)
+
+def update_digest_from_file(digest, f, offset, count):
+    """Добавляет в digest count байт файла f начиная с offset
+
+    Файл отображается в память, поэтому данные хешируются прямо из
+    страничного кеша без копирования в Python и без повторного чтения
+    с диска участка, только что переданного через sendfile.
+    """
+    if count <= 0:
+        return
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with mmap.mmap(f.fileno(), offset + count - start, access=mmap.ACCESS_READ, offset=start) as m:
+        with memoryview(m) as view:
+            digest.update(view[offset - start:])
+
+def file_digest(path, segment=SENDFILE_SEGMENT):
+    """Хеш содержимого всего файла (тем же алгоритмом, что и контрольная сумма передачи)"""
+    digest = new_digest()
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        for offset in range(0, size, segment):
+            update_digest_from_file(digest, f, offset, min(segment, size - offset))
+    return digest.hexdigest()
+
+def set_nodelay(sock):
+    """Отключает алгоритм Нейгла: короткие кадры уходят сразу, без ожидания ACK
+
+    Иначе пара подряд отправленных кадров (например, данные и DIGEST)
+    ждет отложенного подтверждения собеседника десятки миллисекунд.
+    """
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def send_message(sock, msg_type, payload=b""):
+    """Отправляет один кадр целиком"""
+    sock.sendall(pack_message(msg_type, payload))
+
+def send_file_range(sock, f, offset, count, progress=None, segment=SENDFILE_SEGMENT, digest=None):
+    """Передает count байт файла f начиная с offset через socket.sendfile
+
+    На платформах с os.sendfile данные копируются ядром без прохода через
+    Python; в остальных случаях socket.sendfile сам откатывается на send.
+    После каждой порции вызывается progress(смещение). Если передан digest,
+    в него добавляется каждая отправленная порция. Возвращает
+    смещение, на котором закончилась передача.
+    """
+    end = offset + count
+    while offset < end:
+        sent = sock.sendfile(f, offset, min(segment, end - offset))
+        if sent == 0:
+            raise ConnectionError("Файл закончился раньше ожидаемого размера")
+        if digest is not None:
+            # Только что отправленная порция еще в страничном кеше
+            update_digest_from_file(digest, f, offset, sent)
+        offset += sent
+        if progress is not None:
+            progress(offset)
+    return offset
+
+def recv_into_file(sock, f, size, buffer=None, progress=None, digest=None):
+    """Принимает до size байт из сокета и записывает их в файл f
+
+    Данные читаются через recv_into в один заранее выделенный буфер и
+    пишутся в файл срезами memoryview, без создания объекта bytes на
+    каждую порцию. Если передан digest, в него добавляется каждая порция.
+    Возвращает число принятых байт (меньше size, если соединение
+    закрылось раньше).
+    """
+    if buffer is None:
+        buffer = bytearray(RECV_BUFFER_SIZE)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view, min(len(view), size - received))
+        if n == 0:
+            break
+        f.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        received += n
+        if progress is not None:
+            progress(received)
+    return received
+
+def recv_message(sock):
+    """Принимает один кадр, возвращает (тип, полезная нагрузка)"""
+    msg_type, length = parse_header(recv_exact(sock, HEADER.size))
+    payload = recv_exact(sock, length) if length else b""
+    return msg_type, payload
+
+def check_type(msg_type, payload, expected):
+    """Возвращает нагрузку кадра ожидаемого типа; кадр ERROR превращается в исключение"""
+    if msg_type == expected:
+        return payload
+    if msg_type == MSG_ERROR:
+        raise ProtocolError(payload.decode(errors="replace"))
+    raise ProtocolError(f"Ожидалось сообщение типа {expected}, получено {msg_type}")
+
+def expect_message(sock, expected):
+    """Принимает кадр заданного типа и возвращает его полезную нагрузку"""
+    msg_type, payload = recv_message(sock)
+    return check_type(msg_type, payload, expected)
+
+def parse_range(payload, filesize):
+    """Разбирает диапазон «смещение:длина» и проверяет, что он лежит в пределах файла"""
+    offset, length = (int(x) for x in payload.decode().split(":"))
+    if offset < 0 or length < 0 or offset + length > filesize:
+        raise ProtocolError(f"Недопустимый диапазон {offset}:{length} для файла размером {filesize}")
+    return offset, length
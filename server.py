@@ -1,198 +1,308 @@
 import socket
-import random
 import os
-import hashlib
-import secrets
-import threading
+import asyncio
+import argparse
+import signal
+from skey_init import load_db
+from storage import ContentStore
+import accounts
+from accounttable import AccountTable
+from passhash import VerifyPool
+from prefork import Supervisor
+from connpool import (ConnectionPool, AddressLimiter, BUSY_REPLY, REJECT_BUSY, REJECT_PER_IP,
+                      DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_MAX_PER_IP, REJECT_LINGER)
+from asynclog import AsyncLog, LEVELS, DEBUG, INFO, WARNING, ERROR, console_sink
+from metrics import CONNECTIONS_ACCEPTED, CONNECTIONS_REJECTED, ACTIVE_SESSIONS, start_http_server
+from engine import ServerEvents, ServerSession, serve_socket, serve_stream
+from protocol import MSG_ERROR, RECV_BUFFER_SIZE, pack_message, set_nodelay
 
 # Создаем директорию для сохранения файлов, если она не существует
 SAVE_DIR = "received_files"
 if not os.path.exists(SAVE_DIR):
     os.makedirs(SAVE_DIR)
 
-# Простая база данных пользователей для PAP и CHAP
-users = {
-    "admin": "password123",
-    "user1": "securepass",
-    "test": "test123"
-}
+# Принятые файлы хранятся по хешу содержимого, имена - ссылки на объекты
+content_store = ContentStore(SAVE_DIR)
 
-# База данных для S/KEY с seed и счетчиками
-skey_db = {
-    "admin": {"seed": "salt123", "count": 1000},
-    "user1": {"seed": "pepper456", "count": 500},
-    "test": {"seed": "sugar789", "count": 100}
-}
+# Журнал сервера: сообщения выводятся фоновым потоком, обработчики
+# соединений не ждут консоль
+server_log = AsyncLog(console_sink("[СЕРВЕР]"))
 
-# Создаем блокировку для безопасного доступа к общим ресурсам
-skey_lock = threading.Lock()
+# Параметры прослушивающего сокета по умолчанию
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8080
+DEFAULT_BACKLOG = 128
+# Максимальное число одновременных соединений в асинхронном режиме
+DEFAULT_MAX_CONNECTIONS = 10000
+# Сколько ждать данных от клиента, прежде чем закрыть соединение, с: иначе
+# простаивающие соединения занимают потоки пула и вытесняют остальных
+DEFAULT_IDLE_TIMEOUT = 30.0
 
-def handle_client(client_socket, addr):
-    print(f"[СЕРВЕР] Клиент подключился: {addr}")
+class ConsoleEvents(ServerEvents):
+    """События сессии выводятся в консоль сервера"""
+
+    def log(self, message, level=INFO):
+        server_log.log(message, level)
+
+    def progress(self, session, received, total):
+        # Прогресс выводится только в отладочном режиме и не чаще, чем пишет журнал
+        if server_log.enabled(DEBUG):
+            server_log.progress(session.addr, f"Прием от {session.addr}: {received} из {total} байт", DEBUG)
+
+def handle_client(client_socket, addr, recv_buffer_size=RECV_BUFFER_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    server_log.log(f"Клиент подключился: {addr}")
+    CONNECTIONS_ACCEPTED.inc()
+    ACTIVE_SESSIONS.inc()
 
     try:
-        # Получаем выбранный протокол
-        protocol_data = client_socket.recv(1024).decode().strip()
-        try:
-            protocol = int(protocol_data)
-            if protocol not in [1, 2, 3]:
-                raise ValueError(f"Недопустимый протокол: {protocol}")
-            print(f"[СЕРВЕР] Клиент {addr} выбрал протокол: {protocol}")
-        except ValueError as e:
-            print(f"[СЕРВЕР] Ошибка при получении протокола от {addr}: {e}")
-            print(f"[СЕРВЕР] Полученные данные: '{protocol_data}'")
-            client_socket.send(b"ERROR: Invalid protocol")
-            client_socket.close()
-            return
-        
-        auth_success = False
-        
-        if protocol == 1:  # PAP (Password Authentication Protocol)
-            # Получаем имя пользователя
-            username = client_socket.recv(1024).decode()
-            print(f"[СЕРВЕР] Получено имя пользователя от {addr}: {username}")
-            
-            # Получаем пароль
-            password = client_socket.recv(1024).decode()
-            print(f"[СЕРВЕР] Получен пароль для пользователя {username} от {addr}")
-            
-            # Проверяем учетные данные
-            if username in users and users[username] == password:
-                auth_success = True
-                print(f"[СЕРВЕР] Пользователь {username} от {addr} успешно аутентифицирован")
-            else:
-                print(f"[СЕРВЕР] Ошибка аутентификации для пользователя {username} от {addr}")
-            
-        elif protocol == 2:  # CHAP (Challenge-Handshake Authentication Protocol)
-            # Получаем имя пользователя
-            username = client_socket.recv(1024).decode()
-            print(f"[СЕРВЕР] Получено имя пользователя от {addr}: {username}")
-            
-            # Генерируем случайный challenge
-            challenge = secrets.token_bytes(16)
-            client_socket.send(challenge)
-            print(f"[СЕРВЕР] Отправлен challenge клиенту {addr}: {challenge.hex()}")
-            
-            # Получаем ответ
-            response = client_socket.recv(1024)
-            print(f"[СЕРВЕР] Получен ответ от {addr}: {response.hex()}")
-            
-            # Проверяем ответ
-            if username in users:
-                # Вычисляем ожидаемый ответ
-                m = hashlib.md5()
-                m.update(challenge + users[username].encode())
-                expected_response = m.digest()
-                
-                if response == expected_response:
-                    auth_success = True
-                    print(f"[СЕРВЕР] Пользователь {username} от {addr} успешно аутентифицирован по CHAP")
-                else:
-                    print(f"[СЕРВЕР] Ошибка аутентификации для пользователя {username} от {addr}: неверный ответ")
-            else:
-                print(f"[СЕРВЕР] Пользователь {username} от {addr} не найден")
-            
-        elif protocol == 3:  # S/KEY (One-Time Password)
-            # Получаем имя пользователя
-            username = client_socket.recv(1024).decode()
-            print(f"[СЕРВЕР] Получено имя пользователя от {addr}: {username}")
-            
-            # Используем блокировку для безопасного доступа к общим данным
-            with skey_lock:
-                if username in skey_db:
-                    # Отправляем текущее значение счетчика
-                    client_socket.send(str(skey_db[username]["count"]).encode())
-                    print(f"[СЕРВЕР] Отправлен счетчик клиенту {addr}: {skey_db[username]['count']}")
-                    
-                    # Получаем одноразовый пароль
-                    otp = client_socket.recv(1024)
-                    print(f"[СЕРВЕР] Получен одноразовый пароль от {addr}: {otp.hex()}")
-                    
-                    # В реальной системе мы бы проверили хеш против сохраненного предыдущего хеша
-                    # Для демонстрации, предположим что хеш верен
-                    auth_success = True
-                    
-                    # Уменьшаем счетчик
-                    skey_db[username]["count"] -= 1
-                    print(f"[СЕРВЕР] Обновлен счетчик для {username} от {addr}: {skey_db[username]['count']}")
-                else:
-                    print(f"[СЕРВЕР] Пользователь {username} от {addr} не найден в базе S/KEY")
-            
-        if auth_success:
-            client_socket.send(b"AUTH_SUCCESS")
-            print(f"[СЕРВЕР] Аутентификация клиента {addr} успешна!")
-            
-            # Получаем имя файла
-            filename_data = client_socket.recv(1024).decode()
-            if not filename_data.startswith("FILENAME:"):
-                print(f"[СЕРВЕР] Ошибка от {addr}: неверный формат имени файла")
-                return
-                
-            filename = filename_data.replace("FILENAME:", "")
-            
-            # Получаем размер файла
-            filesize_data = client_socket.recv(1024).decode()
-            if not filesize_data.startswith("FILESIZE:"):
-                print(f"[СЕРВЕР] Ошибка от {addr}: неверный формат размера файла")
-                return
-                
-            filesize = int(filesize_data.replace("FILESIZE:", ""))
-            print(f"[СЕРВЕР] Получаю файл от {addr}: {filename}, размер: {filesize} байт")
-            
-            # Отправляем готовность к приему
-            client_socket.send(b"READY")
-            
-            # Принимаем файл
-            save_path = os.path.join(SAVE_DIR, filename)
-            bytes_received = 0
-            
-            with open(save_path, 'wb') as f:
-                while bytes_received < filesize:
-                    data = client_socket.recv(4096)
-                    if not data:
-                        break
-                    f.write(data)
-                    bytes_received += len(data)
-                    
-            print(f"[СЕРВЕР] Файл {filename} от {addr} получен и сохранен как {save_path}")
-            
-            # Отправляем подтверждение
-            client_socket.send(f"FILE_RECEIVED: Файл {filename} успешно получен".encode())
-            
-        else:
-            client_socket.send(b"AUTH_FAILED")
-            print(f"[СЕРВЕР] Аутентификация клиента {addr} провалена!")
-            
+        set_nodelay(client_socket)
+        client_socket.settimeout(idle_timeout or None)
+        session = ServerSession(addr, SAVE_DIR, ConsoleEvents(), content_store)
+        serve_socket(client_socket, session, recv_buffer_size)
+    except TimeoutError:
+        server_log.log(f"Таймаут соединения с клиентом {addr}", WARNING)
     except Exception as e:
-        print(f"[СЕРВЕР] Ошибка при обработке клиента {addr}: {str(e)}")
+        server_log.log(f"Ошибка при обработке клиента {addr}: {str(e)}", ERROR)
     finally:
         client_socket.close()
-        print(f"[СЕРВЕР] Соединение с клиентом {addr} закрыто")
+        ACTIVE_SESSIONS.dec()
+        server_log.log(f"Соединение с клиентом {addr} закрыто")
+
+async def handle_client_async(reader, writer, recv_buffer_size=RECV_BUFFER_SIZE,
+                              idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Асинхронный вариант handle_client для работы на одном цикле событий"""
+    addr = writer.get_extra_info("peername")
+    server_log.log(f"Клиент подключился: {addr}")
+    CONNECTIONS_ACCEPTED.inc()
+    ACTIVE_SESSIONS.inc()
+
+    try:
+        session = ServerSession(addr, SAVE_DIR, ConsoleEvents(), content_store)
+        await serve_stream(reader, writer, session, recv_buffer_size, idle_timeout or None)
+    except TimeoutError:
+        server_log.log(f"Таймаут соединения с клиентом {addr}", WARNING)
+    except Exception as e:
+        server_log.log(f"Ошибка при обработке клиента {addr}: {str(e)}", ERROR)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        ACTIVE_SESSIONS.dec()
+        server_log.log(f"Соединение с клиентом {addr} закрыто")
+
+async def reject_async(reader, writer, reason):
+    """Асинхронный вариант connpool.reject: ответ BUSY и закрытие соединения"""
+    CONNECTIONS_REJECTED.inc(reason=reason)
+    try:
+        writer.write(pack_message(MSG_ERROR, BUSY_REPLY[reason]))
+        writer.write_eof()
+        # Ждем, пока клиент прочитает ответ и закроет соединение со своей стороны
+        await asyncio.wait_for(reader.read(), REJECT_LINGER)
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_async(host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=DEFAULT_BACKLOG,
+                      max_connections=DEFAULT_MAX_CONNECTIONS, recv_buffer_size=RECV_BUFFER_SIZE,
+                      reuse_port=False, max_per_ip=DEFAULT_MAX_PER_IP, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Асинхронный сервер: все соединения обслуживаются корутинами одного цикла событий"""
+    active = 0
+    limiter = AddressLimiter(max_per_ip)
+
+    async def on_connect(reader, writer):
+        nonlocal active
+        addr = writer.get_extra_info('peername')
+        if active >= max_connections:
+            # Лимит соединений исчерпан - сразу отвечаем BUSY
+            server_log.log(f"Достигнут лимит соединений ({max_connections}), "
+                           f"отклонено подключение {addr}", WARNING)
+            await reject_async(reader, writer, REJECT_BUSY)
+            return
+        if not limiter.acquire(addr[0]):
+            server_log.log(f"Превышен лимит соединений с адреса {addr[0]} ({max_per_ip}), "
+                           f"отклонено подключение {addr}", WARNING)
+            await reject_async(reader, writer, REJECT_PER_IP)
+            return
+        active += 1
+        try:
+            await handle_client_async(reader, writer, recv_buffer_size, idle_timeout)
+        finally:
+            active -= 1
+            limiter.release(addr[0])
+
+    server = await asyncio.start_server(on_connect, host, port, backlog=backlog, reuse_port=reuse_port or None)
+    server_log.log(f"Асинхронный режим, лимит соединений: {max_connections}")
+    server_log.log("Ожидание клиентов...")
+    async with server:
+        await server.serve_forever()
+
+def run_server_threaded(host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=DEFAULT_BACKLOG,
+                        recv_buffer_size=RECV_BUFFER_SIZE, reuse_port=False, threads=DEFAULT_WORKERS,
+                        queue_size=DEFAULT_QUEUE_SIZE, max_per_ip=DEFAULT_MAX_PER_IP,
+                        idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Многопоточный сервер: соединения обслуживает пул из threads потоков
 
-def run_server():
-    """Функция для запуска сервера, вынесенная для возможности вызова из других модулей"""
-    # Запуск TCP-сервера
+    Сверх этого ожидают не больше queue_size соединений, остальным сразу
+    отвечаем BUSY. reuse_port - слушать порт вместе с другими процессами
+    (SO_REUSEPORT). Соединение, от которого idle_timeout секунд нет данных,
+    закрывается и освобождает поток
+    """
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(("0.0.0.0", 8080))
-    server_socket.listen(5)
+    # Как asyncio.start_server: перезапуск не ждет, пока уйдут соединения в TIME_WAIT
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
 
-    print("[СЕРВЕР] Ожидание клиентов...")
+    pool = ConnectionPool(lambda sock, addr: handle_client(sock, addr, recv_buffer_size, idle_timeout),
+                          threads, queue_size, max_per_ip)
+    server_log.log(f"Потоков-обработчиков: {threads}, очередь: {queue_size}, "
+                   f"лимит с одного адреса: {max_per_ip or 'нет'}, таймаут простоя: {idle_timeout or 'нет'}")
+    server_log.log("Ожидание клиентов...")
 
     # Основной цикл сервера для обработки новых подключений
     try:
         while True:
             client_socket, addr = server_socket.accept()
-            client_thread = threading.Thread(target=handle_client, args=(client_socket, addr))
-            client_thread.daemon = True
-            client_thread.start()
-            print(f"[СЕРВЕР] Запущен новый поток для клиента {addr}")
-            print(f"[СЕРВЕР] Активных соединений: {threading.active_count() - 1}")
+            reason = pool.submit(client_socket, addr)
+            if reason is not None:
+                CONNECTIONS_REJECTED.inc(reason=reason)
+                server_log.log(f"Отклонено подключение {addr}: {BUSY_REPLY[reason]}", WARNING)
+                continue
+            server_log.log(f"Соединений в очереди: {pool.pending()}", DEBUG)
     except KeyboardInterrupt:
-        print("[СЕРВЕР] Сервер остановлен пользователем")
+        server_log.log("Сервер остановлен пользователем")
     finally:
         server_socket.close()
-        print("[СЕРВЕР] Сервер остановлен")
+        pool.close()
+        server_log.log("Сервер остановлен")
+
+def run_server(mode="thread", host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=DEFAULT_BACKLOG,
+               max_connections=DEFAULT_MAX_CONNECTIONS, recv_buffer_size=RECV_BUFFER_SIZE,
+               log_level=INFO, metrics_port=None, reuse_port=False, threads=DEFAULT_WORKERS,
+               queue_size=DEFAULT_QUEUE_SIZE, max_per_ip=DEFAULT_MAX_PER_IP,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Функция для запуска сервера, вынесенная для возможности вызова из других модулей
+
+    mode: "thread" - поток на соединение, "async" - цикл событий asyncio.
+    metrics_port - порт HTTP-сервера метрик на localhost (None - не запускать).
+    reuse_port - разделять порт с другими рабочими процессами (SO_REUSEPORT).
+    threads, queue_size - пул потоков и очередь режима "thread";
+    max_per_ip - лимит одновременных соединений с одного адреса (0 - без лимита);
+    idle_timeout - сколько секунд ждать данных от клиента (0 - без таймаута)
+    """
+    server_log.level = log_level
+    if metrics_port is not None:
+        start_http_server(metrics_port)
+        server_log.log(f"Метрики доступны на http://127.0.0.1:{metrics_port}/metrics")
+    try:
+        if mode == "async":
+            try:
+                asyncio.run(serve_async(host, port, backlog, max_connections, recv_buffer_size, reuse_port,
+                                        max_per_ip, idle_timeout))
+            except KeyboardInterrupt:
+                server_log.log("Сервер остановлен пользователем")
+            server_log.log("Сервер остановлен")
+        elif mode == "thread":
+            run_server_threaded(host, port, backlog, recv_buffer_size, reuse_port, threads, queue_size,
+                                max_per_ip, idle_timeout)
+        else:
+            raise ValueError(f"Неизвестный режим сервера: {mode}")
+    finally:
+        accounts.get_verifier().close()
+        # Дописываем накопленные сообщения перед выходом
+        server_log.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер аутентификации (PAP/CHAP/S-KEY)")
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread",
+                        help="режим работы: поток на соединение или asyncio")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="порт сервера")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                        help="длина очереди ожидающих подключений (listen)")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help="лимит одновременных соединений в режиме async")
+    parser.add_argument("--threads", type=int, default=DEFAULT_WORKERS,
+                        help="потоков-обработчиков соединений в режиме thread")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="соединений, ожидающих свободного потока, сверх которых отвечаем BUSY")
+    parser.add_argument("--max-per-ip", type=int, default=DEFAULT_MAX_PER_IP,
+                        help="одновременных соединений с одного IP-адреса (0 - без лимита)")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="секунд ожидания данных от клиента до закрытия соединения (0 - без таймаута)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="число рабочих процессов на общем порту (SO_REUSEPORT)")
+    parser.add_argument("--recv-buffer", type=int, default=RECV_BUFFER_SIZE,
+                        help="размер буфера приема файла в байтах")
+    store = parser.add_mutually_exclusive_group()
+    store.add_argument("--accounts-db", default=accounts.DEFAULT_DB,
+                       help="файл базы учетных записей SQLite (создается при первом запуске)")
+    store.add_argument("--account-table", default=None,
+                       help="таблица учетных записей, собранная accounttable.py (вместо базы SQLite)")
+    parser.add_argument("--verify-processes", type=int, default=None,
+                        help="процессов проверки хешей паролей (по умолчанию - число ядер, 0 - без пула)")
+    parser.add_argument("--skey-db", default=None,
+                        help="импортировать в базу записи S/KEY, подготовленные skey_init.py")
+    parser.add_argument("--log-level", choices=list(LEVELS), default="info",
+                        help="наименьший уровень выводимых сообщений")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="порт HTTP-сервера метрик Prometheus на localhost "
+                             "(рабочий процесс N использует порт + N)")
+    return parser.parse_args(argv)
+
+def open_accounts(args):
+    """Хранилище учетных записей, выбранное в командной строке"""
+    if args.account_table:
+        return AccountTable(args.account_table)
+    return accounts.open_store(args.accounts_db)
+
+def serve(args, worker=None):
+    """Запускает сервер в текущем процессе; worker - номер рабочего процесса или None"""
+    accounts.set_backend(open_accounts(args))
+    verify_processes = args.verify_processes
+    if verify_processes is None and args.workers > 1:
+        # Ядра делятся между рабочими процессами
+        verify_processes = max(1, (os.cpu_count() or 1) // args.workers)
+    accounts.set_verifier(VerifyPool(verify_processes))
+    metrics_port = args.metrics_port
+    if metrics_port is not None and worker is not None:
+        metrics_port += worker
+    run_server(args.mode, args.host, args.port, args.backlog, args.max_connections,
+               args.recv_buffer, LEVELS[args.log_level], metrics_port, worker is not None,
+               args.threads, args.queue_size, args.max_per_ip, args.idle_timeout)
+
+def run_worker(worker, args):
+    """Рабочий процесс режима --workers"""
+    # Процесс запущен через spawn и при импорте модуля создал свой журнал;
+    # сообщения дополняются номером процесса, а закрывает журнал run_server()
+    server_log.sink = console_sink(f"[СЕРВЕР {worker}]")
+    # SIGTERM от надзирающего процесса завершает сервер как Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    serve(args, worker)
+
+def run_workers(args):
+    """Запускает args.workers рабочих процессов и перезапускает упавшие"""
+    server_log.level = LEVELS[args.log_level]
+    server_log.log(f"Рабочих процессов: {args.workers}, порт {args.port} (SO_REUSEPORT)")
+    try:
+        Supervisor(run_worker, args.workers, (args,), server_log.log).run()
+    finally:
+        server_log.close()
 
 # Запускаем сервер только если скрипт запущен напрямую, а не импортирован
 if __name__ == "__main__":
-    run_server()
\ No newline at end of file
+    args = parse_args()
+    if args.skey_db:
+        # Импорт выполняется один раз, до запуска рабочих процессов
+        store = open_accounts(args)
+        store.import_skey(load_db(args.skey_db).items())
+        store.close()
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        serve(args)
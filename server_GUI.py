@@ -3,19 +3,47 @@ import os
 import socket
 import threading
 import datetime
-import hashlib
-import secrets
+import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                            QTextEdit, QFileDialog, QMessageBox, QFrame)
-from PyQt6.QtCore import Qt, QDir, pyqtSignal
+                            QFileDialog, QMessageBox, QFrame)
+from PyQt6.QtCore import Qt, QDir
 from PyQt6.QtGui import QFont, QColor, QPalette
-from server import users, skey_db, skey_lock, handle_client
+from storage import ContentStore
+from logview import LogView
+from connpool import ConnectionPool, BUSY_REPLY
+from asynclog import AsyncLog, INFO
+from engine import ServerEvents, ServerSession, serve_socket, STATE_TRANSFER
+from protocol import set_nodelay
+
+class GuiEvents(ServerEvents):
+    """События сессии выводятся в окно журнала сервера
+
+    Прогресс приема показывается каждые 10% вместе со скоростью; пока
+    предыдущая строка прогресса не выведена, новая только заменяет ее.
+    """
+
+    def __init__(self, event_log):
+        self.event_log = event_log
+        self.last_progress = 0
+
+    def log(self, message, level=INFO):
+        self.event_log.log(message, level)
+
+    def state_changed(self, session, state):
+        if state == STATE_TRANSFER:
+            self.last_progress = 0
+
+    def progress(self, session, received, total):
+        current_progress = (received * 100) // total if total else 100
+        if current_progress >= self.last_progress + 10:
+            elapsed = time.monotonic() - session.transfer_started
+            speed = received / (1024 * elapsed) if elapsed > 0 else 0
+            self.event_log.progress(session.addr, f"Прогресс приема файла от {session.addr}: "
+                                                  f"{current_progress}% (скорость: {speed:.2f} KB/s)")
+            self.last_progress = current_progress
 
 class ServerGUI(QMainWindow):
-    # Сигнал для логирования из других потоков
-    log_signal = pyqtSignal(str)
-    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Сервер аутентификации")
@@ -47,8 +75,8 @@ class ServerGUI(QMainWindow):
         self.create_control_frame(main_layout)
         self.create_log_frame(main_layout)
         
-        # Подключаем сигнал логирования
-        self.log_signal.connect(self.append_log)
+        # Сообщения копятся в очереди журнала и передаются окну пачками
+        self.event_log = AsyncLog(self.append_log)
         
         # Вывод начального сообщения
         self.log("Сервер аутентификации инициализирован")
@@ -94,7 +122,7 @@ class ServerGUI(QMainWindow):
         QPushButton:pressed {
             background-color: #252525;
         }
-        QTextEdit {
+        QListView {
             background-color: #252526;
             color: #DCDCDC;
             border: 1px solid #3F3F46;
@@ -200,9 +228,8 @@ class ServerGUI(QMainWindow):
         # Заголовок
         log_layout.addWidget(QLabel("Логи сервера:"))
         
-        # Окно логов
-        self.log_area = QTextEdit()
-        self.log_area.setReadOnly(True)
+        # Окно логов: хранит последние строки и выводит новые по таймеру
+        self.log_area = LogView()
         log_font = QFont("Consolas", 10)
         self.log_area.setFont(log_font)
         log_layout.addWidget(self.log_area)
@@ -218,20 +245,18 @@ class ServerGUI(QMainWindow):
         
         main_layout.addWidget(log_frame)
     
-    def log(self, message):
+    def log(self, message, level=INFO):
         """Добавляет сообщение в лог с отметкой времени"""
-        # Используем сигнал для безопасного обновления GUI из других потоков
-        self.log_signal.emit(message)
+        # Сообщение только ставится в очередь, вызывающий поток не ждет окно
+        self.event_log.log(message, level)
     
-    def append_log(self, message):
-        """Метод, который фактически добавляет сообщения в лог (вызывается через сигнал)"""
-        timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        log_message = f"{timestamp} {message}"
-        self.log_area.append(log_message)
-        
-        # Прокручиваем вниз для отображения новых сообщений
-        scrollbar = self.log_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+    def append_log(self, records):
+        """Передает пачку сообщений окну лога (вызывается из потока журнала)"""
+        lines = []
+        for record in records:
+            timestamp = datetime.datetime.fromtimestamp(record.created).strftime("[%Y-%m-%d %H:%M:%S]")
+            lines.append(f"{timestamp} {record.message}")
+        self.log_area.extend(lines)
     
     def clear_logs(self):
         """Очищает содержимое лог-окна"""
@@ -297,6 +322,8 @@ class ServerGUI(QMainWindow):
     
     def server_loop(self):
         """Основной цикл сервера для обработки новых подключений"""
+        # Клиентов обслуживает пул потоков фиксированного размера
+        pool = ConnectionPool(self.handle_client_wrapper)
         try:
             while self.server_running:
                 try:
@@ -307,17 +334,12 @@ class ServerGUI(QMainWindow):
                     # Логируем подключение
                     self.log(f"Клиент подключился: {addr}")
                     
-                    # Запуск обработчика клиента в отдельном потоке
-                    client_thread = threading.Thread(
-                        target=self.handle_client_wrapper, 
-                        args=(client_socket, addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    
-                    self.log(f"Запущен новый поток для клиента {addr}")
-                    active_threads = threading.active_count() - 2  # -2 для main и server_loop
-                    self.log(f"Активных соединений: {active_threads}")
+                    # Передаем клиента пулу; при переполнении он сразу получает BUSY
+                    reason = pool.submit(client_socket, addr)
+                    if reason is not None:
+                        self.log(f"Отклонено подключение {addr}: {BUSY_REPLY[reason]}")
+                        continue
+                    self.log(f"Соединений в очереди: {pool.pending()}")
                     
                 except socket.timeout:
                     # Таймаут - нормальная ситуация, продолжаем работу
@@ -334,6 +356,7 @@ class ServerGUI(QMainWindow):
         except Exception as e:
             self.log(f"Критическая ошибка сервера: {str(e)}")
         finally:
+            pool.close()
             # Закрываем сокет сервера
             if hasattr(self, 'server_socket') and self.server_socket:
                 try:
@@ -352,199 +375,15 @@ class ServerGUI(QMainWindow):
             self.log(f"Ошибка при обработке клиента {addr}: {str(e)}")
     
     def custom_handle_client(self, client_socket, addr, save_dir):
-        """Модифицированная функция handle_client с перенаправлением вывода в GUI"""
+        """Обслуживает клиента общим ядром протокола с выводом событий в GUI"""
         self.log(f"Обработка клиента: {addr}")
 
         try:
             # Устанавливаем таймаут для сокета, чтобы избежать зависания
             client_socket.settimeout(30.0)  # 30 секунд таймаут для операций с сокетом
-            
-            # Получаем выбранный протокол
-            protocol_data = client_socket.recv(1024).decode().strip()
-            try:
-                protocol = int(protocol_data)
-                if protocol not in [1, 2, 3]:
-                    raise ValueError(f"Недопустимый протокол: {protocol}")
-                self.log(f"Клиент {addr} выбрал протокол: {protocol}")
-            except ValueError as e:
-                self.log(f"Ошибка при получении протокола от {addr}: {e}")
-                self.log(f"Полученные данные: '{protocol_data}'")
-                client_socket.send(b"ERROR: Invalid protocol")
-                client_socket.close()
-                return
-            
-            auth_success = False
-            
-            if protocol == 1:  # PAP (Password Authentication Protocol)
-                # Получаем имя пользователя
-                username = client_socket.recv(1024).decode()
-                self.log(f"Получено имя пользователя от {addr}: {username}")
-                
-                # Получаем пароль
-                password = client_socket.recv(1024).decode()
-                self.log(f"Получен пароль для пользователя {username} от {addr}")
-                
-                # Проверяем учетные данные
-                if username in users and users[username] == password:
-                    auth_success = True
-                    self.log(f"Пользователь {username} от {addr} успешно аутентифицирован")
-                else:
-                    self.log(f"Ошибка аутентификации для пользователя {username} от {addr}")
-                
-            elif protocol == 2:  # CHAP (Challenge-Handshake Authentication Protocol)
-                # Получаем имя пользователя
-                username = client_socket.recv(1024).decode()
-                self.log(f"Получено имя пользователя от {addr}: {username}")
-                
-                # Генерируем случайный challenge
-                challenge = secrets.token_bytes(16)
-                client_socket.send(challenge)
-                self.log(f"Отправлен challenge клиенту {addr}: {challenge.hex()}")
-                
-                # Получаем ответ
-                response = client_socket.recv(1024)
-                self.log(f"Получен ответ от {addr}: {response.hex()}")
-                
-                # Проверяем ответ
-                if username in users:
-                    # Вычисляем ожидаемый ответ
-                    m = hashlib.md5()
-                    m.update(challenge + users[username].encode())
-                    expected_response = m.digest()
-                    
-                    if response == expected_response:
-                        auth_success = True
-                        self.log(f"Пользователь {username} от {addr} успешно аутентифицирован по CHAP")
-                    else:
-                        self.log(f"Ошибка аутентификации для пользователя {username} от {addr}: неверный ответ")
-                else:
-                    self.log(f"Пользователь {username} от {addr} не найден")
-                
-            elif protocol == 3:  # S/KEY (One-Time Password)
-                # Получаем имя пользователя
-                username = client_socket.recv(1024).decode()
-                self.log(f"Получено имя пользователя от {addr}: {username}")
-                
-                # Используем блокировку для безопасного доступа к общим данным
-                with skey_lock:
-                    if username in skey_db:
-                        # Отправляем текущее значение счетчика
-                        client_socket.send(str(skey_db[username]["count"]).encode())
-                        self.log(f"Отправлен счетчик клиенту {addr}: {skey_db[username]['count']}")
-                        
-                        # Получаем одноразовый пароль
-                        otp = client_socket.recv(1024)
-                        self.log(f"Получен одноразовый пароль от {addr}: {otp.hex()}")
-                        
-                        # В реальной системе мы бы проверили хеш против сохраненного предыдущего хеша
-                        # Для демонстрации, предположим что хеш верен
-                        auth_success = True
-                        
-                        # Уменьшаем счетчик
-                        skey_db[username]["count"] -= 1
-                        self.log(f"Обновлен счетчик для {username} от {addr}: {skey_db[username]['count']}")
-                    else:
-                        self.log(f"Пользователь {username} от {addr} не найден в базе S/KEY")
-            
-            if auth_success:
-                client_socket.send(b"AUTH_SUCCESS")
-                self.log(f"Аутентификация клиента {addr} успешна!")
-                self.log(f"Ожидание данных файла от {addr}...")
-
-                # Получаем имя файла
-                self.log(f"Ожидание имени файла от {addr}...")
-                filename_data = client_socket.recv(1024).decode()
-                self.log(f"Получены данные: '{filename_data}'")
-
-                if not filename_data.startswith("FILENAME:"):
-                    self.log(f"Ошибка от {addr}: неверный формат имени файла")
-                    return
-
-                filename = filename_data.replace("FILENAME:", "")
-                self.log(f"Распознано имя файла: '{filename}'")
-
-                # Получаем размер файла
-                self.log(f"Ожидание размера файла от {addr}...")
-                filesize_data = client_socket.recv(1024).decode()
-                self.log(f"Получены данные о размере: '{filesize_data}'")
-
-                if not filesize_data.startswith("FILESIZE:"):
-                    self.log(f"Ошибка от {addr}: неверный формат размера файла")
-                    return
-                    
-                filesize = int(filesize_data.replace("FILESIZE:", ""))
-                self.log(f"Получаю файл от {addr}: {filename}, размер: {filesize} байт")
-                
-                # Отправляем готовность к приему
-                client_socket.send(b"READY")
-                self.log(f"Отправлен сигнал готовности к приему для {addr}")
-                
-                # Принимаем файл с отображением прогресса и улучшенной обработкой ошибок
-                save_path = os.path.join(save_dir, filename)
-                bytes_received = 0
-                last_progress = 0
-                
-                try:
-                    with open(save_path, 'wb') as f:
-                        # Устанавливаем меньший таймаут для приема данных
-                        client_socket.settimeout(10.0)
-                        
-                        # Будем показывать прогресс каждые 10%
-                        progress_step = max(1, filesize // 10)
-                        
-                        start_time = datetime.datetime.now()
-                        
-                        while bytes_received < filesize:
-                            try:
-                                # Читаем данные
-                                data = client_socket.recv(8192)  # Увеличим размер буфера для ускорения
-                                
-                                if not data:
-                                    # Если данных нет, но должны быть еще - возможно, соединение разорвано
-                                    self.log(f"Предупреждение: Соединение с {addr} разорвано во время передачи")
-                                    break
-                                    
-                                # Записываем данные в файл
-                                f.write(data)
-                                bytes_received += len(data)
-                                
-                                # Показываем прогресс
-                                current_progress = (bytes_received * 100) // filesize
-                                if current_progress >= last_progress + 10:
-                                    elapsed = (datetime.datetime.now() - start_time).total_seconds()
-                                    speed = bytes_received / (1024 * elapsed) if elapsed > 0 else 0
-                                    self.log(f"Прогресс приема файла от {addr}: {current_progress}% (скорость: {speed:.2f} KB/s)")
-                                    last_progress = current_progress
-                                    
-                            except socket.timeout:
-                                self.log(f"Таймаут при приеме файла от {addr}. Попытка продолжить...")
-                                continue
-                            except Exception as e:
-                                self.log(f"Ошибка при приеме данных от {addr}: {str(e)}")
-                                break
-                    
-                    # Проверяем, полностью ли получен файл
-                    if bytes_received >= filesize:
-                        self.log(f"Файл {filename} от {addr} получен полностью и сохранен как {save_path}")
-                        # Отправляем подтверждение
-                        client_socket.send(f"FILE_RECEIVED: Файл {filename} успешно получен".encode())
-                    else:
-                        self.log(f"Предупреждение: Получено только {bytes_received} из {filesize} байт для файла {filename} от {addr}")
-                        # Сообщаем о неполном приеме
-                        client_socket.send(f"FILE_INCOMPLETE: Получено только {bytes_received} из {filesize} байт".encode())
-                        
-                except Exception as e:
-                    self.log(f"Ошибка при сохранении файла от {addr}: {str(e)}")
-                    try:
-                        # Уведомляем клиента о проблеме
-                        client_socket.send(f"ERROR: {str(e)}".encode())
-                    except:
-                        pass
-                    
-            else:
-                client_socket.send(b"AUTH_FAILED")
-                self.log(f"Аутентификация клиента {addr} провалена!")
-                
+            set_nodelay(client_socket)
+            session = ServerSession(addr, save_dir, GuiEvents(self.event_log), ContentStore(save_dir))
+            serve_socket(client_socket, session)
         except socket.timeout:
             self.log(f"Таймаут соединения с клиентом {addr}")
         except ConnectionResetError:
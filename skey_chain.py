@@ -0,0 +1,108 @@
+import os
+import math
+import struct
+import hashlib
+
+# Каталог локального кеша цепочек S/KEY
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".skey_chain")
+
+# Формат файла: сигнатура, длина цепочки N, шаг контрольных точек k,
+# затем подряд 16-байтовые значения MD5 для позиций k, 2k, 3k, ... <= N
+MAGIC = b"SKC1"
+FILE_HEADER = struct.Struct(">4sII")
+DIGEST_SIZE = hashlib.md5().digest_size
+
+def skey_hash(value, iterations):
+    """Применяет MD5 к value iterations раз подряд"""
+    md5 = hashlib.md5
+    for _ in range(iterations):
+        value = md5(value).digest()
+    return value
+
+def compute_otp(seed, secret, count):
+    """Прямое вычисление одноразового пароля: MD5^count(seed + secret)"""
+    return skey_hash((seed + secret).encode(), count)
+
+class SKeyChainCache:
+    """Кеш контрольных точек цепочки S/KEY для одной пары seed/secret
+
+    При шаге k = floor(sqrt(N)) генерация пароля для любого счетчика
+    требует не более k хеширований вместо count. При interval=1
+    хранится вся цепочка и пароль берется из файла за O(1).
+    """
+
+    def __init__(self, seed, secret, cache_dir=DEFAULT_CACHE_DIR):
+        self.seed = seed
+        self.secret = secret
+        self.cache_dir = cache_dir
+        # Имя файла не раскрывает seed и secret
+        key = hashlib.sha256(f"{seed}\0{secret}".encode()).hexdigest()
+        self.path = os.path.join(cache_dir, key + ".chain")
+        self.length = 0
+        self.interval = 0
+        self.checkpoints = b""
+
+    def load(self):
+        """Загружает контрольные точки из файла; возвращает False, если кеша нет"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if len(data) < FILE_HEADER.size:
+            return False
+        magic, length, interval = FILE_HEADER.unpack_from(data)
+        checkpoints = data[FILE_HEADER.size:]
+        if magic != MAGIC or interval == 0 or len(checkpoints) != (length // interval) * DIGEST_SIZE:
+            return False
+        self.length, self.interval, self.checkpoints = length, interval, checkpoints
+        return True
+
+    def build(self, length, interval=None):
+        """Вычисляет цепочку длины length и сохраняет контрольные точки"""
+        if interval is None:
+            interval = max(1, math.isqrt(length))
+        value = (self.seed + self.secret).encode()
+        points = bytearray()
+        md5 = hashlib.md5
+        for position in range(1, length + 1):
+            value = md5(value).digest()
+            if position % interval == 0:
+                points += value
+        self.length, self.interval, self.checkpoints = length, interval, bytes(points)
+        self.save()
+
+    def save(self):
+        # Контрольные точки позволяют вычислить все будущие пароли, поэтому
+        # каталог и файл доступны только владельцу
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(FILE_HEADER.pack(MAGIC, self.length, self.interval))
+            f.write(self.checkpoints)
+        os.replace(tmp_path, self.path)
+
+    def get_otp(self, count):
+        """Возвращает MD5^count(seed + secret), используя ближайшую контрольную точку"""
+        if count <= 0:
+            # MD5^0 - это сам seed + secret: такой пароль отправлять нельзя
+            raise ValueError(f"Цепочка S/KEY исчерпана (счетчик {count})")
+        if count > self.length:
+            # Цепочка в памяти короче нужной - пробуем файл, иначе строим заново
+            if not self.load() or count > self.length:
+                self.build(count)
+        index = count // self.interval
+        if index == 0:
+            return compute_otp(self.seed, self.secret, count)
+        offset = (index - 1) * DIGEST_SIZE
+        start = self.checkpoints[offset:offset + DIGEST_SIZE]
+        return skey_hash(start, count - index * self.interval)
+
+def get_otp(seed, secret, count, cache_dir=DEFAULT_CACHE_DIR):
+    """Одноразовый пароль для счетчика count с использованием локального кеша цепочки"""
+    try:
+        return SKeyChainCache(seed, secret, cache_dir).get_otp(count)
+    except OSError:
+        # Кеш недоступен (например, нет прав на запись) - считаем напрямую
+        return compute_otp(seed, secret, count)
@@ -0,0 +1,72 @@
+import os
+import csv
+import json
+import argparse
+from multiprocessing import Pool
+from skey_chain import compute_otp
+
+def init_entry(seed, secret, count):
+    """Запись skey_db для пользователя: seed, счетчик и последний принятый пароль
+
+    Сервер хранит MD5^(count + 1)(seed + secret); клиент при счетчике count
+    присылает MD5^count(seed + secret), и проверка сводится к одному хешу.
+    """
+    return {
+        "seed": seed,
+        "count": count,
+        "last": compute_otp(seed, secret, count + 1),
+    }
+
+def _init_row(row):
+    username, seed, secret, count = row
+    return username, init_entry(seed, secret, int(count))
+
+def initialize_chains(rows, processes=None):
+    """Параллельно вычисляет начальные значения цепочек для многих пользователей
+
+    rows - последовательность (username, seed, secret, count).
+    Возвращает словарь в формате skey_db.
+    """
+    rows = list(rows)
+    processes = processes or os.cpu_count()
+    with Pool(processes) as pool:
+        # Цепочки разной длины, поэтому раздаем задачи небольшими порциями
+        chunksize = max(1, len(rows) // (processes * 8))
+        return dict(pool.imap_unordered(_init_row, rows, chunksize))
+
+def read_rows(path):
+    """Читает пользователей из CSV (username,seed,secret,count) или JSON-списка"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(".json"):
+            return [(r["username"], r["seed"], r["secret"], r["count"]) for r in json.load(f)]
+        return [(r["username"], r["seed"], r["secret"], r["count"]) for r in csv.DictReader(f)]
+
+def save_db(db, path):
+    """Сохраняет skey_db в JSON (последний пароль - в hex)"""
+    data = {name: {"seed": e["seed"], "count": e["count"], "last": e["last"].hex()}
+            for name, e in db.items()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+
+def load_db(path):
+    """Загружает skey_db, сохраненный функцией save_db"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: {"seed": e["seed"], "count": int(e["count"]), "last": bytes.fromhex(e["last"])}
+            for name, e in data.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Инициализация цепочек S/KEY для базы пользователей")
+    parser.add_argument("input", help="CSV или JSON с полями username, seed, secret, count")
+    parser.add_argument("output", help="файл базы S/KEY для сервера (JSON)")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="число процессов (по умолчанию - число ядер)")
+    args = parser.parse_args(argv)
+
+    rows = read_rows(args.input)
+    db = initialize_chains(rows, args.processes)
+    save_db(db, args.output)
+    print(f"[S/KEY] Инициализировано пользователей: {len(db)}, база сохранена в {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import os
+import json
+import shutil
+import string
+import threading
+from contextlib import contextmanager
+from protocol import file_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows: загрузку диапазонами обслуживает один процесс
+    fcntl = None
+
+# Каталог хранилища содержимого внутри каталога сохранения
+OBJECTS_DIR = ".objects"
+
+def safe_join(save_dir, relative_name):
+    """Путь внутри save_dir для имени файла, присланного клиентом
+
+    Разрешены подкаталоги (разделитель "/"), но не абсолютные пути, ".." и
+    служебный каталог хранилища содержимого.
+    """
+    parts = [part for part in relative_name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if (not parts or relative_name.startswith("/") or ".." in parts or ":" in parts[0]
+            or parts[0] == OBJECTS_DIR):
+        raise ValueError(f"Недопустимое имя файла: {relative_name}")
+    return os.path.join(save_dir, *parts)
+
+class ContentStore:
+    """Хранилище файлов по хешу содержимого
+
+    Каждое уникальное содержимое хранится один раз в .objects/<xx>/<хеш>,
+    а имена в каталоге сохранения - жесткие ссылки на эти объекты. Поэтому
+    повторная загрузка того же файла не занимает места, а перезапись имени
+    другим содержимым не уничтожает прежний объект.
+    """
+
+    def __init__(self, save_dir):
+        self.save_dir = save_dir
+        self.objects_dir = os.path.join(save_dir, OBJECTS_DIR)
+
+    def object_path(self, content_hash):
+        # Хеш приходит от клиента и становится частью пути - проверяем формат
+        if len(content_hash) != 64 or not set(content_hash) <= set(string.hexdigits.lower()):
+            raise ValueError(f"Недопустимый хеш содержимого: {content_hash}")
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash)
+
+    def has(self, content_hash, size):
+        """True, если объект с таким хешем и размером уже хранится"""
+        try:
+            return os.path.getsize(self.object_path(content_hash)) == size
+        except (OSError, ValueError):
+            return False
+
+    def add(self, temp_path, content_hash, save_path):
+        """Помещает принятый файл в хранилище и создает для него имя save_path
+
+        content_hash должен быть вычислен сервером по принятым данным. Если
+        такой объект уже есть, временный файл просто удаляется.
+        """
+        object_path = self.object_path(content_hash)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if os.path.exists(object_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, object_path)
+        self.link(content_hash, save_path)
+
+    def link(self, content_hash, save_path):
+        """Создает (или заменяет) имя save_path, указывающее на объект"""
+        object_path = self.object_path(content_hash)
+        try:
+            if os.path.samefile(object_path, save_path):
+                # Имя уже указывает на этот объект; rename поверх той же
+                # жесткой ссылки ничего бы не сделал и оставил временное имя
+                return
+        except OSError:
+            pass
+        temp_link = save_path + ".link"
+        try:
+            os.link(object_path, temp_link)
+        except FileExistsError:
+            os.remove(temp_link)
+            os.link(object_path, temp_link)
+        except OSError:
+            # Файловая система без жестких ссылок - храним копию
+            shutil.copyfile(object_path, temp_link)
+        os.replace(temp_link, save_path)
+
+# Суффиксы незавершенной загрузки и ее служебной записи
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+class PartialUpload:
+    """Незавершенная загрузка файла в каталоге сохранения
+
+    Данные пишутся в <имя>.part, рядом хранится <имя>.part.json с
+    ожидаемым размером и владельцем. Смещение для продолжения - это
+    фактический размер .part, поэтому служебную запись не нужно
+    обновлять во время приема.
+    """
+
+    def __init__(self, save_dir, filename, filesize, owner):
+        self.save_path = safe_join(save_dir, filename)
+        self.part_path = self.save_path + PART_SUFFIX
+        self.state_path = self.save_path + STATE_SUFFIX
+        self.filesize = filesize
+        self.owner = owner
+        self.offset = 0
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def resume_offset(self):
+        """Смещение, с которого можно продолжить прием (0, если продолжать нечего)"""
+        state = self._load_state()
+        if (state is None or state.get("filesize") != self.filesize
+                or state.get("owner") != self.owner or not os.path.exists(self.part_path)):
+            return 0
+        return min(os.path.getsize(self.part_path), self.filesize)
+
+    def open(self):
+        """Открывает .part для записи с позиции продолжения и возвращает файл"""
+        self.offset = self.resume_offset()
+        if self.offset == 0:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump({"filesize": self.filesize, "owner": self.owner}, f)
+            f = open(self.part_path, 'wb')
+        else:
+            f = open(self.part_path, 'r+b')
+            f.seek(self.offset)
+            # Отбрасываем возможный хвост сверх ожидаемого размера
+            f.truncate()
+        return f
+
+    def finish(self, received, store=None, content_hash=None):
+        """Завершает загрузку, если получены все байты; возвращает True при успехе
+
+        received - число байт, принятых в текущем соединении.
+        При неполном приеме .part и служебная запись остаются для продолжения.
+        Если передано хранилище store, файл помещается в него. content_hash -
+        уже проверенный хеш всего файла; без него файл хешируется заново.
+        """
+        if self.offset + received < self.filesize:
+            return False
+        if store is None:
+            os.replace(self.part_path, self.save_path)
+        else:
+            store.add(self.part_path, content_hash or file_digest(self.part_path), self.save_path)
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def discard(self):
+        """Удаляет принятые данные, если они повреждены: продолжать такую загрузку нельзя"""
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+# Суффикс файла, собираемого из диапазонов нескольких соединений
+RANGED_SUFFIX = ".mpart"
+# Файл блокировки учета диапазонов (в служебном каталоге OBJECTS_DIR)
+RANGED_LOCK = "ranged.lock"
+
+class RangedUpload:
+    """Файл, принимаемый диапазонами по нескольким соединениям одновременно
+
+    Файл <имя>.mpart заранее выделяется на полный размер, каждый диапазон
+    пишется на свое смещение через os.pwrite, а после прихода последнего
+    байта файл переименовывается в итоговое имя. Принятые диапазоны
+    учитываются в <имя>.mpart.json под блокировкой файла в служебном
+    каталоге, поэтому соединения одной загрузки (имя, размер, владелец)
+    могут обслуживать разные процессы сервера.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, save_dir, filename, filesize, owner):
+        self.save_path = safe_join(save_dir, filename)
+        self.part_path = self.save_path + RANGED_SUFFIX
+        self.state_path = self.part_path + ".json"
+        self.lock_path = os.path.join(save_dir, OBJECTS_DIR, RANGED_LOCK)
+        self.filesize = filesize
+        self.owner = owner
+        self.failed = False
+
+    @classmethod
+    def acquire(cls, save_dir, filename, filesize, owner):
+        """Возвращает объект загрузки, создавая и выделяя файл при первом обращении"""
+        upload = cls(save_dir, filename, filesize, owner)
+        with upload._locked():
+            if upload._load_state() is None or not os.path.exists(upload.part_path):
+                upload._preallocate()
+                upload._save_state([])
+        return upload
+
+    @contextmanager
+    def _locked(self):
+        # fcntl-блокировка разделяет процессы, обычная - потоки на системах без fcntl
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            with open(self.lock_path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def _load_state(self):
+        """Принятые диапазоны [[смещение, длина], ...] или None, если загрузки нет"""
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("filesize") != self.filesize or state.get("owner") != self.owner:
+            return None
+        return state["ranges"]
+
+    def _save_state(self, ranges):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"filesize": self.filesize, "owner": self.owner, "ranges": ranges}, f)
+        os.replace(temp_path, self.state_path)
+
+    def _preallocate(self):
+        fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if self.filesize and hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, self.filesize)
+            else:
+                os.ftruncate(fd, self.filesize)
+        finally:
+            os.close(fd)
+
+    def open_range(self, offset):
+        """Открывает собственный дескриптор файла для записи диапазона с offset"""
+        return RangeWriter(os.open(self.part_path, os.O_WRONLY), offset)
+
+    def complete_range(self, offset, length):
+        """Учитывает полностью принятый диапазон; возвращает True, если файл собран
+
+        Файл собран, когда принятые диапазоны вместе покрывают [0, filesize).
+        Диапазон, частично перекрывающий уже принятые, означает, что клиент
+        разбил файл иначе (повтор с другим числом потоков): перекрытые
+        диапазоны прежнего разбиения перестают учитываться, их байты
+        передаются заново в новом разбиении.
+        """
+        end = offset + length
+        with self._locked():
+            ranges = self._load_state()
+            if ranges is None:
+                # Загрузку отменило другое соединение
+                self.failed = True
+                return False
+            ranges = [r for r in ranges if r[0] + r[1] <= offset or r[0] >= end]
+            ranges.append([offset, length])
+            if not _covers(ranges, self.filesize):
+                self._save_state(ranges)
+                return False
+            os.replace(self.part_path, self.save_path)
+            os.remove(self.state_path)
+        return True
+
+    def fail(self):
+        """Отменяет сборку файла из-за поврежденного диапазона"""
+        with self._locked():
+            self.failed = True
+            for path in (self.part_path, self.state_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def _covers(ranges, size):
+    """True, если объединение диапазонов [смещение, длина] покрывает [0, size)"""
+    covered = 0
+    for offset, length in sorted(ranges):
+        if offset > covered:
+            return False
+        covered = max(covered, offset + length)
+    return covered >= size
+
+def pwrite_all(fd, data, offset):
+    """Записывает data в файл на смещение offset (os.pwrite либо lseek + write)"""
+    while data:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+        data = data[written:]
+        offset += written
+
+class RangeWriter:
+    """Файлоподобный объект: последовательные write() ложатся на смещения через pwrite"""
+
+    def __init__(self, fd, offset):
+        self.fd = fd
+        self.offset = offset
+
+    def write(self, data):
+        pwrite_all(self.fd, data, self.offset)
+        self.offset += len(data)
+        return len(data)
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,90 @@
+import threading
+import unittest
+from asynclog import AsyncLog, WARNING
+
+class _BlockingSink:
+    """Приемник, который задерживает первую пачку до release()"""
+
+    def __init__(self):
+        self.records = []
+        self.entered = threading.Event()
+        self._released = threading.Event()
+
+    def __call__(self, records):
+        self.entered.set()
+        self._released.wait(5)
+        self.records.extend(records)
+
+    def release(self):
+        self._released.set()
+
+    def messages(self):
+        return [record.message for record in self.records]
+
+class AsyncLogTest(unittest.TestCase):
+
+    def test_messages_in_order(self):
+        sink = _BlockingSink()
+        sink.release()
+        log = AsyncLog(sink)
+        for i in range(100):
+            log.log(str(i))
+        log.close()
+        self.assertEqual(sink.messages(), [str(i) for i in range(100)])
+
+    def test_level_filter(self):
+        sink = _BlockingSink()
+        sink.release()
+        log = AsyncLog(sink, level=WARNING)
+        log.log("info")
+        log.progress("key", "progress")
+        log.log("warning", WARNING)
+        log.close()
+        self.assertEqual(sink.messages(), ["warning"])
+
+    def test_progress_coalesced(self):
+        sink = _BlockingSink()
+        log = AsyncLog(sink)
+        log.log("start")
+        sink.entered.wait(5)
+        for percent in range(0, 101, 10):
+            log.progress("upload", f"{percent}%")
+        log.progress("other", "other")
+        sink.release()
+        log.close()
+        self.assertEqual(sink.messages(), ["start", "100%", "other"])
+
+    def test_dropped_counted_and_reported(self):
+        sink = _BlockingSink()
+        log = AsyncLog(sink, maxsize=1)
+        log.log("first")
+        sink.entered.wait(5)
+        log.log("queued")
+        log.log("lost 1")
+        log.log("lost 2")
+        self.assertEqual(log.dropped, 2)
+        sink.release()
+        log.close()
+        messages = sink.messages()
+        self.assertEqual(messages[:2], ["first", "queued"])
+        self.assertNotIn("lost 1", messages)
+        self.assertTrue(messages[-1].endswith("пропущено сообщений: 2"))
+        self.assertEqual(sink.records[-1].level, WARNING)
+
+    def test_dropped_progress_not_pending(self):
+        sink = _BlockingSink()
+        log = AsyncLog(sink, maxsize=1)
+        log.log("first")
+        sink.entered.wait(5)
+        log.log("queued")
+        log.progress("upload", "lost")
+        self.assertEqual(log.dropped, 1)
+        # Иначе следующие обновления этого ключа считались бы уже
+        # поставленными в очередь и не выводились бы никогда
+        self.assertNotIn("upload", log._pending)
+        sink.release()
+        log.close()
+        self.assertNotIn("lost", sink.messages())
+
+if __name__ == "__main__":
+    unittest.main()
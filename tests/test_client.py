@@ -0,0 +1,53 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+from client import parse_args
+
+class ParseArgsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "file.bin")
+        open(self.path, "wb").close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def parse(self, **env):
+        env = dict({"AUTH_USER": "alice", "AUTH_PASSWORD": "pw"}, **env)
+        with mock.patch.dict(os.environ, env, clear=True):
+            return parse_args([self.path])
+
+    def assert_rejected(self, **env):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr), self.assertRaises(SystemExit) as raised:
+            self.parse(**env)
+        self.assertEqual(raised.exception.code, 2)
+        return stderr.getvalue()
+
+    def test_environment_defaults(self):
+        args = self.parse(AUTH_PORT="9000", AUTH_PROTOCOL="chap")
+        self.assertEqual((args.port, args.protocol, args.user), (9000, 2, "alice"))
+        args = self.parse()
+        self.assertEqual((args.port, args.protocol), (8080, 1))
+
+    def test_invalid_protocol_in_environment(self):
+        self.assertIn("AUTH_PROTOCOL", self.assert_rejected(AUTH_PROTOCOL="PAP"))
+
+    def test_invalid_port_in_environment(self):
+        for port in ("abc", "", "0", "70000"):
+            with self.subTest(port=port):
+                self.assertIn("AUTH_PORT", self.assert_rejected(AUTH_PORT=port))
+
+    def test_command_line_overrides_environment(self):
+        with mock.patch.dict(os.environ, {"AUTH_PASSWORD": "pw", "AUTH_PORT": "abc",
+                                          "AUTH_PROTOCOL": "PAP"}, clear=True):
+            args = parse_args(["--user", "bob", "--port", "9001", "--protocol", "skey",
+                               "--seed", "s", self.path])
+        self.assertEqual((args.port, args.protocol), (9001, 3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import io
+import os
+import unittest
+from compression import CODECS, INFLATE_CHUNK, Inflater
+from protocol import MAX_PAYLOAD, ProtocolError, new_digest
+
+class _CountingFile:
+    """Приемник, запоминающий только наибольшую записанную порцию"""
+
+    def __init__(self):
+        self.largest = 0
+
+    def write(self, data):
+        self.largest = max(self.largest, len(data))
+
+def _compress(codec, data):
+    compressor = codec.compressor()
+    return compressor.compress(data) + compressor.flush()
+
+class InflaterTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = os.urandom(100000) + b"text " * 200000
+        for codec in CODECS.values():
+            with self.subTest(codec=codec.name):
+                compressed = _compress(codec, data)
+                out = io.BytesIO()
+                inflater = Inflater(codec, out, len(data), new_digest())
+                for i in range(0, len(compressed), MAX_PAYLOAD):
+                    inflater.feed(compressed[i:i + MAX_PAYLOAD])
+                self.assertEqual(out.getvalue(), data)
+                self.assertEqual(inflater.received, len(data))
+
+    def test_output_limited_to_declared_size(self):
+        bomb_size = 64 * 1024 * 1024
+        for codec in CODECS.values():
+            with self.subTest(codec=codec.name):
+                compressed = _compress(codec, bytes(bomb_size))
+                sink = _CountingFile()
+                inflater = Inflater(codec, sink, bomb_size - 1, None)
+                with self.assertRaises(ProtocolError):
+                    for i in range(0, len(compressed), MAX_PAYLOAD):
+                        inflater.feed(compressed[i:i + MAX_PAYLOAD])
+                # Распаковка идет порциями, а не всем кадром сразу
+                self.assertLessEqual(sink.largest, INFLATE_CHUNK)
+                self.assertLess(inflater.received, bomb_size)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import time
+import socket
+import threading
+import unittest
+from connpool import (ConnectionPool, AddressLimiter, REJECT_BUSY, REJECT_PER_IP, BUSY_REPLY)
+from protocol import MSG_ERROR, BUSY_PREFIX, recv_message
+
+class AddressLimiterTest(unittest.TestCase):
+
+    def test_limit_per_address(self):
+        limiter = AddressLimiter(2)
+        self.assertTrue(limiter.acquire("10.0.0.1"))
+        self.assertTrue(limiter.acquire("10.0.0.1"))
+        self.assertFalse(limiter.acquire("10.0.0.1"))
+        self.assertTrue(limiter.acquire("10.0.0.2"))
+        limiter.release("10.0.0.1")
+        self.assertTrue(limiter.acquire("10.0.0.1"))
+
+    def test_no_limit(self):
+        limiter = AddressLimiter(0)
+        self.assertTrue(all(limiter.acquire("10.0.0.1") for _ in range(1000)))
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.clients = []
+
+    def tearDown(self):
+        self.release.set()
+        # Серверные концы закрывают пул и поток дочитывания отклоненных соединений
+        for sock in self.clients:
+            sock.close()
+
+    def _handler(self, client_socket, addr):
+        self.started.release()
+        self.release.wait(5)
+        client_socket.close()
+
+    def _submit(self, pool, ip):
+        server_side, client_side = socket.socketpair()
+        self.clients.append(client_side)
+        return pool.submit(server_side, (ip, 1)), client_side
+
+    def _assert_busy(self, client_side, reason):
+        client_side.settimeout(5)
+        msg_type, payload = recv_message(client_side)
+        self.assertEqual(msg_type, MSG_ERROR)
+        self.assertTrue(payload.decode().startswith(BUSY_PREFIX))
+        self.assertEqual(payload.decode(), BUSY_REPLY[reason])
+
+    def test_queue_overflow_is_rejected(self):
+        pool = ConnectionPool(self._handler, workers=1, queue_size=1, max_per_ip=0)
+        self.addCleanup(pool.close)
+        self.assertIsNone(self._submit(pool, "10.0.0.1")[0])
+        self.assertTrue(self.started.acquire(timeout=5))
+        self.assertIsNone(self._submit(pool, "10.0.0.2")[0])
+        reason, client_side = self._submit(pool, "10.0.0.3")
+        self.assertEqual(reason, REJECT_BUSY)
+        self._assert_busy(client_side, REJECT_BUSY)
+        self.assertEqual(pool.pending(), 1)
+
+    def test_idle_workers_count_as_capacity(self):
+        pool = ConnectionPool(self._handler, workers=2, queue_size=0, max_per_ip=0)
+        self.addCleanup(pool.close)
+        for ip in ("10.0.0.1", "10.0.0.2"):
+            self.assertIsNone(self._submit(pool, ip)[0])
+            self.assertTrue(self.started.acquire(timeout=5))
+        self.assertEqual(self._submit(pool, "10.0.0.3")[0], REJECT_BUSY)
+
+    def test_per_address_limit(self):
+        pool = ConnectionPool(self._handler, workers=4, queue_size=4, max_per_ip=2)
+        self.addCleanup(pool.close)
+        for _ in range(2):
+            self.assertIsNone(self._submit(pool, "10.0.0.1")[0])
+        reason, client_side = self._submit(pool, "10.0.0.1")
+        self.assertEqual(reason, REJECT_PER_IP)
+        self._assert_busy(client_side, REJECT_PER_IP)
+        self.assertIsNone(self._submit(pool, "10.0.0.2")[0])
+
+    def test_slot_is_released_after_session(self):
+        pool = ConnectionPool(self._handler, workers=1, queue_size=0, max_per_ip=1)
+        self.addCleanup(pool.close)
+        self.assertIsNone(self._submit(pool, "10.0.0.1")[0])
+        self.assertTrue(self.started.acquire(timeout=5))
+        self.assertEqual(self._submit(pool, "10.0.0.1")[0], REJECT_PER_IP)
+        self.release.set()
+        deadline = time.monotonic() + 5
+        # Поток пула освобождает место после того, как обработчик вернулся
+        while "10.0.0.1" in pool.limiter._counts and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(self._submit(pool, "10.0.0.1")[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from delta import COPY_ENTRY, DeltaWriter, compute_delta, read_signatures, signature_frames
+from protocol import HEADER, MSG_COPY, MSG_DATA, ProtocolError, new_digest
+
+def _payloads(frames):
+    """Полезные нагрузки подряд идущих кадров"""
+    offset = 0
+    while offset < len(frames):
+        _, _, length = HEADER.unpack_from(frames, offset)
+        offset += HEADER.size
+        yield frames[offset:offset + length]
+        offset += length
+
+class DeltaTest(unittest.TestCase):
+
+    block_size = 2048
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.rng = random.Random(1)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _file(self, name, data):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _rebuild(self, old, new):
+        """Собирает new из old по дельте; возвращает (результат, байт передано как есть)"""
+        basis_path = self._file("old", old)
+        new_path = self._file("new", new)
+        payloads = _payloads(signature_frames(basis_path, self.block_size))
+        block_size, table = read_signatures(next(payloads), lambda: next(payloads))
+        out = io.BytesIO()
+        with open(basis_path, 'rb') as basis:
+            writer = DeltaWriter(basis, out, block_size, len(new), new_digest())
+            for op in compute_delta(new_path, block_size, table):
+                if op[0] == "copy":
+                    writer.apply(MSG_COPY, COPY_ENTRY.pack(op[1], op[2]))
+                else:
+                    writer.apply(MSG_DATA, new[op[1]:op[2]])
+            self.assertFalse(writer.apply(MSG_DATA, b""))
+        expected = new_digest()
+        expected.update(out.getvalue())
+        self.assertEqual(writer.digest.hexdigest(), expected.hexdigest())
+        self.assertEqual(writer.written, len(new))
+        return out.getvalue(), writer.literal
+
+    def test_identical_file_sends_only_tail(self):
+        old = self.rng.randbytes(100 * self.block_size + 100)
+        result, literal = self._rebuild(old, old)
+        self.assertEqual(result, old)
+        self.assertEqual(literal, 100)
+
+    def test_insertion_shifts_blocks(self):
+        old = self.rng.randbytes(50 * self.block_size)
+        new = old[:10000] + b"inserted" + old[10000:]
+        result, literal = self._rebuild(old, new)
+        self.assertEqual(result, new)
+        self.assertLess(literal, 2 * self.block_size)
+
+    def test_unrelated_file(self):
+        old = self.rng.randbytes(20 * self.block_size)
+        new = self.rng.randbytes(30 * self.block_size + 7)
+        result, literal = self._rebuild(old, new)
+        self.assertEqual(result, new)
+        self.assertEqual(literal, len(new))
+
+    def test_copy_outside_basis_is_rejected(self):
+        basis = io.BytesIO(bytes(4 * self.block_size))
+        writer = DeltaWriter(basis, io.BytesIO(), self.block_size, 10 * self.block_size)
+        with self.assertRaises(ProtocolError):
+            writer.apply(MSG_COPY, COPY_ENTRY.pack(3, 2))
+
+    def test_output_beyond_file_size_is_rejected(self):
+        basis = io.BytesIO(bytes(4 * self.block_size))
+        out = io.BytesIO()
+        writer = DeltaWriter(basis, out, self.block_size, 5 * self.block_size)
+        writer.apply(MSG_COPY, COPY_ENTRY.pack(0, 4))
+        # Повтор тех же блоков превысил бы заявленный размер файла
+        with self.assertRaises(ProtocolError):
+            writer.apply(MSG_COPY, COPY_ENTRY.pack(0, 4))
+        with self.assertRaises(ProtocolError):
+            writer.apply(MSG_DATA, bytes(self.block_size + 1))
+        writer.apply(MSG_DATA, bytes(self.block_size))
+        self.assertEqual(len(out.getvalue()), 5 * self.block_size)
+        self.assertEqual(writer.written, 5 * self.block_size)
+
+if __name__ == "__main__":
+    unittest.main()
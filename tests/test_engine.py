@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+import accounts
+from asynclog import INFO
+from credstore import MemoryStore
+from passhash import VerifyPool
+from skey_chain import compute_otp
+from skey_init import init_entry
+from engine import ServerEvents, ServerSession, RecvExact, Send, Offload, STATE_DONE
+from protocol import (HEADER, MSG_HELLO, MSG_USERNAME, MSG_PASSWORD, MSG_COUNTER, MSG_OTP,
+                      MSG_AUTH_RESULT, pack_message)
+
+def run_session(session, incoming):
+    """Выполняет сессию на заранее записанных входящих байтах; возвращает отправленные кадры
+
+    Сессия завершается, когда входящие данные кончаются.
+    """
+    view = memoryview(incoming)
+    frames = []
+    steps = session.run()
+    value, error = None, None
+    while True:
+        try:
+            request = steps.throw(error) if error is not None else steps.send(value)
+        except (StopIteration, ConnectionError):
+            return frames
+        value, error = None, None
+        if isinstance(request, RecvExact):
+            if len(view) < request.size:
+                error = ConnectionError("Соединение закрыто собеседником")
+            else:
+                value, view = bytes(view[:request.size]), view[request.size:]
+        elif isinstance(request, Send):
+            data = request.data
+            while data:
+                _, msg_type, length = HEADER.unpack_from(data)
+                frames.append((msg_type, data[HEADER.size:HEADER.size + length]))
+                data = data[HEADER.size + length:]
+        elif isinstance(request, Offload):
+            value = request.func(*request.args)
+        else:
+            raise AssertionError(f"Неожиданный запрос {request}")
+
+class _RecordingEvents(ServerEvents):
+
+    def __init__(self):
+        self.levels = []
+
+    def log(self, message, level=INFO):
+        self.levels.append(level)
+
+class AuthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        store = MemoryStore({"alice": "pw"}, {"alice": init_entry("seed", "secret", 1)})
+        self.previous_backend = accounts.set_backend(store)
+        self.previous_verifier = accounts.set_verifier(VerifyPool(0))
+
+    def tearDown(self):
+        accounts.set_backend(self.previous_backend)
+        accounts.set_verifier(self.previous_verifier)
+        self.dir.cleanup()
+
+    def _session(self, *frames, tail=b""):
+        self.events = _RecordingEvents()
+        self.session = ServerSession(("127.0.0.1", 1), self.dir.name, self.events)
+        return run_session(self.session, b"".join(pack_message(t, p) for t, p in frames) + tail)
+
+    def _skey(self, count):
+        return self._session((MSG_HELLO, "3"), (MSG_USERNAME, "alice"),
+                             (MSG_OTP, compute_otp("seed", "secret", count)))
+
+    def test_pap(self):
+        sent = self._session((MSG_HELLO, "1"), (MSG_USERNAME, "alice"), (MSG_PASSWORD, "pw"))
+        self.assertEqual(sent[0], (MSG_AUTH_RESULT, b"AUTH_SUCCESS"))
+        sent = self._session((MSG_HELLO, "1"), (MSG_USERNAME, "alice"), (MSG_PASSWORD, "bad"))
+        self.assertEqual(sent, [(MSG_AUTH_RESULT, b"AUTH_FAILED")])
+
+    def test_close_after_login_ends_session(self):
+        pap = ((MSG_HELLO, "1"), (MSG_USERNAME, "alice"), (MSG_PASSWORD, "pw"))
+        sent = self._session(*pap)
+        self.assertEqual(sent, [(MSG_AUTH_RESULT, b"AUTH_SUCCESS")])
+        self.assertEqual(self.session.state, STATE_DONE)
+        self.assertLessEqual(max(self.events.levels), INFO)
+        # Обрыв посреди заголовка запроса - ошибка, а не завершение сессии
+        self._session(*pap, tail=b"\x02")
+        self.assertNotEqual(self.session.state, STATE_DONE)
+
+    def test_skey_exhausted_chain(self):
+        sent = self._skey(1)
+        self.assertEqual(sent[:2], [(MSG_COUNTER, b"1"), (MSG_AUTH_RESULT, b"AUTH_SUCCESS")])
+        # При счетчике 0 сервер отказывает, не запрашивая пароль
+        sent = self._skey(0)
+        self.assertEqual(sent, [(MSG_AUTH_RESULT, b"AUTH_FAILED")])
+        self.assertEqual(accounts.skey_get_count("alice"), 0)
+
+if __name__ == "__main__":
+    unittest.main()
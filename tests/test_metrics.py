@@ -0,0 +1,65 @@
+import unittest
+from metrics import Counter, Histogram, Registry
+
+class HistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render_cumulative_buckets(self):
+        histogram = Histogram("duration_seconds", "Время", ["protocol"], buckets=(5, 1),
+                              registry=self.registry)
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, protocol="pap")
+        histogram.observe(2, protocol="chap")
+        self.assertEqual(histogram.count(protocol="pap"), 4)
+        self.assertEqual(histogram.count(protocol="skey"), 0)
+        self.assertEqual(self.registry.render(), "\n".join([
+            "# HELP duration_seconds Время",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{protocol="chap",le="1"} 0',
+            'duration_seconds_bucket{protocol="chap",le="5"} 1',
+            'duration_seconds_bucket{protocol="chap",le="+Inf"} 1',
+            'duration_seconds_sum{protocol="chap"} 2',
+            'duration_seconds_count{protocol="chap"} 1',
+            'duration_seconds_bucket{protocol="pap",le="1"} 2',
+            'duration_seconds_bucket{protocol="pap",le="5"} 3',
+            'duration_seconds_bucket{protocol="pap",le="+Inf"} 4',
+            'duration_seconds_sum{protocol="pap"} 14.5',
+            'duration_seconds_count{protocol="pap"} 4',
+        ]) + "\n")
+
+    def test_render_without_labels(self):
+        histogram = Histogram("throughput", "Скорость", buckets=(0.25,), registry=self.registry)
+        histogram.observe(0.1)
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'throughput_bucket{le="0.25"} 1',
+            'throughput_bucket{le="+Inf"} 1',
+            "throughput_sum 0.1",
+            "throughput_count 1",
+        ])
+
+    def test_no_observations(self):
+        Histogram("empty", "Пусто", registry=self.registry)
+        self.assertEqual(self.registry.render(), "# HELP empty Пусто\n# TYPE empty histogram\n")
+
+    def test_wrong_labels(self):
+        histogram = Histogram("duration_seconds", "Время", ["protocol"], registry=self.registry)
+        with self.assertRaises(ValueError):
+            histogram.observe(1)
+        with self.assertRaises(ValueError):
+            histogram.observe(1, protocol="pap", result="ok")
+
+class CounterTest(unittest.TestCase):
+
+    def test_render(self):
+        registry = Registry()
+        counter = Counter("results_total", "Результаты", ["result"], registry=registry)
+        counter.inc(result="ok")
+        counter.inc(2, result="fail")
+        self.assertEqual(counter.value(result="ok"), 1)
+        self.assertEqual(registry.render().splitlines()[2:],
+                         ['results_total{result="fail"} 2', 'results_total{result="ok"} 1'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from passhash import PBKDF2, SCRYPT, VerifyPool, hash_password, hash_rows, scheme_of, verify_password
+
+# Низкая стоимость, чтобы тесты не тратили время на сам хеш
+FAST = {"n": 2 ** 4, "iterations": 1000}
+
+class PasswordHashTest(unittest.TestCase):
+
+    def test_scrypt(self):
+        stored = hash_password("secret", SCRYPT, **FAST)
+        self.assertEqual(scheme_of(stored), SCRYPT)
+        self.assertEqual(stored.split("$")[1:4], ["16", "8", "1"])
+        self.assertTrue(verify_password(stored, "secret"))
+        self.assertFalse(verify_password(stored, "Secret"))
+
+    def test_pbkdf2(self):
+        stored = hash_password("secret", PBKDF2, **FAST)
+        self.assertEqual(scheme_of(stored), PBKDF2)
+        self.assertEqual(stored.split("$")[1], "1000")
+        self.assertTrue(verify_password(stored, "secret"))
+        self.assertFalse(verify_password(stored, ""))
+
+    def test_salted(self):
+        self.assertNotEqual(hash_password("secret", **FAST), hash_password("secret", **FAST))
+
+    def test_unicode_password(self):
+        stored = hash_password("пароль", **FAST)
+        self.assertTrue(verify_password(stored, "пароль"))
+        self.assertFalse(verify_password(stored, "парол"))
+
+    def test_plaintext(self):
+        self.assertIsNone(scheme_of("secret"))
+        self.assertIsNone(scheme_of("md5$abc"))
+        self.assertTrue(verify_password("secret", "secret"))
+        self.assertFalse(verify_password("secret", "secre"))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            hash_password("secret", "md5")
+
+    def test_hash_rows(self):
+        rows = [("alice", "a"), ("bob", "b")]
+        hashed = hash_rows(rows, 2, scheme=PBKDF2, **FAST)
+        self.assertEqual([username for username, _ in hashed], ["alice", "bob"])
+        self.assertTrue(verify_password(hashed[1][1], "b"))
+
+class VerifyPoolTest(unittest.TestCase):
+
+    def test_inline(self):
+        pool = VerifyPool(0)
+        stored = hash_password("secret", **FAST)
+        self.assertTrue(pool.verify(stored, "secret"))
+        self.assertFalse(pool.verify(stored, "wrong"))
+        self.assertTrue(pool.verify("plain", "plain"))
+        pool.close()
+
+    def test_processes(self):
+        pool = VerifyPool(1)
+        try:
+            stored = hash_password("secret", PBKDF2, **FAST)
+            self.assertTrue(pool.verify(stored, "secret"))
+            self.assertFalse(pool.verify(stored, "wrong"))
+        finally:
+            pool.close()
+
+if __name__ == "__main__":
+    unittest.main()
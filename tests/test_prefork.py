@@ -0,0 +1,64 @@
+import time
+import unittest
+from multiprocessing.connection import wait
+import prefork
+from prefork import Supervisor
+
+def _exit_with(index, code):
+    raise SystemExit(code)
+
+def _sleep(index, seconds):
+    time.sleep(seconds)
+
+class SupervisorTest(unittest.TestCase):
+
+    def supervisor(self, target, args):
+        self.messages = []
+        supervisor = Supervisor(target, 1, args, log=self.messages.append)
+        self.addCleanup(supervisor.stop)
+        return supervisor
+
+    def wait_exit(self, supervisor, index=0):
+        process = supervisor.processes[index]
+        self.assertEqual(wait([process.sentinel], 30), [process.sentinel])
+        supervisor._on_exit(index)
+        return process
+
+    def test_backoff_for_crashing_worker(self):
+        supervisor = self.supervisor(_exit_with, (3,))
+        delays = []
+        for _ in range(3):
+            supervisor._start(0)
+            process = self.wait_exit(supervisor)
+            self.assertEqual(process.exitcode, 3)
+            delays.append(supervisor.restart_at[0] - time.monotonic())
+        self.assertEqual(supervisor.failures[0], 3)
+        self.assertEqual([round(delay) for delay in delays], [1, 2, 4])
+        self.assertIn("завершился с кодом 3", self.messages[-1])
+
+    def test_backoff_limited(self):
+        supervisor = self.supervisor(_exit_with, (1,))
+        supervisor.failures[0] = 20
+        supervisor._start(0)
+        self.wait_exit(supervisor)
+        self.assertLessEqual(supervisor.restart_at[0] - time.monotonic(), prefork.MAX_RESTART_DELAY)
+
+    def test_long_running_worker_restarted_at_once(self):
+        supervisor = self.supervisor(_exit_with, (0,))
+        supervisor.failures[0] = 5
+        supervisor._start(0)
+        supervisor.started[0] -= prefork.MIN_UPTIME
+        self.wait_exit(supervisor)
+        self.assertEqual(supervisor.failures[0], 0)
+        self.assertLessEqual(supervisor.restart_at[0], time.monotonic())
+
+    def test_stop_terminates_workers(self):
+        supervisor = self.supervisor(_sleep, (60,))
+        supervisor._start(0)
+        process = supervisor.processes[0]
+        supervisor.stop(timeout=10)
+        self.assertFalse(process.is_alive())
+        self.assertEqual(supervisor.processes, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import stat
+import tempfile
+import unittest
+from skey_chain import SKeyChainCache, compute_otp, get_otp
+from skey_init import init_entry
+from credstore import MemoryStore, SQLiteStore, CachedStore
+from accounttable import AccountTable, compile_table
+
+class ChainCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.dir.name, "chain")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_matches_direct_computation(self):
+        for count in (1, 2, 9, 10, 11, 99, 100, 101):
+            self.assertEqual(get_otp("seed", "secret", count, self.cache_dir),
+                             compute_otp("seed", "secret", count))
+
+    def test_exhausted_chain(self):
+        with self.assertRaises(ValueError):
+            get_otp("seed", "secret", 0, self.cache_dir)
+
+    def test_cache_is_private(self):
+        cache = SKeyChainCache("seed", "secret", self.cache_dir)
+        cache.build(100)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_dir).st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(os.stat(cache.path).st_mode), 0o600)
+        loaded = SKeyChainCache("seed", "secret", self.cache_dir)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.get_otp(57), compute_otp("seed", "secret", 57))
+
+class StoreContract:
+    """Проверки S/KEY, общие для всех хранилищ учетных записей"""
+
+    def make_store(self, passwords, skey):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = self.make_store([("alice", "pw")], [("alice", init_entry("seed", "secret", 2))])
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_password(self):
+        self.assertEqual(self.store.get_password("alice"), "pw")
+        self.assertIsNone(self.store.get_password("bob"))
+
+    def test_chain_runs_down_to_one(self):
+        self.assertFalse(self.store.skey_consume("alice", 2, compute_otp("seed", "secret", 1)))
+        self.assertTrue(self.store.skey_consume("alice", 2, compute_otp("seed", "secret", 2)))
+        # Тот же пароль второй раз не принимается
+        self.assertFalse(self.store.skey_consume("alice", 2, compute_otp("seed", "secret", 2)))
+        self.assertTrue(self.store.skey_consume("alice", 1, compute_otp("seed", "secret", 1)))
+        self.assertEqual(self.store.skey_get("alice")["count"], 0)
+        # MD5^0 - это seed + secret в открытом виде
+        self.assertFalse(self.store.skey_consume("alice", 0, compute_otp("seed", "secret", 0)))
+        self.assertEqual(self.store.skey_get("alice")["count"], 0)
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.store.skey_get("bob"))
+        self.assertFalse(self.store.skey_consume("bob", 1, b"x" * 16))
+
+class MemoryStoreTest(StoreContract, unittest.TestCase):
+
+    def make_store(self, passwords, skey):
+        return MemoryStore(dict(passwords), dict(skey))
+
+class SQLiteStoreTest(StoreContract, unittest.TestCase):
+
+    def make_store(self, passwords, skey):
+        store = CachedStore(SQLiteStore(os.path.join(self.dir.name, "accounts.db")), capacity=1)
+        store.import_passwords(passwords)
+        store.import_skey(skey)
+        return store
+
+    def test_state_survives_reopen(self):
+        self.assertTrue(self.store.skey_consume("alice", 2, compute_otp("seed", "secret", 2)))
+        self.store.close()
+        self.store = SQLiteStore(os.path.join(self.dir.name, "accounts.db"))
+        self.assertEqual(self.store.skey_get("alice")["count"], 1)
+
+class AccountTableTest(StoreContract, unittest.TestCase):
+
+    def make_store(self, passwords, skey):
+        path = os.path.join(self.dir.name, "accounts.tbl")
+        compile_table(path, passwords, skey)
+        return AccountTable(path)
+
+    def test_unknown_user_cannot_be_added(self):
+        with self.assertRaises(KeyError):
+            self.store.set_password("bob", "pw")
+
+    def test_rejects_other_files(self):
+        path = os.path.join(self.dir.name, "other")
+        with open(path, 'wb') as f:
+            f.write(bytes(64))
+        with self.assertRaises(ValueError):
+            AccountTable(path)
+
+if __name__ == "__main__":
+    unittest.main()
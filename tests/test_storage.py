@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from protocol import file_digest
+from storage import ContentStore, PartialUpload, RangedUpload, _covers
+
+class CoversTest(unittest.TestCase):
+
+    def test_union_of_ranges(self):
+        self.assertTrue(_covers([[0, 5], [5, 5]], 10))
+        self.assertTrue(_covers([[5, 5], [0, 6]], 10))
+        self.assertTrue(_covers([], 0))
+        self.assertFalse(_covers([[0, 4], [5, 5]], 10))
+        self.assertFalse(_covers([[1, 9]], 10))
+        # Сумма длин больше размера, но середина не покрыта
+        self.assertFalse(_covers([[0, 334], [500, 500], [667, 333]], 1000))
+
+class RangedUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.save_dir = self.dir.name
+        self.data = os.urandom(1000)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _send(self, offset, length):
+        upload = RangedUpload.acquire(self.save_dir, "f.bin", len(self.data), "admin")
+        with upload.open_range(offset) as f:
+            f.write(self.data[offset:offset + length])
+        return upload.complete_range(offset, length)
+
+    def _saved(self):
+        with open(os.path.join(self.save_dir, "f.bin"), 'rb') as f:
+            return f.read()
+
+    def test_ranges_in_any_order(self):
+        self.assertFalse(self._send(500, 500))
+        self.assertFalse(self._send(500, 500))
+        self.assertTrue(self._send(0, 500))
+        self.assertEqual(self._saved(), self.data)
+
+    def test_retry_with_different_split(self):
+        # Первая попытка двумя потоками успела передать только вторую половину
+        self.assertFalse(self._send(500, 500))
+        # Повтор тремя потоками: без среднего диапазона файл не собран
+        self.assertFalse(self._send(0, 334))
+        self.assertFalse(self._send(667, 333))
+        self.assertFalse(os.path.exists(os.path.join(self.save_dir, "f.bin")))
+        self.assertTrue(self._send(334, 333))
+        self.assertEqual(self._saved(), self.data)
+
+    def test_fail_cancels_upload(self):
+        self.assertFalse(self._send(0, 500))
+        RangedUpload.acquire(self.save_dir, "f.bin", len(self.data), "admin").fail()
+        upload = RangedUpload(self.save_dir, "f.bin", len(self.data), "admin")
+        self.assertFalse(upload.complete_range(500, 500))
+        self.assertTrue(upload.failed)
+
+class PartialUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.save_dir = self.dir.name
+        self.store = ContentStore(self.save_dir)
+        self.data = os.urandom(3000)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_resume_and_finish(self):
+        upload = PartialUpload(self.save_dir, "f.bin", len(self.data), "admin")
+        with upload.open() as f:
+            f.write(self.data[:1000])
+        self.assertFalse(upload.finish(1000, self.store))
+
+        upload = PartialUpload(self.save_dir, "f.bin", len(self.data), "admin")
+        with upload.open() as f:
+            self.assertEqual(upload.offset, 1000)
+            f.write(self.data[1000:])
+        self.assertTrue(upload.finish(2000, self.store))
+        with open(upload.save_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertTrue(self.store.has(file_digest(upload.save_path), len(self.data)))
+
+    def test_other_owner_starts_over(self):
+        upload = PartialUpload(self.save_dir, "f.bin", len(self.data), "admin")
+        with upload.open() as f:
+            f.write(self.data[:1000])
+        self.assertEqual(PartialUpload(self.save_dir, "f.bin", len(self.data), "user1").resume_offset(), 0)
+
+class ContentStoreTest(unittest.TestCase):
+
+    def test_same_content_is_stored_once(self):
+        with tempfile.TemporaryDirectory() as save_dir:
+            store = ContentStore(save_dir)
+            for name in ("a.bin", "b.bin"):
+                temp_path = os.path.join(save_dir, name + ".part")
+                with open(temp_path, 'wb') as f:
+                    f.write(b"content")
+                content_hash = file_digest(temp_path)
+                store.add(temp_path, content_hash, os.path.join(save_dir, name))
+            self.assertTrue(os.path.samefile(os.path.join(save_dir, "a.bin"), os.path.join(save_dir, "b.bin")))
+            self.assertFalse(os.path.exists(os.path.join(save_dir, "a.bin.link")))
+
+    def test_rejects_malformed_hash(self):
+        store = ContentStore("unused")
+        with self.assertRaises(ValueError):
+            store.object_path("../../etc/passwd")
+
+if __name__ == "__main__":
+    unittest.main()